@@ -0,0 +1,114 @@
+"""
+Cached analytics snapshot for /dashboard and /api/analytics
+
+The merged PRAMS + app analytics are built once and kept together with their
+JSON body and a strong ETag, so requests are answered from memory. A snapshot
+is rebuilt on a background thread once it is older than max_age seconds or
+max_submissions new screenings have been noted, whichever comes first; until
+the rebuild finishes the previous snapshot keeps being served. Only one
+rebuild runs at a time per process (single-flight), however many viewers
+arrive while it is stale.
+
+Each worker process has its own cache and only counts its own submissions, so
+other workers pick up a submission within max_age seconds.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsSnapshot:
+    """One build of the analytics: the data, its JSON body and ETag"""
+
+    def __init__(self, data):
+        self.data = data
+        self.built_at = time.monotonic()
+
+        # Compact with sorted keys, like jsonify outside debug mode
+        self.body = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+
+        # Safe to place inside a <script> element
+        self.inline_json = (self.body.decode('utf-8')
+                            .replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026'))
+
+
+class AnalyticsCache:
+    """Holds the current AnalyticsSnapshot and rebuilds it in the background when stale"""
+
+    def __init__(self, build, max_age=30.0, max_submissions=50):
+        self.build = build
+        self.max_age = max_age
+        self.max_submissions = max_submissions
+        self._build_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._snapshot = None
+        self._submissions = 0
+        self._refreshing = False
+        self._pid = os.getpid()
+        self.builds = 0
+
+    @property
+    def ready(self):
+        """True once a snapshot exists, so current() will not touch the database"""
+        return self._snapshot is not None
+
+    def current(self):
+        """Return the latest snapshot, building the first one on the calling thread"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Concurrent first requests wait for a single build
+            with self._build_lock:
+                if self._snapshot is None:
+                    self._rebuild()
+            return self._snapshot
+
+        if time.monotonic() - snapshot.built_at >= self.max_age:
+            self.refresh_in_background()
+        return snapshot
+
+    def note_submissions(self, count=1):
+        """Count new screenings; rebuild once max_submissions have arrived since the last build"""
+        with self._state_lock:
+            self._submissions += count
+            due = self._submissions >= self.max_submissions
+        if due:
+            self.refresh_in_background()
+
+    def refresh_in_background(self):
+        """Start a rebuild unless one is already running"""
+        with self._state_lock:
+            if self._pid != os.getpid():
+                # Forked while the parent was rebuilding; that thread does not exist here
+                self._pid = os.getpid()
+                self._refreshing = False
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name='analytics-refresh', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            with self._build_lock:
+                self._rebuild()
+        except Exception:
+            logger.exception('Rebuilding the analytics snapshot failed; serving the previous one')
+        finally:
+            with self._state_lock:
+                self._refreshing = False
+
+    def _rebuild(self):
+        # Submissions noted during the build are not in it, so they stay counted
+        with self._state_lock:
+            seen = self._submissions
+        snapshot = AnalyticsSnapshot(self.build())
+        with self._state_lock:
+            self._submissions -= seen
+        self._snapshot = snapshot
+        self.builds += 1
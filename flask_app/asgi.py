@@ -0,0 +1,263 @@
+"""
+ASGI entry point: async handlers for the I/O-bound API routes
+
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+    uvicorn asgi:app --port 5000                      # single process, for trying it out
+
+(pip install uvicorn). Connections are held by the event loop instead of a
+worker thread each. These routes run as async handlers:
+    GET  /api/questions, /api/analytics     answered from memory on the loop
+    POST /api/submit, /api/submit/batch     the Flask views on the offload pool
+    GET/POST /login, /register, GET /logout database calls on the offload pool,
+                                            password hashing awaited on the hashing
+                                            pool without holding a thread
+Every other route runs the Flask app unchanged on the offload pool, so a
+slow export or page render never blocks the loop.
+
+Handlers run inside a Flask request context, so sessions, flash messages,
+templates and before/after_request hooks behave as under WSGI. Blocking calls
+go through offload(), a thread pool of ASGI_OFFLOAD_THREADS threads per
+process. SQLite has no async driver; its calls are short, and the pool keeps
+them off the loop.
+"""
+
+import asyncio
+import contextvars
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, request
+
+import app as views
+from app import create_app, preload_shared_state
+from database import get_user_by_email, insert_user, update_password_hash
+from hashing import HashingOverloaded, needs_rehash
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope and its complete request body"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    if body and 'CONTENT_LENGTH' not in environ:
+        environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+class AsgiApp:
+    """ASGI application serving a Flask app, with async handlers for the hot routes"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self._executor = None
+        self._pid = None
+
+        # (method, path): async handler returning a Flask response value
+        self.handlers = {
+            ('GET', '/api/questions'): self.memory_view,
+            ('GET', '/api/analytics'): self.analytics,
+            ('POST', '/api/submit'): self.offloaded_view,
+            ('POST', '/api/submit/batch'): self.offloaded_view,
+            ('GET', '/login'): self.memory_view,
+            ('POST', '/login'): self.login,
+            ('GET', '/register'): self.memory_view,
+            ('POST', '/register'): self.register,
+            ('GET', '/logout'): self.offloaded_view,
+        }
+
+    # ------------------------------------------------------------------
+    # Offloading
+    # ------------------------------------------------------------------
+
+    def executor(self):
+        # Created per process, after any pre-fork server has forked
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(self.flask_app.config['ASGI_OFFLOAD_THREADS'],
+                                                thread_name_prefix='offload')
+            self._pid = os.getpid()
+        return self._executor
+
+    async def offload(self, fn, *args):
+        """Run a blocking call on the offload pool, in the caller's Flask context"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor(), context.run, fn, *args)
+
+    # ------------------------------------------------------------------
+    # ASGI
+    # ------------------------------------------------------------------
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        environ = build_environ(scope, bytes(body))
+
+        handler = self.handlers.get((scope['method'], scope['path']))
+        if handler is None:
+            await self.call_wsgi(environ, send)
+        else:
+            response = await self.dispatch(environ, handler)
+            await self.send_response(environ, response, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._executor is not None and self._pid == os.getpid():
+                    self._executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def dispatch(self, environ, handler):
+        """Flask's full_dispatch_request with an async view; returns the final response"""
+        app = self.flask_app
+        ctx = app.request_context(environ)
+        ctx.session = await self.offload(app.session_interface.open_session, app, ctx.request)
+        error = None
+        ctx.push()
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await handler()
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            # After-request hooks and the session save
+            return await self.offload(app.finalize_request, rv)
+        except Exception as e:
+            error = e
+            return app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+
+    async def send_response(self, environ, response, send):
+        """Send the response of an async handler and close it (call_on_close callbacks, files)"""
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                   for name, value in response.get_wsgi_headers(environ).items()]
+        chunks = iter(()) if environ['REQUEST_METHOD'] == 'HEAD' else response.iter_encoded()
+        # Buffered bodies are already in memory; only streamed ones may block
+        streamed = not response.is_sequence
+        try:
+            await self.send_chunks(send, response.status_code, headers, chunks, offload=streamed)
+        finally:
+            if streamed:
+                await self.offload(response.close)
+            else:
+                response.close()
+
+    async def send_chunks(self, send, status, headers, chunks, offload=True):
+        """Send the start message, then each chunk as it is produced"""
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        while True:
+            chunk = await self.offload(next, chunks, None) if offload else next(chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def call_wsgi(self, environ, send):
+        """Run the Flask app for one request on the offload pool, streaming its body"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+
+        body = await self.offload(self.flask_app, environ, start_response)
+        try:
+            await self.send_chunks(send, started['status'], started['headers'], iter(body))
+        finally:
+            if hasattr(body, 'close'):
+                await self.offload(body.close)
+
+    # ------------------------------------------------------------------
+    # Handlers
+    # ------------------------------------------------------------------
+
+    async def memory_view(self):
+        """Views that only read in-memory state, called directly on the loop"""
+        return self.flask_app.view_functions[request.endpoint]()
+
+    async def offloaded_view(self):
+        return await self.offload(self.flask_app.view_functions[request.endpoint])
+
+    async def analytics(self):
+        # Only the very first build reads the database
+        if not current_app.extensions['analytics'].ready:
+            return await self.offloaded_view()
+        return await self.memory_view()
+
+    async def login(self):
+        email = request.form.get('email')
+        password = request.form.get('password')
+
+        try:
+            user = await self.verify_password(email, password)
+        except HashingOverloaded:
+            return views.overloaded_response('login.html')
+
+        return await self.offload(views.finish_login, user, email)
+
+    async def verify_password(self, email, password):
+        """database.verify_password, awaiting the hasher instead of blocking on it"""
+        hasher = views.get_hasher()
+        user = await self.offload(get_user_by_email, email)
+        if user and await hasher.check_password_async(user['password_hash'], password):
+            if needs_rehash(user['password_hash']):
+                user['password_hash'] = await hasher.hash_password_async(password)
+                await self.offload(update_password_hash, user['id'], user['password_hash'])
+            return user
+        return None
+
+    async def register(self):
+        invalid = views.check_registration_form(request.form)
+        if invalid:
+            return invalid
+
+        try:
+            password_hash = await views.get_hasher().hash_password_async(request.form['password'])
+        except HashingOverloaded:
+            return views.overloaded_response('register.html')
+
+        user_id = await self.offload(insert_user, request.form['email'], password_hash,
+                                     request.form.get('first_name'), request.form.get('last_name'))
+        return views.finish_registration(user_id)
+
+
+flask_app = create_app()
+preload_shared_state(flask_app)
+app = AsgiApp(flask_app)
@@ -0,0 +1,400 @@
+"""
+Static asset build and serving
+
+build_assets() copies everything under static/ into static/dist/ with the
+content hash in the file name (css/style.css -> css/style.1a2b3c4d5e.css),
+minifying CSS and JS on the way, and writes manifest.json mapping each
+source path to its built name. Text assets also get precompressed .gz and,
+if the brotli package is installed, .br siblings. With Pillow installed,
+raster images get resized WebP and AVIF variants for srcset.
+
+    flask --app app build-assets
+
+Templates call asset_url('css/style.css'), which returns the hashed URL from
+the manifest, or the plain /static URL when nothing has been built (so the
+development server works without a build step). /assets/<file> serves built
+files with "Cache-Control: public, max-age=31536000, immutable" and the
+precompressed sibling the client accepts; a changed file gets a new name, so
+browsers never need to revalidate.
+
+The files of the previous build are kept, so pages rendered by workers that
+have not picked up the new manifest yet still load. Older ones are removed.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import abort, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image, features
+except ImportError:  # image variants are optional
+    Image = None
+
+MANIFEST_NAME = 'manifest.json'
+
+# Precompressed (.css and .js are also minified)
+TEXT_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt'}
+RASTER_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+
+# Responsive image variants: widths (the hero image is shown at up to 250 CSS pixels)
+# and formats with their save options, newest first
+IMAGE_WIDTHS = (250, 500, 750)
+IMAGE_FORMATS = {'avif': {'quality': 60}, 'webp': {'quality': 80, 'method': 6}}
+
+HASH_LENGTH = 10
+
+ENCODING_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+# ============================================================================
+# MINIFICATION
+# ============================================================================
+
+def _string_end(text, start):
+    """Index just past the quoted string (or template literal) starting at start"""
+    quote = text[start]
+    i = start + 1
+    while i < len(text):
+        if text[i] == '\\':
+            i += 2
+            continue
+        if text[i] == quote:
+            return i + 1
+        i += 1
+    return len(text)
+
+
+def minify_css(text):
+    """Drop comments and collapse whitespace; strings are left alone"""
+    out = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char in '"\'':
+            end = _string_end(text, i)
+            out.append(text[i:end])
+            i = end
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = len(text) if end < 0 else end + 2
+        elif char.isspace():
+            while i < len(text) and text[i].isspace():
+                i += 1
+            if out and out[-1] != ' ':
+                out.append(' ')
+        else:
+            out.append(char)
+            i += 1
+
+    css = ''.join(out)
+    # Spaces around these never matter; before ":" they do (descendant pseudo-class selectors)
+    css = re.sub(r' ?([{};,>]) ?', r'\1', css).replace(': ', ':')
+    return css.replace(';}', '}').strip() + '\n'
+
+
+# A "/" after one of these (or at the start) begins a regular expression, not a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void', 'throw')
+
+# Whitespace between two of these characters is dropped
+_JS_PUNCTUATION = set('{}()[];,:=<>?!&|*%^~')
+
+
+def minify_js(text):
+    """
+    Drop comments, indentation and blank lines; strings, template literals
+    and regular expressions are left alone. Line breaks are kept, so
+    automatic semicolon insertion works as in the source.
+    """
+    out = []
+
+    def last():
+        return out[-1][-1] if out else ''
+
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char in '"\'`':
+            end = _string_end(text, i)
+            out.append(text[i:end])
+            i = end
+        elif text.startswith('//', i):
+            end = text.find('\n', i)
+            i = len(text) if end < 0 else end
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            comment = text[i:len(text) if end < 0 else end + 2]
+            i += len(comment)
+            if '\n' in comment:
+                out.append('\n')
+        elif char == '/':
+            emitted = ''.join(out[-3:]).rstrip()
+            word = re.search(r'[A-Za-z_$]+$', emitted)
+            if not emitted or emitted[-1] in _REGEX_PRECEDERS or (word and word.group() in _REGEX_KEYWORDS):
+                # Regular expression literal, up to the closing / outside a [...] class
+                j = i + 1
+                in_class = False
+                while j < len(text) and text[j] != '\n':
+                    if text[j] == '\\':
+                        j += 2
+                        continue
+                    if text[j] == '[':
+                        in_class = True
+                    elif text[j] == ']':
+                        in_class = False
+                    elif text[j] == '/' and not in_class:
+                        break
+                    j += 1
+                out.append(text[i:j + 1])
+                i = j + 1
+            else:
+                out.append(char)
+                i += 1
+        elif char.isspace():
+            start = i
+            while i < len(text) and text[i].isspace():
+                i += 1
+            following = text[i] if i < len(text) else ''
+            if '\n' in text[start:i]:
+                if out and last() != '\n':
+                    out.append('\n')
+            elif out and last() not in _JS_PUNCTUATION and last() != '\n' and following not in _JS_PUNCTUATION:
+                out.append(' ')
+        else:
+            if char in _JS_PUNCTUATION and last() == ' ':
+                out[-1] = out[-1][:-1]
+            out.append(char)
+            i += 1
+
+    return ''.join(out).strip() + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+# ============================================================================
+# BUILD
+# ============================================================================
+
+def _hashed_name(path, data, suffix=''):
+    """css/style.css -> css/style<suffix>.<hash>.css"""
+    stem, extension = os.path.splitext(path)
+    return f'{stem}{suffix}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}'
+
+
+def _write(out_dir, name, data):
+    path = os.path.join(out_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def image_formats():
+    """Image variant formats this installation can write"""
+    if Image is None:
+        return []
+    # features.check warns and returns False for formats this Pillow does not know
+    return [name for name in IMAGE_FORMATS if features.check(name)]
+
+
+def _image_variants(source):
+    """
+    {format: [(width, bytes)]} for the responsive variants of a raster image
+    Formats are in IMAGE_FORMATS order, newest first. Browsers take the first
+    <source> they support, not the smallest, so a newer format is left out when
+    its variants are larger in total than those of an older one.
+    """
+    formats = image_formats()
+    if not formats:
+        return {}
+    variants = {name: [] for name in formats}
+    with Image.open(source) as image:
+        image.load()
+        widths = [width for width in IMAGE_WIDTHS if width < image.width] or [image.width]
+        for width in widths:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS)
+            for name in formats:
+                buffer = io.BytesIO()
+                resized.save(buffer, format=name.upper(), **IMAGE_FORMATS[name])
+                variants[name].append((width, buffer.getvalue()))
+
+    kept = {}
+    smallest = None
+    for name in reversed(formats):
+        size = sum(len(data) for _, data in variants[name])
+        if smallest is None or size < smallest:
+            kept[name] = variants[name]
+            smallest = size
+    return {name: kept[name] for name in formats if name in kept}
+
+
+def build_assets(static_dir, out_dir):
+    """
+    Build every file under static_dir (except out_dir) into out_dir and write its manifest
+    Returns the manifest: {'files': {source: built}, 'encodings': {built: [encoding]},
+    'images': {source: {format: [[width, built]]}}}
+    """
+    manifest = {'files': {}, 'encodings': {}, 'images': {}}
+    out_dir = os.path.abspath(out_dir)
+
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != out_dir)
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            path = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            extension = os.path.splitext(filename)[1].lower()
+
+            with open(source, 'rb') as f:
+                data = f.read()
+            if extension in MINIFIERS:
+                data = MINIFIERS[extension](data.decode('utf-8')).encode('utf-8')
+
+            built = _hashed_name(path, data)
+            _write(out_dir, built, data)
+            manifest['files'][path] = built
+
+            if extension in TEXT_EXTENSIONS:
+                encodings = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+                if brotli is not None:
+                    encodings['br'] = brotli.compress(data, mode=brotli.MODE_TEXT)
+                kept = []
+                for encoding, encoded in encodings.items():
+                    if len(encoded) < len(data):
+                        _write(out_dir, built + ENCODING_SUFFIXES[encoding], encoded)
+                        kept.append(encoding)
+                if kept:
+                    manifest['encodings'][built] = sorted(kept)
+
+            if extension in RASTER_EXTENSIONS:
+                variants = {}
+                for name, encoded_widths in _image_variants(source).items():
+                    for width, encoded in encoded_widths:
+                        variant = _hashed_name(os.path.splitext(path)[0] + f'.{name}', encoded, f'-{width}')
+                        _write(out_dir, variant, encoded)
+                        variants.setdefault(name, []).append([width, variant])
+                if variants:
+                    manifest['images'][path] = variants
+
+    _prune(out_dir, manifest)
+    _write(out_dir, MANIFEST_NAME, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def _built_files(manifest):
+    """Every file a manifest refers to, including precompressed siblings"""
+    files = set(manifest['files'].values())
+    for built, encodings in manifest['encodings'].items():
+        files.update(built + ENCODING_SUFFIXES[encoding] for encoding in encodings)
+    for variants in manifest['images'].values():
+        files.update(variant for widths in variants.values() for _, variant in widths)
+    return files
+
+
+def _prune(out_dir, manifest):
+    """Remove built files referenced by neither the new manifest nor the one it replaces"""
+    keep = _built_files(manifest)
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            keep |= _built_files(json.load(f))
+    except (OSError, ValueError, KeyError):
+        pass
+
+    for root, _, files in os.walk(out_dir):
+        for filename in files:
+            path = os.path.relpath(os.path.join(root, filename), out_dir).replace(os.sep, '/')
+            if path != MANIFEST_NAME and path not in keep:
+                os.remove(os.path.join(root, filename))
+    for root, dirs, files in os.walk(out_dir, topdown=False):
+        if root != out_dir and not os.listdir(root):
+            shutil.rmtree(root)
+
+
+# ============================================================================
+# SERVING
+# ============================================================================
+
+class AssetManifest:
+    """The built asset manifest, or an empty one before the first build"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.load()
+
+    def load(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {'files': {}, 'encodings': {}, 'images': {}}
+        self.files = manifest['files']
+        self.encodings = manifest['encodings']
+        self.images = manifest['images']
+        self.built = set(self.files.values()) | {
+            variant for variants in self.images.values() for widths in variants.values() for _, variant in widths
+        }
+
+    def refresh(self):
+        """Re-read the manifest after a build"""
+        self.load()
+        return self
+
+
+def asset_url(path):
+    """URL of a static file: the hashed build if there is one, else the file under /static"""
+    built = current_app.extensions['assets'].files.get(path)
+    if built is None:
+        return url_for('static', filename=path)
+    return url_for('assets', filename=built)
+
+
+def asset_srcset(path, image_format):
+    """srcset for the built variants of a raster image in image_format ('webp' or 'avif'); '' if none"""
+    variants = current_app.extensions['assets'].images.get(path, {}).get(image_format, [])
+    return ', '.join(f"{url_for('assets', filename=variant)} {width}w" for width, variant in variants)
+
+
+def serve_asset(filename):
+    """Serve a built file, precompressed if the client accepts it; cached for a year"""
+    manifest = current_app.extensions['assets']
+    if filename not in manifest.built:
+        abort(404)
+
+    encodings = manifest.encodings.get(filename, ())
+    encoding = next((name for name in ('br', 'gzip')
+                     if name in encodings and request.accept_encodings[name]), None)
+
+    response = send_from_directory(
+        manifest.directory,
+        filename + ENCODING_SUFFIXES[encoding] if encoding else filename,
+        mimetype=mimetypes.guess_type(filename)[0],
+        max_age=current_app.config['ASSETS_MAX_AGE']
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if encodings:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Load the manifest and add asset_url/asset_srcset and the /assets route"""
+    app.extensions['assets'] = AssetManifest(app.config['ASSETS_DIR'])
+    app.add_template_global(asset_url)
+    app.add_template_global(asset_srcset)
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
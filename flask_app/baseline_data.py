@@ -1,9 +1,21 @@
 """
 Baseline data from PRAMS Phase 8 (2016-2021)
 NON-MISSING RESPONSES ONLY
-Source: variable_categories_analysis.md
+Source: the columnar cache in data/prams_columns (built by prams_columns.py),
+else data/prams_baseline.json (built by prams_ingest.py), falling back to
+the counts from variable_categories_analysis.md
 """
 
+import json
+from pathlib import Path
+
+from metrics import timed
+from prams_columns import DEFAULT_COLUMNS_PATH, ColumnarBaseline
+from prams_ingest import CARE_SETTING_NAMES, build_baseline_artifact
+from scoring import CLASSIFICATION_CODES, RULE_IDS, SCORING_COLUMNS, score_batch
+
+ARTIFACT_PATH = Path(__file__).parent / 'data' / 'prams_baseline.json'
+
 BASELINE_DATA = {
     'dataset_info': 'PRAMS Phase 8 (2016-2021) - Non-missing responses only',
 
@@ -61,80 +73,275 @@ BASELINE_DATA = {
 }
 
 
+def load_baseline_artifact(path=ARTIFACT_PATH):
+    """
+    Load the baseline counts tallied from the PRAMS SAS file
+    PHQ-2 and risk distributions are not in PRAMS, so those keep the estimates above
+    """
+    try:
+        with open(path, 'r') as f:
+            artifact = json.load(f)
+    except FileNotFoundError:
+        return BASELINE_DATA
+
+    data = dict(BASELINE_DATA)
+    for key in ['dataset_info', 'total_rows', 'total_non_missing', 'risk_factors', 'care_settings']:
+        if key in artifact:
+            data[key] = artifact[key]
+    return data
+
+
+BASELINE = load_baseline_artifact()
+
+
+def load_columnar_baseline(path=DEFAULT_COLUMNS_PATH):
+    """Memory-map the columnar PRAMS cache built by prams_columns.py, if present"""
+    try:
+        return ColumnarBaseline(path)
+    except FileNotFoundError:
+        return None
+
+
+COLUMNAR = load_columnar_baseline()
+
+
+@timed('get_baseline_slice')
+def get_baseline_slice(years=None, states=None):
+    """
+    Return PRAMS baseline counts for a subset of survey years and/or states
+    Counts come from the memory-mapped columnar cache; returns None if it has not been built
+    """
+    if COLUMNAR is None:
+        return None
+
+    total_rows, value_counts = COLUMNAR.slice_counts(years, states)
+    result = build_baseline_artifact(total_rows, value_counts)
+    result['years'] = sorted(years) if years else COLUMNAR.years
+    result['states'] = sorted(states) if states else COLUMNAR.states
+    return result
+
+
+# PRAMS has no PHQ-2 items, so baseline rows are classified on the high-risk
+# flags it does measure (prior MH treatment, fair/poor health) and phq2_total is null.
+# As in the analytics_cube table, a missing rule is stored as ''.
+BASELINE_CUBE_DIMENSIONS = ['classification', 'rule_triggered', 'phq2_total', 'setting_name', 'year', 'state']
+
+_baseline_cube = None
+
+
+def get_baseline_cube():
+    """
+    Group-by counts of PRAMS rows over BASELINE_CUBE_DIMENSIONS
+    Computed once from the columnar cache; returns None if it has not been built
+    """
+    global _baseline_cube
+    if _baseline_cube is not None or COLUMNAR is None:
+        return _baseline_cube
+
+    # PRAMS has no PHQ-2 or PRE_RX_MH items; score_batch treats them as unanswered
+    scores = score_batch({name: COLUMNAR.column(name) for name in SCORING_COLUMNS if name in COLUMNAR.variables})
+    flu_src = COLUMNAR.column('FLU_SRC')
+
+    cube = {}
+    for year, state, start, end in COLUMNAR.groups:
+        combos = {}
+        for combo in zip(scores.rule[start:end], flu_src[start:end]):
+            combos[combo] = combos.get(combo, 0) + 1
+
+        for (rule, flu), count in combos.items():
+            classification = CLASSIFICATION_CODES[rule != 0]
+            setting = CARE_SETTING_NAMES.get(flu, 'No regular provider')
+            key = (classification, RULE_IDS[rule] or '', None, setting, year, state)
+            cube[key] = cube.get(key, 0) + count
+
+    _baseline_cube = cube
+    return cube
+
+
+@timed('query_baseline_cube')
+def query_baseline_cube(group_by, classification=None, rule_triggered=None,
+                        phq2_total=None, setting_name=None, years=None, states=None):
+    """
+    Roll up the PRAMS baseline cube, mirroring database.query_analytics_cube
+    Returns None if the columnar cache has not been built
+    """
+    cube = get_baseline_cube()
+    if cube is None:
+        return None
+
+    for dimension in group_by:
+        if dimension not in BASELINE_CUBE_DIMENSIONS:
+            raise ValueError(f'Unknown baseline cube dimension: {dimension}')
+
+    filters = {
+        'classification': classification,
+        'rule_triggered': rule_triggered,
+        'phq2_total': phq2_total,
+        'setting_name': setting_name
+    }
+    years = set(years) if years else None
+    states = set(states) if states else None
+    positions = [BASELINE_CUBE_DIMENSIONS.index(dimension) for dimension in group_by]
+
+    rollup = {}
+    for key, count in cube.items():
+        cell = dict(zip(BASELINE_CUBE_DIMENSIONS, key))
+        if any(value is not None and cell[name] != value for name, value in filters.items()):
+            continue
+        if years is not None and cell['year'] not in years:
+            continue
+        if states is not None and cell['state'] not in states:
+            continue
+        group = tuple(key[i] for i in positions)
+        rollup[group] = rollup.get(group, 0) + count
+
+    result = []
+    for group in sorted(rollup, key=lambda g: tuple(str(v) for v in g)):
+        cell = {dimension: value if value != '' else None for dimension, value in zip(group_by, group)}
+        cell['count'] = rollup[group]
+        result.append(cell)
+    return result
+
+
+# The PHQ-2 and risk distributions in BASELINE_DATA are estimated for this many responses
+ESTIMATED_TOTAL = 53000
+
+_baseline_counts = None
+
+
+def get_baseline_counts():
+    """
+    Baseline risk factor and care setting counts over all PRAMS rows
+    Counted once over the memory-mapped columnar cache when it has been built,
+    else taken from the baseline artifact
+    """
+    global _baseline_counts
+    if _baseline_counts is None:
+        if COLUMNAR is not None:
+            _baseline_counts = build_baseline_artifact(*COLUMNAR.slice_counts(None, None))
+        else:
+            _baseline_counts = BASELINE
+    return _baseline_counts
+
+
+def _scale_estimate(distribution, total):
+    return {key: round(count * total / ESTIMATED_TOTAL) for key, count in distribution.items()}
+
+
 def get_baseline_analytics():
     """
     Return baseline data in API format (counts only, no missing data)
+    total_responses is the number of PRAMS respondents. PRAMS has no PHQ-2 items,
+    so the PHQ-2 and risk distributions are the literature-based estimates scaled
+    to that total; 'estimated' lists the fields that are estimates.
     """
+    counts = get_baseline_counts()
+    total = counts.get('total_rows')
+    estimated = ['risk_distribution', 'phq2_distribution']
+    if total is None:
+        # Fallback counts from variable_categories_analysis.md have no respondent total
+        total = ESTIMATED_TOTAL
+        estimated.insert(0, 'total_responses')
+
     return {
-        'total_responses': 53000,  # Average non-missing responses
-        'risk_distribution': BASELINE_DATA['risk_distribution'].copy(),
-        'phq2_distribution': BASELINE_DATA['phq2_distribution'].copy(),
-        'risk_factors': BASELINE_DATA['risk_factors'].copy(),
-        'care_settings': BASELINE_DATA['care_settings'].copy()
+        'total_responses': total,
+        'risk_distribution': _scale_estimate(BASELINE['risk_distribution'], total),
+        'phq2_distribution': _scale_estimate(BASELINE['phq2_distribution'], total),
+        'risk_factors': counts['risk_factors'].copy(),
+        'care_settings': counts['care_settings'].copy(),
+        'estimated': estimated
     }
 
 
-def merge_with_new_responses(new_responses):
+def response_counter_keys(response):
     """
-    Merge baseline data with new screening responses
+    Return the (metric, key) analytics counters a single response contributes to
     Only counts non-missing data
     """
+    keys = [('total', 'responses')]
+
+    # Risk distribution
+    risk_class = response.get('risk_result', {}).get('classification')
+    if risk_class in ['HIGH_RISK', 'LOW_RISK']:
+        keys.append(('risk_distribution', risk_class))
+
+    # PHQ-2 score
+    phq2_score = response.get('risk_result', {}).get('phq2_total')
+    if phq2_score is not None and 0 <= phq2_score <= 6:
+        keys.append(('phq2_distribution', phq2_score))
+
+    # Risk factors (only count non-missing/non-NA responses)
+    resp = response.get('responses', {})
+
+    # Prior MH treatment
+    if resp.get('BPG_MH') == '2':
+        keys.append(('risk_factors', 'prior_mh'))
+
+    # MH medications
+    if resp.get('PRE_RX') == '2' and resp.get('PRE_RX_MH') in ['Yes', 'Not sure']:
+        keys.append(('risk_factors', 'mh_meds'))
+
+    # Poor health
+    if resp.get('HTH_GEN') in ['4', '5']:
+        keys.append(('risk_factors', 'poor_health'))
+
+    # No exercise
+    if resp.get('PRE_EXER') == '1':
+        keys.append(('risk_factors', 'no_exercise'))
+
+    # Dieting
+    if resp.get('PRE_DIET') == '2':
+        keys.append(('risk_factors', 'dieting'))
+
+    # Overweight/obese
+    if resp.get('OWGT_OBS') == '2':
+        keys.append(('risk_factors', 'overweight'))
+
+    # Care setting (only non-missing)
+    setting = response.get('routing', {}).get('setting_name')
+    if setting and setting != 'Unknown':
+        keys.append(('care_settings', setting))
+
+    return keys
+
+
+def count_responses(responses):
+    """
+    Tally analytics counters for a list of responses
+    Returns {metric: {key: count}} in the format used by merge_with_counters
+    """
+    counters = {}
+    for response in responses:
+        for metric, key in response_counter_keys(response):
+            bucket = counters.setdefault(metric, {})
+            bucket[key] = bucket.get(key, 0) + 1
+    return counters
+
+
+@timed('merge_with_counters')
+def merge_with_counters(counters):
+    """
+    Merge baseline data with precomputed response counters
+    Runs in time proportional to the number of counters, not responses
+    """
     baseline = get_baseline_analytics()
 
-    if not new_responses or len(new_responses) == 0:
-        return baseline
-
-    # Add count of new responses
-    baseline['total_responses'] += len(new_responses)
-
-    # Merge risk distributions
-    for response in new_responses:
-        risk_class = response.get('risk_result', {}).get('classification')
-        if risk_class in ['HIGH_RISK', 'LOW_RISK']:
-            baseline['risk_distribution'][risk_class] = \
-                baseline['risk_distribution'].get(risk_class, 0) + 1
-
-    # Merge PHQ-2 scores
-    for response in new_responses:
-        phq2_score = response.get('risk_result', {}).get('phq2_total')
-        if phq2_score is not None and 0 <= phq2_score <= 6:
-            baseline['phq2_distribution'][phq2_score] = \
-                baseline['phq2_distribution'].get(phq2_score, 0) + 1
-
-    # Merge risk factors (only count non-missing/non-NA responses)
-    for response in new_responses:
-        resp = response.get('responses', {})
-
-        # Prior MH treatment
-        if resp.get('BPG_MH') == '2':
-            baseline['risk_factors']['prior_mh'] += 1
-
-        # MH medications
-        if resp.get('PRE_RX') == '2' and resp.get('PRE_RX_MH') in ['Yes', 'Not sure']:
-            baseline['risk_factors']['mh_meds'] += 1
-
-        # Poor health
-        if resp.get('HTH_GEN') in ['4', '5']:
-            baseline['risk_factors']['poor_health'] += 1
-
-        # No exercise
-        if resp.get('PRE_EXER') == '1':
-            baseline['risk_factors']['no_exercise'] += 1
-
-        # Dieting
-        if resp.get('PRE_DIET') == '2':
-            baseline['risk_factors']['dieting'] += 1
-
-        # Overweight/obese
-        if resp.get('OWGT_OBS') == '2':
-            baseline['risk_factors']['overweight'] += 1
-
-    # Merge care settings (only non-missing)
-    for response in new_responses:
-        routing = response.get('routing', {})
-        setting = routing.get('setting_name')
-        if setting and setting != 'Unknown':
-            baseline['care_settings'][setting] = \
-                baseline['care_settings'].get(setting, 0) + 1
+    baseline['total_responses'] += counters.get('total', {}).get('responses', 0)
+
+    for metric in ['risk_distribution', 'phq2_distribution', 'risk_factors', 'care_settings']:
+        for key, count in counters.get(metric, {}).items():
+            baseline[metric][key] = baseline[metric].get(key, 0) + count
 
     return baseline
+
+
+@timed('merge_with_new_responses')
+def merge_with_new_responses(new_responses):
+    """
+    Merge baseline data with new screening responses
+    Only counts non-missing data
+    """
+    if not new_responses or len(new_responses) == 0:
+        return get_baseline_analytics()
+
+    return merge_with_counters(count_responses(new_responses))
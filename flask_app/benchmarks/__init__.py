@@ -0,0 +1,4 @@
+"""
+Benchmarks for the screening app
+Run from the flask_app directory, e.g. python -m benchmarks.db_concurrency
+"""
@@ -0,0 +1,276 @@
+"""
+Concurrent-connection capacity: WSGI (gthread) against ASGI (uvicorn) under gunicorn
+
+Starts gunicorn with gunicorn.conf.py once per mode against the same
+temporary database, then holds C concurrent keep-alive connections open,
+each logged in as its own user, for --duration seconds per level. Every
+connection sends requests back to back from a weighted mix of:
+    questions    GET /api/questions
+    submit       POST /api/submit with random answers
+    analytics    GET /api/analytics
+    login        POST /login (password hashing)
+Reports requests/sec, p50/p99 latency, 503s (hashing pool saturated) and
+errors (unexpected statuses, refused or dropped connections) per mode and
+level.
+
+Both modes run the same number of worker processes. The gthread worker
+serves at most WEB_CONCURRENCY x GUNICORN_THREADS connections at once and
+the rest wait for a thread; the uvicorn worker accepts them all and parks
+them on its event loop. The load generator shares the machine, so on few
+CPUs compare the modes with each other rather than reading absolute numbers.
+
+Usage:
+    pip install uvicorn
+    python -m benchmarks.asgi_capacity [--levels 16 64 256] [--duration 10] [--workers 2]
+    python -m benchmarks.asgi_capacity --modes asgi --save-baseline main
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from benchmarks.common import (
+    APP_DIR, add_baseline_arguments, handle_baseline_arguments, load_answer_options, percentile,
+    random_responses, temp_database
+)
+
+PASSWORD = 'benchmark-password'
+
+MODES = {
+    'wsgi': ('wsgi:app', {}),
+    'asgi': ('asgi:app', {'GUNICORN_WORKER_CLASS': 'uvicorn.workers.UvicornWorker'}),
+}
+
+# action: default weight
+MIX = {
+    'questions': 30,
+    'submit': 35,
+    'analytics': 30,
+    'login': 5,
+}
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+JSON = {'Content-Type': 'application/json'}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, database, workers, threads):
+    """Start gunicorn in the given mode and wait until it accepts connections"""
+    app, env = MODES[mode]
+    port = free_port()
+    env = dict(os.environ, **env, PORT=str(port), WEB_CONCURRENCY=str(workers),
+               GUNICORN_THREADS=str(threads), GUNICORN_WATCH_CONFIG='0', FLASK_DATABASE=database)
+    log_path = os.path.join(os.path.dirname(database), f'gunicorn-{mode}.log')
+    with open(log_path, 'wb') as log:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--backlog', '2048', app],
+            cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log
+        )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as log:
+                raise SystemExit(f'gunicorn ({mode}) exited:\n{log.read()}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/api/questions')
+            conn.getresponse().read()
+            conn.close()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit(f'gunicorn ({mode}) did not start within 30s; see {log_path}')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+class Connection:
+    """One keep-alive connection with its own session cookie"""
+
+    def __init__(self, port, email):
+        self.port = port
+        self.email = email
+        self.cookie = None
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        # The server may have closed an idle keep-alive connection; retry once on a new one
+        for attempt in range(2):
+            reused = self.conn is not None
+            if not reused:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body, headers)
+                response = self.conn.getresponse()
+                response.read()
+                break
+            except (OSError, http.client.HTTPException):
+                self.close()
+                if not reused:
+                    return None
+        else:
+            return None
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        if response.will_close:
+            self.close()
+        return response.status
+
+    def login(self):
+        return self.request('POST', '/login', urlencode({'email': self.email, 'password': PASSWORD}), FORM)
+
+    def login_retrying(self, timeout=300):
+        """Log in before the timed run, backing off on 503s while every connection signs in at once"""
+        deadline = time.monotonic() + timeout
+        delay = 0.1
+        while time.monotonic() < deadline:
+            if self.login() == 302:
+                return True
+            time.sleep(random.uniform(0, delay))
+            delay = min(delay * 2, 5.0)
+        return False
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# action: (function(connection, rng, options) -> status, expected status)
+ACTIONS = {
+    'questions': (lambda conn, rng, options: conn.request('GET', '/api/questions'), 200),
+    'submit': (lambda conn, rng, options: conn.request(
+        'POST', '/api/submit', json.dumps({'responses': random_responses(rng, options)}), JSON), 200),
+    'analytics': (lambda conn, rng, options: conn.request('GET', '/api/analytics'), 200),
+    'login': (lambda conn, rng, options: conn.login(), 302),
+}
+
+
+def run_level(port, emails, duration, mix, seed):
+    """Hold len(emails) connections busy for duration seconds; return latencies and outcome counts"""
+    options = load_answer_options()
+    actions = list(mix)
+    weights = [mix[action] for action in actions]
+    latencies = []
+    counts = {'ok': 0, 'overloaded': 0, 'errors': 0}
+    lock = threading.Lock()
+    ready = threading.Barrier(len(emails) + 1)
+    stop = threading.Event()
+
+    def client(email, rng):
+        conn = Connection(port, email)
+        logged_in = conn.login_retrying()
+        ready.wait()
+        timings, local = [], {'ok': 0, 'overloaded': 0, 'errors': 0 if logged_in else 1}
+        while not stop.is_set():
+            request, expected = ACTIONS[rng.choices(actions, weights)[0]]
+            started = time.perf_counter()
+            status = request(conn, rng, options)
+            elapsed = time.perf_counter() - started
+            if stop.is_set():
+                break  # finished after the deadline; not counted
+            if status == expected:
+                local['ok'] += 1
+                timings.append(elapsed)
+            elif status == 503:
+                local['overloaded'] += 1
+            else:
+                local['errors'] += 1
+        conn.close()
+        with lock:
+            latencies.extend(timings)
+            for key, value in local.items():
+                counts[key] += value
+
+    threads = [threading.Thread(target=client, args=(email, random.Random(seed + n)), daemon=True)
+               for n, email in enumerate(emails)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return latencies, counts
+
+
+def create_users(count):
+    import database
+    from hashing import INLINE_HASHER
+
+    # One hash shared by every account; registering is not what is measured
+    password_hash = INLINE_HASHER.hash_password(PASSWORD)
+    emails = [f'capacity-{n}@example.com' for n in range(count)]
+    for email in emails:
+        database.insert_user(email, password_hash)
+    database.close_pool()
+    return emails
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--levels', nargs='+', type=int, default=[16, 64, 256],
+                        help='Concurrent connections per run')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per level')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes in both modes')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per gthread worker (WSGI mode)')
+    parser.add_argument('--seed', type=int, default=1)
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    database_path = temp_database()
+    import database
+    database.init_db()
+    emails = create_users(max(args.levels))
+
+    metrics = {}
+    print(f"{'mode':<5} {'conns':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>9} {'503s':>6} {'errors':>7}")
+    for mode in args.modes:
+        process, port = start_server(mode, database_path, args.workers, args.threads)
+        try:
+            for level in args.levels:
+                latencies, counts = run_level(port, emails[:level], args.duration, MIX, args.seed)
+                rate = counts['ok'] / args.duration
+                p50, p99 = (percentile(latencies, pct) * 1000 for pct in (50, 99))
+                print(f"{mode:<5} {level:>6} {rate:>9,.0f} {p50:>8.1f} {p99:>9.1f} "
+                      f"{counts['overloaded']:>6} {counts['errors']:>7}")
+                metrics.update({
+                    f'{mode}_{level}_requests_per_sec': rate,
+                    f'{mode}_{level}_p50_ms': p50,
+                })
+        finally:
+            stop_server(process)
+
+    handle_baseline_arguments(args, metrics)
+
+
+if __name__ == '__main__':
+    main()
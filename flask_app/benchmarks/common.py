@@ -0,0 +1,134 @@
+"""
+Shared helpers for the benchmarks
+"""
+
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+APP_DIR = Path(__file__).parent.parent
+CONFIG_PATH = APP_DIR.parent / 'questions_config.json'
+BASELINE_DIR = Path(__file__).parent / 'baselines'
+
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+
+def load_answer_options():
+    """Return {question_id: [answer strings]} as the screening page would submit them"""
+    with open(CONFIG_PATH, 'r') as f:
+        config = json.load(f)
+
+    options = {}
+    for section in config['sections']:
+        for question in section['questions']:
+            options[question['question_id']] = [
+                'NA' if option['value'] is None else str(option['value'])
+                for option in question['response_options']
+            ]
+    return options
+
+
+def random_responses(rng, options):
+    """Draw one random set of answers"""
+    return {question_id: rng.choice(values) for question_id, values in options.items()}
+
+
+def temp_database():
+    """Point database.py at a fresh temporary SQLite file and return its path"""
+    import database
+
+    path = os.path.join(tempfile.mkdtemp(prefix='pmh-bench-'), 'bench.db')
+    database.close_pool()
+    database.DATABASE = path
+    return path
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def database_size(path):
+    """
+    Bytes in a SQLite database file once its WAL has been checkpointed into it
+    The WAL and -shm files are left out: their size depends on when the last
+    checkpoint ran, not on how much data is stored.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+    return os.path.getsize(path)
+
+
+# ============================================================================
+# SAVED BASELINES
+# ============================================================================
+
+def machine_info():
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def save_baseline(name, metrics):
+    """Write {metric: value} to baselines/<name>.json and return the path"""
+    BASELINE_DIR.mkdir(exist_ok=True)
+    path = BASELINE_DIR / f'{name}.json'
+    with open(path, 'w') as f:
+        json.dump({'machine': machine_info(), 'metrics': metrics}, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare_baseline(name, metrics, tolerance):
+    """
+    Print metrics next to the saved baseline and return the regressed metric names
+    Metrics ending in _per_sec are better when higher; all others (latencies,
+    sizes) when lower. A metric regresses when it is worse by more than
+    tolerance (0.2 = 20%).
+    """
+    path = BASELINE_DIR / f'{name}.json'
+    with open(path, 'r') as f:
+        saved = json.load(f)
+    if saved['machine'] != machine_info():
+        print(f"warning: baseline {name} was saved on {saved['machine']}, not {machine_info()}")
+
+    regressions = []
+    print(f"{'metric':<36} {'baseline':>12} {'now':>12} {'change':>8}")
+    for metric, value in metrics.items():
+        before = saved['metrics'].get(metric)
+        if not before:
+            print(f"{metric:<36} {'-':>12} {value:>12.2f}")
+            continue
+        change = value / before - 1
+        worse = -change if metric.endswith('_per_sec') else change
+        flag = '  REGRESSED' if worse > tolerance else ''
+        if flag:
+            regressions.append(metric)
+        print(f'{metric:<36} {before:>12.2f} {value:>12.2f} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def add_baseline_arguments(parser):
+    parser.add_argument('--save-baseline', metavar='NAME', help='Save the results as baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='Compare with baselines/NAME.json; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown before a metric counts as regressed (default 0.2 = 20%%)')
+
+
+def handle_baseline_arguments(args, metrics):
+    """Save and/or compare metrics as the command line asked; exits 1 on regressions"""
+    if args.compare:
+        regressions = compare_baseline(args.compare, metrics, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    if args.save_baseline:
+        print(f'Saved baseline to {save_baseline(args.save_baseline, metrics)}')
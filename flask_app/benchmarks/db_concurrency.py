@@ -0,0 +1,95 @@
+"""
+Concurrent write benchmark for database.py
+
+Runs N writer threads that each call save_screening_response in a loop and
+reports submits/sec, comparing the pooled WAL configuration against the
+previous one-connection-per-call rollback-journal setup.
+
+Usage:
+    python -m benchmarks.db_concurrency [--threads 1 2 4 8] [--submits 200]
+"""
+
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.common import load_answer_options, random_responses, temp_database
+
+import database
+from scoring import calculate_risk, determine_routing
+
+MODES = {
+    'pooled': {
+        'POOL_SIZE': database.POOL_SIZE,
+        'JOURNAL_MODE': database.JOURNAL_MODE,
+        'CONNECTION_PRAGMAS': list(database.CONNECTION_PRAGMAS),
+    },
+    'legacy': {
+        'POOL_SIZE': 0,
+        'JOURNAL_MODE': 'DELETE',
+        'CONNECTION_PRAGMAS': [],
+    },
+}
+
+
+def configure(mode):
+    for name, value in MODES[mode].items():
+        setattr(database, name, value)
+    temp_database()
+    database.init_db()
+
+
+def run(mode, threads, submits_per_thread, payloads):
+    configure(mode)
+    user_id = database.create_user(f'bench-{mode}-{threads}@example.com', 'benchmark')
+    errors = []
+
+    def writer(offset):
+        for i in range(submits_per_thread):
+            responses, risk_result, routing = payloads[(offset + i) % len(payloads)]
+            try:
+                database.save_screening_response(user_id, responses, risk_result, routing)
+            except Exception as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=writer, args=(n * submits_per_thread,)) for n in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    total = threads * submits_per_thread - len(errors)
+    return total / elapsed, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--submits', type=int, default=200, help='Submissions per writer thread')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    # Score up front so only database time is measured
+    rng = random.Random(42)
+    options = load_answer_options()
+    payloads = []
+    for _ in range(500):
+        responses = random_responses(rng, options)
+        payloads.append((
+            responses,
+            calculate_risk(responses),
+            determine_routing(responses.get('BPG_TALK'), responses.get('FLU_SRC'))
+        ))
+
+    print(f"{'mode':<8} {'threads':>7} {'submits/sec':>12} {'errors':>7}")
+    for mode in args.modes:
+        for threads in args.threads:
+            rate, errors = run(mode, threads, args.submits, payloads)
+            print(f'{mode:<8} {threads:>7} {rate:>12,.0f} {errors:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Login load benchmark
+
+Runs N client threads that each POST /login in a loop through Flask's test
+client and reports logins/sec, p50/p99 latency and 503 responses, hashing
+inline on the request thread versus through the hashing process pool.
+
+Usage:
+    python -m benchmarks.login_load [--threads 4 16] [--logins 20] [--modes inline pool]
+"""
+
+import argparse
+import threading
+import time
+
+from benchmarks.common import percentile, temp_database
+
+MODES = ['inline', 'pool']
+PASSWORD = 'benchmark-password'
+
+
+def run(app_module, app, mode, threads, logins_per_thread, emails):
+    app.config['HASHING_POOL'] = mode == 'pool'
+    app_module._hasher = None
+
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+
+    def client(offset):
+        test_client = app.test_client()
+        for i in range(logins_per_thread):
+            email = emails[(offset + i) % len(emails)]
+            started = time.perf_counter()
+            response = test_client.post('/login', data={'email': email, 'password': PASSWORD})
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(response.status_code)
+
+    workers = [threading.Thread(target=client, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    if mode == 'pool':
+        app_module._hasher.shutdown()
+
+    ok = statuses.count(302)
+    latencies.sort()
+    return {
+        'logins_per_sec': ok / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'overloaded': statuses.count(503)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[4, 16])
+    parser.add_argument('--logins', type=int, default=20, help='Logins per client thread')
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    args = parser.parse_args()
+
+    temp_database()
+    import app as app_module
+    import database
+
+    app = app_module.create_app()
+
+    emails = [f'login-bench-{n}@example.com' for n in range(8)]
+    for email in emails:
+        database.create_user(email, PASSWORD)
+
+    print(f"{'mode':<8} {'threads':>7} {'logins/sec':>11} {'p50 ms':>8} {'p99 ms':>8} {'503s':>5}")
+    for mode in args.modes:
+        for threads in args.threads:
+            result = run(app_module, app, mode, threads, args.logins, emails)
+            print(f"{mode:<8} {threads:>7} {result['logins_per_sec']:>11.1f} "
+                  f"{result['p50_ms']:>8.0f} {result['p99_ms']:>8.0f} {result['overloaded']:>5}")
+
+
+if __name__ == '__main__':
+    main()
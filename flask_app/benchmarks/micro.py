@@ -0,0 +1,138 @@
+"""
+Microbenchmarks for the scoring, analytics and database functions
+
+Seeds a temporary database with --rows scored responses, then times each
+function on its own and reports the best-of-5 time per call. Each timed
+round runs the function enough times to take at least --min-time seconds.
+
+Usage:
+    python -m benchmarks.micro [--rows 5000] [--only calculate_risk get_analytics_counters]
+    python -m benchmarks.micro --save-baseline main         # record
+    python -m benchmarks.micro --compare main               # exit 1 on regressions
+"""
+
+import argparse
+import itertools
+import json
+import random
+import time
+
+from benchmarks.common import (
+    CONFIG_PATH, add_baseline_arguments, handle_baseline_arguments, load_answer_options,
+    random_responses, temp_database
+)
+
+import database
+from baseline_data import count_responses, merge_with_counters, merge_with_new_responses
+from hashing import INLINE_HASHER
+from scoring import calculate_risk, compile_rules, determine_routing, encode_responses, score_batch
+
+PASSWORD = 'benchmark-password'
+
+
+def per_call_us(fn, min_time, repeats=5):
+    """Best-of-repeats time per call of fn(), in microseconds"""
+    calls = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        calls *= 2 if elapsed < min_time / 10 else 1 + int(min_time / max(elapsed, 1e-9))
+
+    best = elapsed
+    for _ in range(repeats - 1):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return best / calls * 1e6
+
+
+def scored(responses):
+    return {
+        'responses': responses,
+        'risk_result': calculate_risk(responses),
+        'routing': determine_routing(responses.get('BPG_TALK'), responses.get('FLU_SRC'))
+    }
+
+
+def benchmarks(rows, rng):
+    """Seed the database; return {name: zero-argument function}"""
+    options = load_answer_options()
+    samples = [random_responses(rng, options) for _ in range(1000)]
+    entries = [scored(responses) for responses in samples]
+    with open(CONFIG_PATH, 'r') as f:
+        compiled = compile_rules(json.load(f))
+
+    database.init_db()
+    user_id = database.create_user('micro@example.com', PASSWORD)
+    database.insert_screening_responses([
+        dict(scored(random_responses(rng, options)), user_id=user_id,
+             created_at=f'2025-{1 + n % 12:02d}-{1 + n % 28:02d} {n % 24:02d}:00:00')
+        for n in range(rows)
+    ])
+
+    next_sample = itertools.cycle(samples).__next__
+    next_entry = itertools.cycle(entries).__next__
+    hundred = entries[:100]
+    counters = database.get_analytics_counters()
+
+    def save():
+        entry = next_entry()
+        database.save_screening_response(user_id, entry['responses'], entry['risk_result'], entry['routing'])
+
+    return {
+        # Scoring (per response)
+        'calculate_risk': lambda: calculate_risk(next_sample()),
+        'compiled_rules': lambda: compiled(next_sample()),
+        'score_batch_1000': lambda: score_batch(encode_responses(samples)),
+
+        # Analytics merge
+        'merge_with_new_responses_100': lambda: merge_with_new_responses(hundred),
+        'count_responses_100': lambda: count_responses(hundred),
+        'merge_with_counters': lambda: merge_with_counters(counters),
+
+        # Database
+        'save_screening_response': save,
+        'get_analytics_counters': database.get_analytics_counters,
+        'get_user_by_email': lambda: database.get_user_by_email('micro@example.com'),
+        'get_user_screening_page_20': lambda: database.get_user_screening_page(user_id, 20),
+        'get_latest_screening': lambda: database.get_latest_screening(user_id),
+        'get_user_stats': lambda: database.get_user_stats(user_id),
+        'query_analytics_cube': lambda: database.query_analytics_cube(['classification', 'phq2_total']),
+        'query_analytics_trend_month': lambda: database.query_analytics_trend('month'),
+        'verify_password': lambda: database.verify_password('micro@example.com', PASSWORD, hasher=INLINE_HASHER),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=5000, help='Responses seeded before timing')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds per timed round')
+    parser.add_argument('--only', nargs='+', metavar='NAME', help='Run only these benchmarks')
+    parser.add_argument('--seed', type=int, default=3)
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    temp_database()
+    functions = benchmarks(args.rows, random.Random(args.seed))
+    unknown = set(args.only or ()) - set(functions)
+    if unknown:
+        parser.error(f"unknown benchmarks {', '.join(sorted(unknown))}; choose from {', '.join(functions)}")
+
+    metrics = {}
+    print(f"{'function':<32} {'us/call':>12}")
+    for name, fn in functions.items():
+        if args.only and name not in args.only:
+            continue
+        metrics[f'{name}_us'] = per_call_us(fn, args.min_time)
+        print(f"{name:<32} {metrics[f'{name}_us']:>12,.1f}")
+
+    handle_baseline_arguments(args, metrics)
+
+
+if __name__ == '__main__':
+    main()
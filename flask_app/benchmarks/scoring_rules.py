@@ -0,0 +1,113 @@
+"""
+Parity check and latency benchmark for the compiled scoring rules
+
+Scores every combination of answers to the scoring questions (each response
+option, "NA" and an unanswered question) with calculate_risk, the compiled
+rules and the batch scorer, and exits 1 on the first difference. Then
+reports best-of-5 per-call latency of calculate_risk against the compiled
+rules.
+
+This is the parity check for scoring changes: run it with --parity-only
+(no timing) after editing calculate_risk or the scoring metadata in
+questions_config.json, and in CI; exit status 0 means every combination
+scored identically.
+
+Usage:
+    python -m benchmarks.scoring_rules --parity-only
+    python -m benchmarks.scoring_rules [--calls 100000] [--skip-parity]
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+
+from benchmarks.common import CONFIG_PATH, load_answer_options, random_responses
+
+from scoring import SCORING_COLUMNS, calculate_risk, compile_rules, score_responses
+
+ABSENT = object()
+
+
+def answer_combinations(options):
+    """Yield one response dict per combination of answers to the scoring questions"""
+    choices = [options[question_id] + [ABSENT] for question_id in SCORING_COLUMNS]
+    for combo in itertools.product(*choices):
+        yield {
+            question_id: answer
+            for question_id, answer in zip(SCORING_COLUMNS, combo)
+            if answer is not ABSENT
+        }
+
+
+def check_parity(compiled, options, batch_size=50000):
+    """Return (combinations checked, first mismatch or None)"""
+    checked = 0
+    combos = answer_combinations(options)
+    while True:
+        batch = list(itertools.islice(combos, batch_size))
+        if not batch:
+            return checked, None
+
+        batch_results = score_responses(batch)
+        for responses, batch_result in zip(batch, batch_results):
+            expected = calculate_risk(responses)
+            for scorer, result in (('compiled', compiled(responses)), ('batch', batch_result)):
+                if result != expected:
+                    return checked, (scorer, responses, expected, result)
+            checked += 1
+
+
+def per_call_ns(scorer, samples, calls, repeats=5):
+    """Best-of-repeats time per call, in nanoseconds"""
+    rounds = max(1, calls // len(samples))
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for responses in samples:
+                scorer(responses)
+        best = min(best, time.perf_counter() - started)
+    return best / (rounds * len(samples)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--calls', type=int, default=100000, help='Scoring calls per timed repeat')
+    checks = parser.add_mutually_exclusive_group()
+    checks.add_argument('--skip-parity', action='store_true', help='Only time the scorers')
+    checks.add_argument('--parity-only', action='store_true', help='Only run the parity check')
+    args = parser.parse_args()
+
+    with open(CONFIG_PATH, 'r') as f:
+        compiled = compile_rules(json.load(f))
+    options = load_answer_options()
+
+    if not args.skip_parity:
+        started = time.perf_counter()
+        checked, mismatch = check_parity(compiled, options)
+        if mismatch:
+            scorer, responses, expected, result = mismatch
+            print(f'{scorer} scorer differs from calculate_risk for {responses}')
+            print(f'  expected: {expected}')
+            print(f'  got:      {result}')
+            sys.exit(1)
+        print(f'parity: {checked:,} answer combinations identical '
+              f'({time.perf_counter() - started:.1f}s)')
+        if args.parity_only:
+            return
+
+    rng = random.Random(42)
+    samples = [random_responses(rng, options) for _ in range(1000)]
+
+    reference = per_call_ns(calculate_risk, samples, args.calls)
+    fast = per_call_ns(compiled, samples, args.calls)
+    print(f"{'scorer':<16} {'ns/call':>9}")
+    print(f"{'calculate_risk':<16} {reference:>9,.0f}")
+    print(f"{'compiled rules':<16} {fast:>9,.0f}   ({reference / fast:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Conformance checks for the storage backends
+
+Runs the same sequence of database.py calls against every backend, checks
+each result against what the calls imply, then checks that all backends
+returned identical results. Also times per-row and bulk inserts. Exits 1
+on any failure, including PostgreSQL being unavailable unless --skip-postgres
+is given, so it can gate CI; --checks-only leaves out the timing.
+
+Backends:
+    sqlite        a temporary database file
+    postgresql    a scratch database created (and dropped afterwards) on the
+                  server at --postgres-url, or on an embedded throwaway server
+                  when the pgserver package is installed (pip install pgserver)
+
+Usage:
+    python -m benchmarks.storage_conformance [--postgres-url postgresql://...] [--rows 2000]
+                                             [--skip-postgres] [--checks-only]
+"""
+
+import argparse
+import json
+import random
+import secrets
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from benchmarks.common import load_answer_options, random_responses, temp_database
+
+import database
+from scoring import calculate_risk, determine_routing
+
+failures = []
+
+
+def check(backend, name, condition):
+    if not condition:
+        failures.append(f'{backend}: {name}')
+
+
+def make_entries(rng, options, user_ids, count):
+    """Scored responses spread over 2024-2025, several per second so created_at ties"""
+    entries = []
+    for n in range(count):
+        responses = random_responses(rng, options)
+        entries.append({
+            'user_id': user_ids[n % len(user_ids)],
+            'responses': responses,
+            'risk_result': calculate_risk(responses),
+            'routing': determine_routing(responses.get('BPG_TALK'), responses.get('FLU_SRC')),
+            'created_at': f'{2024 + n % 2}-{1 + n % 12:02d}-{1 + n % 28:02d} 0{n % 10}:00:00'
+        })
+    return entries
+
+
+def exercise(backend, rows):
+    """Run every storage function once; return the results that must match across backends"""
+    results = {}
+    rng = random.Random(17)
+    options = load_answer_options()
+
+    database.init_db()
+    database.init_db()  # idempotent
+
+    # Users
+    alice = database.create_user('alice@example.com', 'pw-alice', 'Alice')
+    bob = database.create_user('bob@example.com', 'pw-bob')
+    check(backend, 'get_user_by_email', database.get_user_by_email('alice@example.com')['id'] == alice)
+    check(backend, 'get_user_by_id', database.get_user_by_id(bob)['email'] == 'bob@example.com')
+    check(backend, 'verify_password', database.verify_password('alice@example.com', 'pw-alice')['id'] == alice)
+    check(backend, 'verify_password rejects', database.verify_password('alice@example.com', 'nope') is None)
+    database.update_last_login(alice)
+    check(backend, 'update_last_login', database.get_user_by_id(alice)['last_login'] is not None)
+    results['users'] = [alice, bob]
+
+    # Sessions
+    database.save_session_record('s1', 'one', 100.5)
+    database.save_session_record('s1', 'two', 200.25)
+    database.save_session_record('s1:last_result', 'value', 200.25)
+    database.save_session_record('s10', 'other', 50.0)
+    # '_' is a LIKE wildcard and occurs in token_urlsafe ids
+    database.save_session_record('s_2', 'three', 300.0)
+    database.save_session_record('s_2:last_result', 'value', 300.0)
+    database.save_session_record('sx2:last_result', 'other', 50.0)
+    check(backend, 'session upsert', database.get_session_record('s1') == ('two', 200.25))
+    database.delete_session_records('s1')
+    check(backend, 'session delete', database.get_session_record('s1') is None and
+          database.get_session_record('s1:last_result') is None)
+    check(backend, 'session delete keeps other ids', database.get_session_record('s10') == ('other', 50.0))
+    database.delete_session_records('s_2')
+    check(backend, 'session delete with _ in the id', database.get_session_record('s_2') is None and
+          database.get_session_record('s_2:last_result') is None and
+          database.get_session_record('sx2:last_result') == ('other', 50.0))
+    database.purge_expired_sessions(60.0)
+    check(backend, 'session purge', database.get_session_record('s10') is None and
+          database.get_session_record('sx2:last_result') is None)
+
+    # Responses: per-row, reserved-id batch (replayed), bulk
+    single = make_entries(rng, options, [alice], 3)
+    single_ids = [database.save_screening_response(alice, e['responses'], e['risk_result'], e['routing'])
+                  for e in single]
+    stored = database.get_screening_response(single_ids[0])
+    check(backend, 'get_screening_response', stored['responses'] == single[0]['responses'] and
+          stored['risk_result'] == single[0]['risk_result'] and stored['routing'] == single[0]['routing'])
+
+    batch = make_entries(rng, options, [alice, bob], 50)
+    for entry, response_id in zip(batch, database.reserve_response_ids(len(batch))):
+        entry['id'] = response_id
+    check(backend, 'save_screening_responses', database.save_screening_responses(batch) == len(batch))
+    check(backend, 'replay is skipped', database.save_screening_responses(batch) == 0)
+
+    bulk = make_entries(rng, options, [alice, bob], rows)
+    bulk_ids = database.insert_screening_responses(bulk)
+    check(backend, 'insert_screening_responses ids', len(set(bulk_ids)) == rows)
+    check(backend, 'bulk rows readable', database.get_screening_response(bulk_ids[-1])['responses'] ==
+          bulk[-1]['responses'])
+    results['ids'] = single_ids + [e['id'] for e in batch] + bulk_ids
+
+    # History pages, newest first with ties broken by id
+    pages = []
+    page, before = database.get_user_screening_page(bob, 7)
+    pages.extend(page)
+    while before is not None:
+        page, before = database.get_user_screening_page(bob, 7, before)
+        pages.extend(page)
+    keys = [(entry['created_at'], entry['id']) for entry in pages]
+    check(backend, 'history order', keys == sorted(keys, reverse=True))
+    check(backend, 'history complete', len(pages) == database.get_user_stats(bob)['total_screenings'])
+    check(backend, 'latest screening', database.get_latest_screening(bob)['id'] == pages[0]['id'])
+    results['history'] = pages
+
+    # Export stream
+    exported = [
+        (row['id'], row['created_at'], row['classification'])
+        for chunk in database.iter_screening_response_chunks('2024-03-01', '2024-03-31', 'HIGH_RISK', 25)
+        for row in chunk
+    ]
+    check(backend, 'export filter', all(created.startswith('2024-03') and classification == 'HIGH_RISK'
+                                        for _, created, classification in exported))
+    check(backend, 'export order', exported == sorted(exported, key=lambda row: (row[1], row[0])))
+    results['export'] = exported
+
+    # Analytics aggregates
+    check(backend, 'counters consistent', database.verify_analytics_counters() == [])
+    check(backend, 'cube consistent', database.verify_analytics_cube() == [])
+    check(backend, 'rollup consistent', database.verify_analytics_rollup() == [])
+    results['counters'] = database.get_analytics_counters()
+    results['cube'] = database.query_analytics_cube(['classification', 'day'], end='2025-12-31')
+    results['trend_week'] = database.query_analytics_trend('week', '2024-01-01', '2024-06-30')
+    database.compact_analytics_rollup('2025-01-15')
+    check(backend, 'rollup consistent after compaction', database.verify_analytics_rollup() == [])
+    results['trend_month'] = database.query_analytics_trend('month', end='2025-12-31')
+
+    # Re-scoring helpers
+    scanned = sum(len(chunk) for chunk in database.iter_screening_response_batches(100))
+    check(backend, 'iter_screening_response_batches', scanned == len(results['ids']))
+    changed = dict(database.get_screening_response(bulk_ids[0])['risk_result'], classification='HIGH_RISK')
+    database.update_risk_results([(bulk_ids[0], changed)])
+    check(backend, 'update_risk_results', database.get_screening_response(bulk_ids[0])['risk_result'] == changed)
+    database.rebuild_analytics_counters()
+    database.rebuild_analytics_cube()
+    database.rebuild_analytics_rollup(compact_before='2025-01-15')
+    check(backend, 'aggregates consistent after rebuild', database.verify_analytics_counters() == [] and
+          database.verify_analytics_cube() == [] and database.verify_analytics_rollup() == [])
+    results['trend_after_rebuild'] = database.query_analytics_trend('month', end='2025-12-31')
+
+    check(backend, 'duplicate email rejected', database.create_user('alice@example.com', 'x') is None)
+    return results
+
+
+def time_inserts(rows):
+    """Return (per-row inserts/sec, bulk inserts/sec)"""
+    rng = random.Random(5)
+    options = load_answer_options()
+    user_id = database.create_user('timing@example.com', 'pw')
+
+    entries = make_entries(rng, options, [user_id], min(rows, 500))
+    started = time.perf_counter()
+    for e in entries:
+        database.save_screening_response(user_id, e['responses'], e['risk_result'], e['routing'])
+    per_row = len(entries) / (time.perf_counter() - started)
+
+    entries = make_entries(rng, options, [user_id], rows)
+    started = time.perf_counter()
+    database.insert_screening_responses(entries)
+    bulk = rows / (time.perf_counter() - started)
+    return per_row, bulk
+
+
+def scratch_postgres(url):
+    """Create an empty database on the server at url; return (its URL, drop function)"""
+    import psycopg
+
+    name = f'pmh_conformance_{secrets.token_hex(4)}'
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute(f'CREATE DATABASE {name}')
+
+    def drop():
+        database.close_pool()
+        with psycopg.connect(url, autocommit=True) as conn:
+            conn.execute(f'DROP DATABASE IF EXISTS {name} WITH (FORCE)')
+
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(path=f'/{name}')), drop
+
+
+def postgres_url(args):
+    """URL of a PostgreSQL server to test against, or None with the reason"""
+    if args.postgres_url:
+        return args.postgres_url, None
+    try:
+        import pgserver
+    except ImportError:
+        return None, 'no --postgres-url and pgserver is not installed'
+    server = pgserver.get_server(tempfile.mkdtemp(prefix='pmh-pg-'), cleanup_mode='delete')
+    return server.get_uri(), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--postgres-url', help='Server to create a scratch database on')
+    parser.add_argument('--rows', type=int, default=2000, help='Rows in the bulk insert')
+    parser.add_argument('--skip-postgres', action='store_true', help='Only check SQLite')
+    parser.add_argument('--checks-only', action='store_true', help='Skip the insert timing')
+    args = parser.parse_args()
+
+    # name: setup() returning (database url, cleanup function or None)
+    backends = {'sqlite': lambda: (temp_database(), None)}
+    if not args.skip_postgres:
+        url, reason = postgres_url(args)
+        if url is None:
+            print(f'postgresql: unavailable ({reason}); pass --skip-postgres to check SQLite only')
+            sys.exit(1)
+        else:
+            backends['postgresql'] = lambda: scratch_postgres(url)
+
+    results = {}
+    header = f"{'backend':<11} {'checks':>7}"
+    print(header if args.checks_only else f"{header} {'row inserts/sec':>16} {'bulk inserts/sec':>17}")
+    for backend, setup in backends.items():
+        target, cleanup = setup()
+        database.close_pool()
+        database.configure_database(target)
+        try:
+            before = len(failures)
+            results[backend] = json.loads(json.dumps(exercise(backend, args.rows), default=str))
+            status = 'ok' if len(failures) == before else 'FAILED'
+            if args.checks_only:
+                print(f'{backend:<11} {status:>7}')
+            else:
+                per_row, bulk = time_inserts(args.rows)
+                print(f'{backend:<11} {status:>7} {per_row:>16.0f} {bulk:>17.0f}')
+        finally:
+            database.close_pool()
+            if cleanup:
+                cleanup()
+
+    reference_name, reference = next(iter(results.items()))
+    for backend, result in results.items():
+        for key in reference:
+            check(backend, f'{key} matches {reference_name}', result.get(key) == reference[key])
+
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        sys.exit(1)
+    print(f"All checks passed on {', '.join(results)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Traffic-mix load benchmark for the screening flow
+
+Builds the app against a temporary database and runs N virtual users, each
+with its own Flask test client. Every user registers and logs in, then sends
+requests drawn from a weighted mix of:
+    register     POST /register with a new account
+    login        POST /login
+    questions    GET /api/questions
+    submit       POST /api/submit with random answers from questions_config.json
+    analytics    GET /api/analytics
+    profile      GET /profile
+Reports overall throughput, per-action p50/p95/p99 latency of the requests
+that got the expected response, the 503s from an overloaded hashing pool and
+other unexpected responses (a failed login also redirects, so redirects are
+checked by Location), and how much the database file grew per stored
+submission. A run with any overloaded or unexpected response exits 1 without
+saving or comparing a baseline.
+
+The default of 4 users never has more hashes in flight than the default
+hashing pool accepts (four per CPU), so its latencies are those of served
+requests rather than of fast 503s.
+
+Usage:
+    python -m benchmarks.traffic [--users 4] [--requests 200] [--mix submit=40,questions=30,...]
+    python -m benchmarks.traffic --save-baseline main       # record
+    python -m benchmarks.traffic --compare main             # exit 1 on regressions
+"""
+
+import argparse
+import itertools
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.common import (
+    add_baseline_arguments, database_size, handle_baseline_arguments, load_answer_options,
+    percentile, random_responses, temp_database
+)
+
+# action: default weight
+MIX = {
+    'register': 2,
+    'login': 5,
+    'questions': 25,
+    'submit': 30,
+    'analytics': 20,
+    'profile': 18,
+}
+
+PASSWORD = 'benchmark-password'
+
+_emails = itertools.count()
+
+
+def new_email():
+    return f'traffic-{next(_emails)}@example.com'
+
+
+def register(client, email):
+    return client.post('/register', data={
+        'email': email, 'password': PASSWORD, 'confirm_password': PASSWORD, 'first_name': 'Load'
+    })
+
+
+def login(client, email):
+    return client.post('/login', data={'email': email, 'password': PASSWORD})
+
+
+# action: (function(client, user, rng, options) -> response, expected status, expected redirect path)
+ACTIONS = {
+    'register': (lambda client, user, rng, options: register(client, new_email()), 302, '/login'),
+    'login': (lambda client, user, rng, options: login(client, user), 302, '/'),
+    'questions': (lambda client, user, rng, options: client.get('/api/questions'), 200, None),
+    'submit': (lambda client, user, rng, options:
+               client.post('/api/submit', json={'responses': random_responses(rng, options)}), 200, None),
+    'analytics': (lambda client, user, rng, options: client.get('/api/analytics'), 200, None),
+    'profile': (lambda client, user, rng, options: client.get('/profile'), 200, None),
+}
+
+
+def outcome(response, expected, location):
+    """'ok', 'overloaded' (503 from the hashing pool) or 'unexpected'"""
+    if response.status_code == 503:
+        return 'overloaded'
+    if response.status_code != expected:
+        return 'unexpected'
+    # Failed logins and registrations redirect too, back to their own form
+    if location and urlsplit(response.headers.get('Location', '')).path != location:
+        return 'unexpected'
+    return 'ok'
+
+
+def parse_mix(text):
+    """'submit=50,questions=50' -> {'submit': 50, 'questions': 50}"""
+    mix = {}
+    for part in filter(None, text.split(',')):
+        action, _, weight = part.partition('=')
+        if action not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"Unknown action {action!r}; use {', '.join(ACTIONS)}")
+        mix[action] = float(weight or 1)
+    return mix
+
+
+def run(app, users, requests_per_user, mix, seed):
+    """
+    Return ({action: sorted latencies of expected responses},
+    {action: {'overloaded': n, 'unexpected': n}}, elapsed seconds)
+    """
+    options = load_answer_options()
+    actions = list(mix)
+    weights = [mix[action] for action in actions]
+    latencies = {action: [] for action in actions}
+    failures = {action: {'overloaded': 0, 'unexpected': 0} for action in actions}
+    lock = threading.Lock()
+
+    # Every user starts with an account and a logged-in session
+    clients = []
+    for _ in range(users):
+        client = app.test_client()
+        email = new_email()
+        for action, response in [('register', register(client, email)), ('login', login(client, email))]:
+            _, expected, location = ACTIONS[action]
+            if outcome(response, expected, location) != 'ok':
+                raise SystemExit(f'Setting up user {email}: {action} returned {response.status_code} '
+                                 f"to {response.headers.get('Location')}")
+        clients.append((client, email))
+
+    def user_loop(client, email, rng):
+        timings = []
+        for action in rng.choices(actions, weights, k=requests_per_user):
+            request, expected, location = ACTIONS[action]
+            started = time.perf_counter()
+            response = request(client, email, rng, options)
+            timings.append((action, time.perf_counter() - started, outcome(response, expected, location)))
+        with lock:
+            for action, elapsed, result in timings:
+                if result == 'ok':
+                    latencies[action].append(elapsed)
+                else:
+                    failures[action][result] += 1
+
+    threads = [
+        threading.Thread(target=user_loop, args=(client, email, random.Random(seed + n)))
+        for n, (client, email) in enumerate(clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    for values in latencies.values():
+        values.sort()
+    return latencies, failures, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=4, help='Concurrent virtual users (threads)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per user')
+    parser.add_argument('--mix', type=parse_mix, default=MIX, help='Weights, e.g. submit=40,questions=30')
+    parser.add_argument('--hashing', choices=['inline', 'pool'], default='pool')
+    parser.add_argument('--seed', type=int, default=1)
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    path = temp_database()
+    import app as app_module
+
+    app = app_module.create_app({'HASHING_POOL': args.hashing == 'pool'})
+    # Both sizes are taken after a checkpoint, so init_db's WAL writes count as before
+    size_before = database_size(path)
+
+    latencies, failures, elapsed = run(app, args.users, args.requests, args.mix, args.seed)
+
+    growth = database_size(path) - size_before
+    submits = len(latencies.get('submit', []))
+    total = sum(len(values) for values in latencies.values())
+    overloaded = sum(counts['overloaded'] for counts in failures.values())
+    unexpected = sum(counts['unexpected'] for counts in failures.values())
+
+    # Latencies cover expected responses only; 503s and other failures are counted apart
+    print(f"{'action':<10} {'ok':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'503':>5} {'bad':>5}")
+    metrics = {'requests_per_sec': total / elapsed}
+    for action, values in latencies.items():
+        counts = failures[action]
+        if not values and not any(counts.values()):
+            continue
+        p50, p95, p99 = (percentile(values, pct) * 1000 for pct in (50, 95, 99))
+        print(f"{action:<10} {len(values):>8} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} "
+              f"{counts['overloaded']:>5} {counts['unexpected']:>5}")
+        # p99 of a few hundred samples is too noisy to compare against a baseline
+        metrics.update({f'{action}_p50_ms': p50, f'{action}_p95_ms': p95})
+
+    print(f'\n{total} expected responses from {args.users} users in {elapsed:.1f}s: '
+          f'{total / elapsed:,.0f} requests/sec')
+    print(f'Database grew {growth / 1024:,.0f} KiB', end='')
+    if submits:
+        metrics['db_bytes_per_submit'] = growth / submits
+        print(f' ({growth / submits:,.0f} bytes per submission)')
+    else:
+        print()
+
+    if args.hashing == 'pool':
+        app_module._hasher.shutdown()
+
+    # Numbers from a run with failures are not comparable, so they are neither saved nor compared
+    if overloaded or unexpected:
+        raise SystemExit(f'{overloaded} requests got 503 from the hashing pool and {unexpected} '
+                         f'an unexpected response; baseline not saved or compared')
+    handle_baseline_arguments(args, metrics)
+
+
+if __name__ == '__main__':
+    main()
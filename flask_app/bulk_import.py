@@ -0,0 +1,172 @@
+"""
+Bulk import of paper/offline screenings
+
+Input is a CSV file with one record per row and one column per question,
+named by the Question_ID column of questions_simple.csv (PHQ2_Q1, BPG_MH, ...).
+Cells hold either the option value from questions_config.json ("2", "Yes") or
+its label ("Several days"); blank means unanswered and "NA" or "Prefer not to
+answer" is stored as "NA". Optional columns:
+    created_at   YYYY-MM-DD or YYYY-MM-DD HH:MM:SS (UTC) the screening was taken
+    user_email   owner of the record (CLI only; the API imports for the caller)
+
+Records are validated one by one; invalid ones are reported with their line
+number and skipped. Valid records are scored with the batch scorer and
+inserted chunk_size at a time, each chunk in a single transaction.
+"""
+
+import csv
+import io
+from datetime import datetime, timezone
+
+from database import get_user_by_email, insert_screening_responses
+from scoring import check_phq2_answers, determine_routing, encode_responses, score_batch
+
+UNANSWERED = 'NA'
+
+
+class ImportSchema:
+    """Accepted answers per question, derived from the questions config"""
+
+    def __init__(self, config):
+        self.question_ids = []
+        self.required = set()
+        self.answers = {}
+        self.display_conditions = {}
+
+        for section in config['sections']:
+            for question in section['questions']:
+                question_id = question['question_id']
+                self.question_ids.append(question_id)
+                if question.get('required'):
+                    self.required.add(question_id)
+
+                # Option values and labels (case-insensitive) map to the value the screening page submits
+                accepted = {UNANSWERED.lower(): UNANSWERED}
+                for option in question['response_options']:
+                    answer = UNANSWERED if option['value'] is None else str(option['value'])
+                    accepted[answer.lower()] = answer
+                    accepted[option['label'].strip().lower()] = answer
+                self.answers[question_id] = accepted
+
+                display = question.get('display_condition')
+                if display:
+                    self.display_conditions[question_id] = (display['depends_on'], str(display['show_if_value']))
+
+    def check_header(self, fieldnames, allow_user_column):
+        """Raise ValueError for a header the importer cannot use"""
+        if not fieldnames:
+            raise ValueError('The file is empty')
+        allowed = set(self.question_ids) | {'created_at'}
+        if allow_user_column:
+            allowed.add('user_email')
+        unknown = [name for name in fieldnames if name not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        missing = sorted(self.required - set(fieldnames))
+        if missing:
+            raise ValueError(f"Missing required question columns: {', '.join(missing)}")
+
+    def parse(self, row):
+        """Return (responses, errors) for one CSV row"""
+        responses = {}
+        errors = []
+        for question_id in self.question_ids:
+            cell = (row.get(question_id) or '').strip()
+            if not cell:
+                if question_id in self.required:
+                    errors.append(f'{question_id} is required')
+                continue
+            answer = self.answers[question_id].get(cell.lower())
+            if answer is None:
+                errors.append(f'{question_id}: {cell!r} is not one of the response options')
+            else:
+                responses[question_id] = answer
+
+        for question_id, (depends_on, show_if) in self.display_conditions.items():
+            if question_id in responses and responses.get(depends_on) != show_if:
+                errors.append(f'{question_id} is only asked when {depends_on} is {show_if}')
+
+        # Option values come from the config; make sure the scorers accept them
+        phq2_error = check_phq2_answers(responses)
+        if phq2_error:
+            errors.append(phq2_error)
+
+        return responses, errors
+
+
+def _parse_created_at(value):
+    value = (value or '').strip()
+    if not value:
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            pass
+    raise ValueError(f'created_at {value!r} is not YYYY-MM-DD or YYYY-MM-DD HH:MM:SS')
+
+
+def _flush(pending, report):
+    """Score, route and insert one chunk of validated records"""
+    scores = score_batch(encode_responses([record['responses'] for record in pending]))
+
+    routes = {}
+    for row, record in enumerate(pending):
+        record['risk_result'] = scores.risk_result(row)
+        key = (record['responses'].get('BPG_TALK'), record['responses'].get('FLU_SRC'))
+        if key not in routes:
+            routes[key] = determine_routing(*key)
+        record['routing'] = routes[key]
+
+    report['ids'].extend(insert_screening_responses(pending))
+    report['imported'] += len(pending)
+    pending.clear()
+
+
+def import_records(text, config, user_id=None, allow_user_column=False, chunk_size=500):
+    """
+    Import screenings from CSV text
+    Records belong to user_id unless allow_user_column is set and a row names a user_email.
+    Returns {'rows', 'imported', 'ids', 'errors': [{'line', 'errors'}]}; raises
+    ValueError if the header itself is unusable.
+    """
+    schema = ImportSchema(config)
+    reader = csv.DictReader(io.StringIO(text))
+    schema.check_header(reader.fieldnames, allow_user_column)
+
+    report = {'rows': 0, 'imported': 0, 'ids': [], 'errors': []}
+    users = {}
+    pending = []
+
+    for row in reader:
+        report['rows'] += 1
+        responses, errors = schema.parse(row)
+
+        try:
+            created_at = _parse_created_at(row.get('created_at'))
+        except ValueError as e:
+            errors.append(str(e))
+
+        owner = user_id
+        email = (row.get('user_email') or '').strip() if allow_user_column else ''
+        if email:
+            if email not in users:
+                user = get_user_by_email(email)
+                users[email] = user['id'] if user else None
+            owner = users[email]
+            if owner is None:
+                errors.append(f'No user with email {email}')
+        elif owner is None:
+            errors.append('No user for this record')
+
+        if errors:
+            report['errors'].append({'line': reader.line_num, 'errors': errors})
+            continue
+
+        pending.append({'user_id': owner, 'responses': responses, 'created_at': created_at})
+        if len(pending) >= chunk_size:
+            _flush(pending, report)
+
+    if pending:
+        _flush(pending, report)
+    return report
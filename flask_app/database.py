@@ -2,28 +2,95 @@
 Database models and setup for user authentication and data storage
 """
 
-import sqlite3
+import os
+import threading
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 import json
+from baseline_data import response_counter_keys, count_responses
+from hashing import INLINE_HASHER, needs_rehash
+from storage import open_storage
 
+# A SQLite file path (or sqlite:///path), or a postgresql:// URL; see storage.py
 DATABASE = 'mental_health_screening.db'
 
+# Connection pool settings. POOL_SIZE = 0 disables pooling (one connection per call).
+POOL_SIZE = 8
+
+# SQLite connection settings
+BUSY_TIMEOUT_SECONDS = 5.0
+STATEMENT_CACHE_SIZE = 256
+JOURNAL_MODE = 'WAL'
+AUTO_VACUUM = 'INCREMENTAL'          # lets the retention job hand freed pages back (storage.reclaim_space)
+CONNECTION_PRAGMAS = [
+    'PRAGMA synchronous = NORMAL',   # safe with WAL, avoids an fsync per commit
+    'PRAGMA cache_size = -16000',    # 16 MB page cache per connection
+    'PRAGMA temp_store = MEMORY',
+]
+
+
+# ============================================================================
+# CONNECTIONS
+# ============================================================================
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def configure_database(url):
+    """Point every function in this module at another database"""
+    global DATABASE
+    DATABASE = url
+
+
+def get_storage():
+    """Return the storage backend for DATABASE, reopening it after a fork or a change of DATABASE"""
+    global _storage
+    storage = _storage
+    if storage is None or storage.url != DATABASE or storage.pid != os.getpid():
+        with _storage_lock:
+            storage = _storage
+            if storage is None or storage.url != DATABASE or storage.pid != os.getpid():
+                if storage is not None and storage.pid == os.getpid():
+                    storage.close()
+                storage = _storage = open_storage(
+                    DATABASE,
+                    pool_size=POOL_SIZE,
+                    journal_mode=JOURNAL_MODE,
+                    auto_vacuum=AUTO_VACUUM,
+                    pragmas=CONNECTION_PRAGMAS,
+                    busy_timeout=BUSY_TIMEOUT_SECONDS,
+                    statement_cache_size=STATEMENT_CACHE_SIZE
+                )
+    return storage
+
+
+def get_pool():
+    """Return the connection pool of the current storage backend"""
+    return get_storage().pool
+
+
+def close_pool():
+    """Close every idle pooled connection (e.g. before forking worker processes)"""
+    global _storage
+    with _storage_lock:
+        if _storage is not None and _storage.pid == os.getpid():
+            _storage.close()
+        _storage = None
+
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get a pooled database connection; conn.close() returns it to the pool"""
+    return get_storage().connect()
 
 
 def init_db():
     """Initialize database with tables"""
+    storage = get_storage()
     conn = get_db()
     cursor = conn.cursor()
 
     # Users table
-    cursor.execute('''
+    cursor.execute(storage.ddl('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             email TEXT UNIQUE NOT NULL,
@@ -33,10 +100,10 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             last_login TIMESTAMP
         )
-    ''')
+    '''))
 
     # Screening responses table
-    cursor.execute('''
+    cursor.execute(storage.ddl('''
         CREATE TABLE IF NOT EXISTS screening_responses (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -46,36 +113,237 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
+    '''))
+
+    # Analytics counters, maintained incrementally by save_screening_response
+    cursor.execute(storage.ddl('''
+        CREATE TABLE IF NOT EXISTS analytics_counters (
+            metric TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, key)
+        )
+    '''))
+
+    # Aggregate cube: response counts grouped by every breakdown dimension.
+    # Missing rule/setting values are stored as '' so they take part in the key.
+    cursor.execute(storage.ddl('''
+        CREATE TABLE IF NOT EXISTS analytics_cube (
+            classification TEXT NOT NULL,
+            rule_triggered TEXT NOT NULL,
+            phq2_total INTEGER NOT NULL,
+            setting_name TEXT NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (classification, rule_triggered, phq2_total, setting_name, day)
+        )
+    '''))
+
+    # Time-series rollup: per-bucket totals for trend charts. Buckets are days
+    # (bucket = 'YYYY-MM-DD') until compact_analytics_rollup() folds old ones
+    # into months (bucket = 'YYYY-MM-01').
+    cursor.execute(storage.ddl('''
+        CREATE TABLE IF NOT EXISTS analytics_rollup (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            high_risk INTEGER NOT NULL DEFAULT 0,
+            phq2_sum INTEGER NOT NULL DEFAULT 0,
+            phq2_0 INTEGER NOT NULL DEFAULT 0,
+            phq2_1 INTEGER NOT NULL DEFAULT 0,
+            phq2_2 INTEGER NOT NULL DEFAULT 0,
+            phq2_3 INTEGER NOT NULL DEFAULT 0,
+            phq2_4 INTEGER NOT NULL DEFAULT 0,
+            phq2_5 INTEGER NOT NULL DEFAULT 0,
+            phq2_6 INTEGER NOT NULL DEFAULT 0,
+            flagged INTEGER NOT NULL DEFAULT 0,
+            lifestyle_risk INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, granularity)
+        )
+    '''))
+
+    # Archive segments written by retention.py: one row per gzip file of old
+    # responses, with the aggregates those responses contributed (as JSON)
+    cursor.execute(storage.ddl('''
+        CREATE TABLE IF NOT EXISTS response_archives (
+            month TEXT NOT NULL,
+            part INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            aggregates TEXT NOT NULL,
+            status TEXT NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (month, part)
+        )
+    '''))
+
+    # Server-side session data; the cookie only holds the id
+    cursor.execute(storage.ddl('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    '''))
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+
+    conn.commit()
+    conn.close()
+
+    migrate_db()
+
+    conn = get_db()
+    cursor = conn.cursor()
+
+    # Backfill aggregates for databases created before the aggregate tables existed
+    cursor.execute('SELECT COUNT(*) FROM analytics_counters')
+    has_counters = cursor.fetchone()[0] > 0
+    cursor.execute('SELECT COUNT(*) FROM analytics_cube')
+    has_cube = cursor.fetchone()[0] > 0
+    cursor.execute('SELECT COUNT(*) FROM analytics_rollup')
+    has_rollup = cursor.fetchone()[0] > 0
+    cursor.execute('SELECT COUNT(*) FROM screening_responses')
+    has_responses = cursor.fetchone()[0] > 0
+    conn.close()
+
+    if has_responses and not has_counters:
+        rebuild_analytics_counters()
+    if has_responses and not has_cube:
+        rebuild_analytics_cube()
+    if has_responses and not has_rollup:
+        rebuild_analytics_rollup()
+
+
+# ============================================================================
+# SCHEMA MIGRATIONS
+# ============================================================================
+
+# Rows per transaction when backfilling existing data during a migration
+BACKFILL_BATCH_SIZE = 500
+
+
+def _add_columns(cursor, table, columns):
+    """Add any of the (name, type) columns the table does not have yet"""
+    existing = get_storage().table_columns(cursor, table)
+    for name, column_type in columns:
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+
+def _migrate_scoring_columns(conn):
+    """Promote the scoring fields out of the JSON blobs into typed, indexed columns"""
+    cursor = conn.cursor()
+    _add_columns(cursor, 'screening_responses', [
+        ('classification', 'TEXT'),
+        ('rule_triggered', 'TEXT'),
+        ('phq2_total', 'INTEGER'),
+        ('high_risk_flags', 'INTEGER'),
+        ('lifestyle_risk', 'INTEGER'),
+        ('setting_name', 'TEXT'),
+        ('existing_provider', 'INTEGER')
+    ])
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_screening_responses_user_created
+        ON screening_responses (user_id, created_at)
     ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_screening_responses_created
+        ON screening_responses (created_at)
+    ''')
+    conn.commit()
 
+    # Backfill in small batches so writers are never blocked for long
+    last_id = 0
+    while True:
+        cursor.execute('''
+            SELECT id, risk_result, routing FROM screening_responses
+            WHERE id > ? AND classification IS NULL
+            ORDER BY id LIMIT ?
+        ''', (last_id, BACKFILL_BATCH_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        cursor.executemany('''
+            UPDATE screening_responses
+            SET classification = ?, rule_triggered = ?, phq2_total = ?, high_risk_flags = ?,
+                lifestyle_risk = ?, setting_name = ?, existing_provider = ?
+            WHERE id = ?
+        ''', [
+            _scoring_columns(json.loads(row['risk_result']), json.loads(row['routing'])) + (row['id'],)
+            for row in rows
+        ])
+        conn.commit()
+        last_id = rows[-1]['id']
+
+
+def _migrate_client_ids(conn):
+    """Client-generated ids, so a screening resent from the offline queue is stored once"""
+    cursor = conn.cursor()
+    _add_columns(cursor, 'screening_responses', [('client_id', 'TEXT')])
+    # Rows submitted without one (NULL) never conflict
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_screening_responses_client
+        ON screening_responses (user_id, client_id)
+    ''')
     conn.commit()
+
+
+# Applied in order; the schema version (PRAGMA user_version on SQLite) records the last one applied
+MIGRATIONS = [
+    (1, _migrate_scoring_columns),
+    (2, _migrate_client_ids),
+]
+
+
+def migrate_db():
+    """Apply any schema migrations newer than the database's user_version"""
+    storage = get_storage()
+    conn = get_db()
+    cursor = conn.cursor()
+
+    version = storage.get_schema_version(cursor)
+
+    for target, migration in MIGRATIONS:
+        if target > version:
+            migration(conn)
+            storage.set_schema_version(cursor, target)
+            conn.commit()
+            version = target
+
     conn.close()
+    return version
 
 
 # ============================================================================
 # USER FUNCTIONS
 # ============================================================================
 
-def create_user(email, password, first_name=None, last_name=None):
+def create_user(email, password, first_name=None, last_name=None, hasher=INLINE_HASHER):
     """Create a new user"""
-    try:
-        conn = get_db()
-        cursor = conn.cursor()
+    return insert_user(email, hasher.hash_password(password), first_name, last_name)
 
-        password_hash = generate_password_hash(password)
 
-        cursor.execute('''
-            INSERT INTO users (email, password_hash, first_name, last_name)
-            VALUES (?, ?, ?, ?)
-        ''', (email, password_hash, first_name, last_name))
+def insert_user(email, password_hash, first_name=None, last_name=None):
+    """Store a user whose password is already hashed; returns None if the email is taken"""
+    conn = get_db()
+    cursor = conn.cursor()
 
-        conn.commit()
-        user_id = cursor.lastrowid
-        conn.close()
+    cursor.execute('''
+        INSERT INTO users (email, password_hash, first_name, last_name)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id
+    ''', (email, password_hash, first_name, last_name))
+    row = cursor.fetchone()
+
+    conn.commit()
+    conn.close()
 
-        return user_id
-    except sqlite3.IntegrityError:
-        return None  # User already exists
+    return row[0] if row else None  # None: user already exists
 
 
 def get_user_by_email(email):
@@ -102,14 +370,25 @@ def get_user_by_id(user_id):
     return dict(user) if user else None
 
 
-def verify_password(email, password):
-    """Verify user password"""
+def verify_password(email, password, hasher=INLINE_HASHER):
+    """Verify user password, upgrading the stored hash if its parameters are outdated"""
     user = get_user_by_email(email)
-    if user and check_password_hash(user['password_hash'], password):
+    if user and hasher.check_password(user['password_hash'], password):
+        if needs_rehash(user['password_hash']):
+            user['password_hash'] = hasher.hash_password(password)
+            update_password_hash(user['id'], user['password_hash'])
         return user
     return None
 
 
+def update_password_hash(user_id, password_hash):
+    """Replace a user's stored password hash"""
+    conn = get_db()
+    conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
+    conn.commit()
+    conn.close()
+
+
 def update_last_login(user_id):
     """Update user's last login timestamp"""
     conn = get_db()
@@ -125,73 +404,409 @@ def update_last_login(user_id):
     conn.close()
 
 
+# ============================================================================
+# SESSION FUNCTIONS
+# ============================================================================
+
+def get_session_record(key):
+    """Return (data, expires_at) for a session key, or None"""
+    conn = get_db()
+    row = conn.execute('SELECT data, expires_at FROM sessions WHERE id = ?', (key,)).fetchone()
+    conn.close()
+    return (row['data'], row['expires_at']) if row else None
+
+
+def save_session_record(key, data, expires_at):
+    """Insert or replace a session key"""
+    conn = get_db()
+    conn.execute('''
+        INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+    ''', (key, data, expires_at))
+    conn.commit()
+    conn.close()
+
+
+def delete_session_records(sid):
+    """Delete a session and the values stored under '<sid>:<name>'"""
+    conn = get_db()
+    # An exact prefix match: a range on id depends on the collation (PostgreSQL
+    # locales ignore ':'), and LIKE would treat the '_' in token_urlsafe ids as a wildcard
+    prefix = sid + ':'
+    conn.execute('DELETE FROM sessions WHERE id = ? OR substr(id, 1, ?) = ?', (sid, len(prefix), prefix))
+    conn.commit()
+    conn.close()
+
+
+def purge_expired_sessions(now):
+    """Delete session keys that expired before now (epoch seconds)"""
+    conn = get_db()
+    conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+    conn.commit()
+    conn.close()
+
+
 # ============================================================================
 # SCREENING RESPONSE FUNCTIONS
 # ============================================================================
 
+def _insert_screening_response(cursor, user_id, responses, risk_result, routing,
+                               response_id=None, created_at=None, client_id=None):
+    """
+    Insert one response and update the analytics aggregates on the same cursor
+    With an explicit response_id, or a client_id the user already submitted, the
+    existing row is left alone; returns None in that case
+    """
+    values = (
+        user_id,
+        json.dumps(responses),
+        json.dumps(risk_result),
+        json.dumps(routing),
+        created_at,
+        client_id
+    ) + _scoring_columns(risk_result, routing)
+
+    # Without an explicit id the database assigns the next one
+    id_column, id_value = ('id, ', '?, ') if response_id is not None else ('', '')
+    if response_id is not None:
+        values = (response_id,) + values
+
+    cursor.execute(f'''
+        INSERT INTO screening_responses (
+            {id_column}user_id, responses, risk_result, routing, created_at, client_id,
+            classification, rule_triggered, phq2_total, high_risk_flags,
+            lifestyle_risk, setting_name, existing_provider
+        )
+        VALUES ({id_value}?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+        RETURNING id
+    ''', values)
+
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    response_id = row[0]
+
+    # Update analytics aggregates in the same transaction
+    _increment_analytics_counters(cursor, response_counter_keys({
+        'responses': responses,
+        'risk_result': risk_result,
+        'routing': routing
+    }))
+    _increment_analytics_cube(cursor, response_id, risk_result, routing)
+    _increment_analytics_rollup(cursor, response_id)
+
+    return response_id
+
+
 def save_screening_response(user_id, responses, risk_result, routing):
     """Save a screening response for a user"""
     conn = get_db()
     cursor = conn.cursor()
 
-    cursor.execute('''
-        INSERT INTO screening_responses (user_id, responses, risk_result, routing)
-        VALUES (?, ?, ?, ?)
-    ''', (
-        user_id,
-        json.dumps(responses),
-        json.dumps(risk_result),
-        json.dumps(routing)
-    ))
+    response_id = _insert_screening_response(cursor, user_id, responses, risk_result, routing)
 
     conn.commit()
-    response_id = cursor.lastrowid
     conn.close()
 
     return response_id
 
 
-def get_user_screening_history(user_id):
-    """Get all screening responses for a user"""
+def save_screening_responses(entries):
+    """
+    Save many screening responses in a single transaction
+    Each entry is a dict with user_id, responses, risk_result, routing and optionally
+    id (pre-allocated with reserve_response_ids) and created_at. Entries whose id
+    already exists are skipped, so replaying the same batch is harmless.
+    Returns the number of rows inserted.
+    """
     conn = get_db()
     cursor = conn.cursor()
 
-    cursor.execute('''
-        SELECT * FROM screening_responses
-        WHERE user_id = ?
-        ORDER BY created_at DESC
-    ''', (user_id,))
+    inserted = 0
+    for entry in entries:
+        response_id = _insert_screening_response(
+            cursor,
+            entry['user_id'],
+            entry['responses'],
+            entry['risk_result'],
+            entry['routing'],
+            response_id=entry.get('id'),
+            created_at=entry.get('created_at')
+        )
+        if response_id is not None:
+            inserted += 1
+
+    conn.commit()
+    conn.close()
+
+    return inserted
+
 
+def save_client_screening_responses(user_id, entries):
+    """
+    Save screenings submitted with client-generated ids, in a single transaction
+    Each entry is a dict with client_id, responses, risk_result, routing and
+    created_at. Entries whose client_id the user already submitted are skipped,
+    so a client can resend a batch whose reply it never got.
+    Returns the client_ids that were inserted.
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+
+    inserted = []
+    for entry in entries:
+        response_id = _insert_screening_response(
+            cursor,
+            user_id,
+            entry['responses'],
+            entry['risk_result'],
+            entry['routing'],
+            created_at=entry['created_at'],
+            client_id=entry['client_id']
+        )
+        if response_id is not None:
+            inserted.append(entry['client_id'])
+
+    conn.commit()
+    conn.close()
+
+    return inserted
+
+
+def get_client_screening_responses(user_id, client_ids):
+    """The user's stored responses for client_ids, as {client_id: {id, responses, risk_result, routing}}"""
+    if not client_ids:
+        return {}
+    conn = get_db()
+    cursor = conn.cursor()
+    placeholders = ', '.join('?' for _ in client_ids)
+    cursor.execute(f'''
+        SELECT id, client_id, responses, risk_result, routing FROM screening_responses
+        WHERE user_id = ? AND client_id IN ({placeholders})
+    ''', [user_id, *client_ids])
+    rows = cursor.fetchall()
+    conn.close()
+
+    return {
+        row['client_id']: {
+            'id': row['id'],
+            'responses': json.loads(row['responses']),
+            'risk_result': json.loads(row['risk_result']),
+            'routing': json.loads(row['routing'])
+        }
+        for row in rows
+    }
+
+
+def insert_screening_responses(entries):
+    """
+    Insert a chunk of new responses in one transaction, as a bulk copy
+    Each entry is a dict with user_id, responses, risk_result, routing and created_at
+    ('YYYY-MM-DD HH:MM:SS', UTC). Aggregates get one upsert per distinct cell
+    instead of one per row. Returns the new ids in entry order.
+    """
+    if not entries:
+        return []
+    ids = list(reserve_response_ids(len(entries)))
+
+    cube = {}
+    rollup = {}
+    for entry in entries:
+        risk_result, routing = entry['risk_result'], entry['routing']
+        day = entry['created_at'][:10]
+        cell = (
+            risk_result.get('classification') or '',
+            risk_result.get('rule_triggered') or '',
+            risk_result.get('phq2_total', 0),
+            routing.get('setting_name') or '',
+            day
+        )
+        cube[cell] = cube.get(cell, 0) + 1
+        totals = rollup.setdefault(day, [0] * len(ROLLUP_COLUMNS))
+        for position, value in enumerate(_rollup_values(risk_result)):
+            totals[position] += value
+
+    conn = get_db()
+    cursor = conn.cursor()
+
+    get_storage().copy_rows(cursor, 'screening_responses', RESPONSE_COLUMNS, [
+        (
+            response_id,
+            entry['user_id'],
+            json.dumps(entry['responses']),
+            json.dumps(entry['risk_result']),
+            json.dumps(entry['routing']),
+            entry['created_at'],
+            entry.get('client_id')
+        ) + _scoring_columns(entry['risk_result'], entry['routing'])
+        for response_id, entry in zip(ids, entries)
+    ])
+
+    cursor.executemany('''
+        INSERT INTO analytics_counters (metric, key, count)
+        VALUES (?, ?, ?)
+        ON CONFLICT (metric, key)
+        DO UPDATE SET count = analytics_counters.count + excluded.count
+    ''', [
+        (metric, str(key), count)
+        for metric, values in count_responses(entries).items()
+        for key, count in values.items()
+    ])
+
+    cursor.executemany('''
+        INSERT INTO analytics_cube
+            (classification, rule_triggered, phq2_total, setting_name, day, count)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (classification, rule_triggered, phq2_total, setting_name, day)
+        DO UPDATE SET count = analytics_cube.count + excluded.count
+    ''', [cell + (count,) for cell, count in cube.items()])
+
+    _add_rollup_buckets(cursor, 'day', rollup)
+
+    conn.commit()
+    conn.close()
+
+    return ids
+
+
+def reserve_response_ids(count):
+    """
+    Reserve count screening_responses ids for inserts that happen later
+    Advances the id sequence, so ordinary inserts (in any process) never reuse
+    a reserved id. Returns the ids in ascending order.
+    """
+    conn = get_db()
+    ids = get_storage().reserve_ids(conn, 'screening_responses', count)
+    conn.commit()
+    conn.close()
+
+    return ids
+
+
+def _scoring_columns(risk_result, routing):
+    """Values for the typed scoring columns of screening_responses"""
+    existing_provider = routing.get('existing_provider')
+    return (
+        risk_result.get('classification'),
+        risk_result.get('rule_triggered'),
+        risk_result.get('phq2_total'),
+        risk_result.get('high_risk_flags'),
+        risk_result.get('lifestyle_risk'),
+        routing.get('setting_name'),
+        None if existing_provider is None else int(existing_provider)
+    )
+
+
+# Every screening_responses column
+RESPONSE_COLUMNS = [
+    'id', 'user_id', 'responses', 'risk_result', 'routing', 'created_at', 'client_id',
+    'classification', 'rule_triggered', 'phq2_total', 'high_risk_flags',
+    'lifestyle_risk', 'setting_name', 'existing_provider'
+]
+
+HISTORY_COLUMNS = '''
+    id, user_id, created_at, classification, rule_triggered, phq2_total,
+    high_risk_flags, lifestyle_risk, setting_name, existing_provider
+'''
+
+
+def _history_row(row):
+    """Build a history entry from the typed scoring columns"""
+    return {
+        'id': row['id'],
+        'user_id': row['user_id'],
+        'risk_result': {
+            'classification': row['classification'],
+            'rule_triggered': row['rule_triggered'],
+            'phq2_total': row['phq2_total'],
+            'high_risk_flags': row['high_risk_flags'],
+            'lifestyle_risk': row['lifestyle_risk']
+        },
+        'routing': {
+            'setting_name': row['setting_name'],
+            'existing_provider': bool(row['existing_provider'])
+        },
+        'created_at': row['created_at']
+    }
+
+
+def get_user_screening_history(user_id, limit=None, before=None):
+    """
+    Get screening responses for a user, newest first
+    Keyset pagination: pass limit, and before=(created_at, id) of the last row already shown.
+    Reads the typed scoring columns only; use get_screening_response for the full answers
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+
+    # Served by idx_screening_responses_user_created (the rowid is the implicit last key)
+    query = f'SELECT {HISTORY_COLUMNS} FROM screening_responses WHERE user_id = ?'
+    params = [user_id]
+    if before is not None:
+        query += ' AND (created_at, id) < (?, ?)'
+        params.extend(before)
+    query += ' ORDER BY created_at DESC, id DESC'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+
+    cursor.execute(query, params)
     responses = cursor.fetchall()
     conn.close()
 
-    # Parse JSON fields
-    result = []
-    for response in responses:
-        result.append({
-            'id': response['id'],
-            'user_id': response['user_id'],
-            'responses': json.loads(response['responses']),
-            'risk_result': json.loads(response['risk_result']),
-            'routing': json.loads(response['routing']),
-            'created_at': response['created_at']
-        })
+    return [_history_row(response) for response in responses]
 
-    return result
+
+def get_user_screening_page(user_id, limit, before=None):
+    """Return (entries, next_before); next_before is None on the last page"""
+    history = get_user_screening_history(user_id, limit + 1, before)
+    if len(history) <= limit:
+        return history, None
+    last = history[limit - 1]
+    return history[:limit], (last['created_at'], last['id'])
 
 
 def get_latest_screening(user_id):
     """Get user's most recent screening"""
-    history = get_user_screening_history(user_id)
+    history = get_user_screening_history(user_id, limit=1)
     return history[0] if history else None
 
 
+def get_screening_response(response_id):
+    """Get one screening response with its full answers, risk result and routing"""
+    conn = get_db()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT id, user_id, responses, risk_result, routing, created_at
+        FROM screening_responses WHERE id = ?
+    ''', (response_id,))
+    response = cursor.fetchone()
+    conn.close()
+
+    if not response:
+        return None
+
+    return {
+        'id': response['id'],
+        'user_id': response['user_id'],
+        'responses': json.loads(response['responses']),
+        'risk_result': json.loads(response['risk_result']),
+        'routing': json.loads(response['routing']),
+        'created_at': response['created_at']
+    }
+
+
 def get_all_screening_responses():
     """Get all screening responses (for analytics)"""
     conn = get_db()
     cursor = conn.cursor()
 
-    cursor.execute('SELECT * FROM screening_responses ORDER BY created_at DESC')
+    cursor.execute('''
+        SELECT created_at, responses, risk_result, routing
+        FROM screening_responses ORDER BY created_at DESC
+    ''')
     responses = cursor.fetchall()
     conn.close()
 
@@ -208,6 +823,765 @@ def get_all_screening_responses():
     return result
 
 
+EXPORT_COLUMNS = [
+    'id', 'user_id', 'created_at', 'classification', 'rule_triggered', 'phq2_total',
+    'high_risk_flags', 'lifestyle_risk', 'setting_name', 'existing_provider'
+]
+
+
+def iter_screening_response_chunks(start=None, end=None, classification=None, chunk_size=1000):
+    """
+    Yield stored responses oldest first, chunk_size rows at a time
+    Rows have EXPORT_COLUMNS plus the raw responses JSON. start/end are inclusive
+    YYYY-MM-DD days. The rows come from one statement, so the export is a
+    consistent snapshot, and only one chunk is in memory at a time.
+    """
+    storage = get_storage()
+    conditions = []
+    params = []
+    if start:
+        conditions.append('created_at >= ?')
+        params.append(start)
+    if end:
+        conditions.append(f"created_at < {storage.next_day('?')}")
+        params.append(end)
+    if classification:
+        conditions.append('classification = ?')
+        params.append(classification)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    conn = get_db()
+    try:
+        yield from storage.stream(conn, f'''
+            SELECT {', '.join(EXPORT_COLUMNS)}, responses
+            FROM screening_responses {where}
+            ORDER BY created_at, id
+        ''', params, chunk_size)
+    finally:
+        conn.close()
+
+
+def iter_screening_response_batches(batch_size=1000):
+    """Yield stored responses in id order as lists of (id, responses, risk_result)"""
+    last_id = 0
+    while True:
+        conn = get_db()
+        rows = conn.execute('''
+            SELECT id, responses, risk_result FROM screening_responses
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        conn.close()
+
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        yield [
+            (row['id'], json.loads(row['responses']), json.loads(row['risk_result']))
+            for row in rows
+        ]
+
+
+def update_risk_results(updates):
+    """Replace the stored risk result of existing responses; updates is [(id, risk_result)]"""
+    conn = get_db()
+    conn.executemany('''
+        UPDATE screening_responses
+        SET risk_result = ?, classification = ?, rule_triggered = ?,
+            phq2_total = ?, high_risk_flags = ?, lifestyle_risk = ?
+        WHERE id = ?
+    ''', [
+        (json.dumps(risk_result),) + _scoring_columns(risk_result, {})[:5] + (response_id,)
+        for response_id, risk_result in updates
+    ])
+    conn.commit()
+    conn.close()
+
+
+# ============================================================================
+# ANALYTICS COUNTER FUNCTIONS
+# ============================================================================
+
+# Rows held in memory at a time while recounting every stored response
+COUNT_CHUNK_SIZE = 1000
+
+
+def _increment_analytics_counters(cursor, keys):
+    """Add one to each (metric, key) counter"""
+    cursor.executemany('''
+        INSERT INTO analytics_counters (metric, key, count)
+        VALUES (?, ?, 1)
+        ON CONFLICT (metric, key)
+        DO UPDATE SET count = analytics_counters.count + 1
+    ''', [(metric, str(key)) for metric, key in keys])
+
+
+def _parse_counter_rows(rows):
+    """Convert (metric, key, count) rows to {metric: {key: count}}"""
+    counters = {}
+    for row in rows:
+        key = row['key']
+        if row['metric'] == 'phq2_distribution':
+            key = int(key)
+        counters.setdefault(row['metric'], {})[key] = row['count']
+    return counters
+
+
+def _count_stored_responses(conn):
+    """Recompute analytics counters from the raw screening_responses rows (read in chunks) and the archives"""
+    chunks = get_storage().stream(conn, 'SELECT responses, risk_result, routing FROM screening_responses',
+                                  (), COUNT_CHUNK_SIZE)
+    counters = count_responses(
+        {
+            'responses': json.loads(row['responses']),
+            'risk_result': json.loads(row['risk_result']),
+            'routing': json.loads(row['routing'])
+        }
+        for rows in chunks
+        for row in rows
+    )
+
+    for metric, values in _archived_aggregates(conn.cursor()).counters.items():
+        bucket = counters.setdefault(metric, {})
+        for key, count in values.items():
+            bucket[key] = bucket.get(key, 0) + count
+    return counters
+
+
+def get_analytics_counters():
+    """Get the incrementally maintained analytics counters"""
+    conn = get_db()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT metric, key, count FROM analytics_counters')
+    counters = _parse_counter_rows(cursor.fetchall())
+
+    conn.close()
+    return counters
+
+
+def rebuild_analytics_counters():
+    """Recompute all analytics counters from the raw and archived screening responses"""
+    conn = get_db()
+    cursor = conn.cursor()
+
+    counters = _count_stored_responses(conn)
+
+    cursor.execute('DELETE FROM analytics_counters')
+    cursor.executemany('''
+        INSERT INTO analytics_counters (metric, key, count)
+        VALUES (?, ?, ?)
+    ''', [
+        (metric, str(key), count)
+        for metric, values in counters.items()
+        for key, count in values.items()
+    ])
+
+    conn.commit()
+    conn.close()
+
+    return counters
+
+
+def verify_analytics_counters():
+    """
+    Compare stored analytics counters against the raw and archived screening responses
+    Returns a list of (metric, key, stored, expected) mismatches
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+
+    expected = _count_stored_responses(conn)
+    cursor.execute('SELECT metric, key, count FROM analytics_counters')
+    stored = _parse_counter_rows(cursor.fetchall())
+
+    conn.close()
+
+    mismatches = []
+    for metric in sorted(set(expected) | set(stored)):
+        keys = set(expected.get(metric, {})) | set(stored.get(metric, {}))
+        for key in sorted(keys, key=str):
+            stored_count = stored.get(metric, {}).get(key, 0)
+            expected_count = expected.get(metric, {}).get(key, 0)
+            if stored_count != expected_count:
+                mismatches.append((metric, key, stored_count, expected_count))
+
+    return mismatches
+
+
+# ============================================================================
+# ANALYTICS CUBE FUNCTIONS
+# ============================================================================
+
+CUBE_DIMENSIONS = ['classification', 'rule_triggered', 'phq2_total', 'setting_name', 'day']
+
+
+def _increment_analytics_cube(cursor, response_id, risk_result, routing):
+    """Add one to the cube cell for a newly inserted response"""
+    cursor.execute(f'''
+        INSERT INTO analytics_cube
+            (classification, rule_triggered, phq2_total, setting_name, day, count)
+        SELECT ?, ?, ?, ?, {get_storage().day('created_at')}, 1
+        FROM screening_responses WHERE id = ?
+        ON CONFLICT (classification, rule_triggered, phq2_total, setting_name, day)
+        DO UPDATE SET count = analytics_cube.count + 1
+    ''', (
+        risk_result.get('classification') or '',
+        risk_result.get('rule_triggered') or '',
+        risk_result.get('phq2_total', 0),
+        routing.get('setting_name') or '',
+        response_id
+    ))
+
+
+def _cube_from_responses():
+    """Query computing every cube cell from the raw screening responses"""
+    return f'''
+        SELECT COALESCE(classification, '') AS classification,
+               COALESCE(rule_triggered, '') AS rule_triggered,
+               COALESCE(phq2_total, 0) AS phq2_total,
+               COALESCE(setting_name, '') AS setting_name,
+               {get_storage().day('created_at')} AS day,
+               COUNT(*) AS count
+        FROM screening_responses
+        GROUP BY 1, 2, 3, 4, 5
+    '''
+
+
+def rebuild_analytics_cube():
+    """Recompute the aggregate cube from the raw screening responses and the archived ones"""
+    conn = get_db()
+    cursor = conn.cursor()
+
+    cursor.execute('DELETE FROM analytics_cube')
+    cursor.execute('''
+        INSERT INTO analytics_cube
+            (classification, rule_triggered, phq2_total, setting_name, day, count)
+    ''' + _cube_from_responses())
+    cursor.executemany('''
+        INSERT INTO analytics_cube
+            (classification, rule_triggered, phq2_total, setting_name, day, count)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (classification, rule_triggered, phq2_total, setting_name, day)
+        DO UPDATE SET count = analytics_cube.count + excluded.count
+    ''', [cell + (count,) for cell, count in _archived_aggregates(cursor).cube.items()])
+
+    conn.commit()
+    conn.close()
+
+
+def verify_analytics_cube():
+    """
+    Compare the stored cube against the raw and archived screening responses
+    Returns a list of (cell, stored, expected) mismatches
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+
+    cursor.execute(_cube_from_responses())
+    expected = {tuple(row)[:5]: row['count'] for row in cursor.fetchall()}
+    for cell, count in _archived_aggregates(cursor).cube.items():
+        expected[cell] = expected.get(cell, 0) + count
+    cursor.execute('''
+        SELECT classification, rule_triggered, phq2_total, setting_name, day, count
+        FROM analytics_cube
+    ''')
+    stored = {tuple(row)[:5]: row['count'] for row in cursor.fetchall() if row['count']}
+
+    conn.close()
+
+    return [
+        (cell, stored.get(cell, 0), expected.get(cell, 0))
+        for cell in sorted(set(expected) | set(stored))
+        if stored.get(cell, 0) != expected.get(cell, 0)
+    ]
+
+
+def query_analytics_cube(group_by, classification=None, rule_triggered=None,
+                         phq2_total=None, setting_name=None, start=None, end=None):
+    """
+    Roll up the aggregate cube
+    group_by is a list of CUBE_DIMENSIONS; filters match exactly, start/end are
+    inclusive YYYY-MM-DD days. Returns a list of {dimension: value, 'count': n}.
+    """
+    for dimension in group_by:
+        if dimension not in CUBE_DIMENSIONS:
+            raise ValueError(f'Unknown cube dimension: {dimension}')
+
+    conditions = []
+    params = []
+    for column, value in [('classification', classification),
+                          ('rule_triggered', rule_triggered),
+                          ('phq2_total', phq2_total),
+                          ('setting_name', setting_name)]:
+        if value is not None:
+            conditions.append(f'{column} = ?')
+            params.append(value)
+    if start:
+        conditions.append('day >= ?')
+        params.append(start)
+    if end:
+        conditions.append('day <= ?')
+        params.append(end)
+
+    columns = ', '.join(group_by)
+    sql = f'SELECT {columns + ", " if group_by else ""}SUM(count) AS count FROM analytics_cube'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    if group_by:
+        sql += f' GROUP BY {columns} ORDER BY {columns}'
+
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    result = []
+    for row in rows:
+        cell = {dimension: row[dimension] if row[dimension] != '' else None for dimension in group_by}
+        cell['count'] = row['count'] or 0
+        result.append(cell)
+    return result
+
+
+# ============================================================================
+# ANALYTICS ROLLUP FUNCTIONS
+# ============================================================================
+
+ROLLUP_COLUMNS = [
+    'total', 'high_risk', 'phq2_sum',
+    'phq2_0', 'phq2_1', 'phq2_2', 'phq2_3', 'phq2_4', 'phq2_5', 'phq2_6',
+    'flagged', 'lifestyle_risk'
+]
+
+# Rollup column values computed from screening_responses rows
+_ROLLUP_FROM_RESPONSES = ''',
+    COUNT(*), COUNT(*) FILTER (WHERE classification = 'HIGH_RISK'), SUM(COALESCE(phq2_total, 0)),
+    COUNT(*) FILTER (WHERE COALESCE(phq2_total, 0) = 0), COUNT(*) FILTER (WHERE phq2_total = 1),
+    COUNT(*) FILTER (WHERE phq2_total = 2), COUNT(*) FILTER (WHERE phq2_total = 3),
+    COUNT(*) FILTER (WHERE phq2_total = 4), COUNT(*) FILTER (WHERE phq2_total = 5),
+    COUNT(*) FILTER (WHERE phq2_total = 6),
+    COUNT(*) FILTER (WHERE high_risk_flags > 0), COUNT(*) FILTER (WHERE lifestyle_risk > 0)
+'''
+
+TREND_GRANULARITIES = ['day', 'week', 'month']
+
+
+def _rollup_values(risk_result):
+    """ROLLUP_COLUMNS values for one response, as _ROLLUP_FROM_RESPONSES counts it"""
+    phq2_total = risk_result.get('phq2_total') or 0
+    histogram = [int(phq2_total == score) for score in range(7)]
+    return [
+        1,
+        int(risk_result.get('classification') == 'HIGH_RISK'),
+        phq2_total
+    ] + histogram + [
+        int((risk_result.get('high_risk_flags') or 0) > 0),
+        int((risk_result.get('lifestyle_risk') or 0) > 0)
+    ]
+
+
+def _rollup_upsert(granularity_sql):
+    columns = ', '.join(ROLLUP_COLUMNS)
+    updates = ', '.join(f'{c} = analytics_rollup.{c} + excluded.{c}' for c in ROLLUP_COLUMNS)
+    return f'''
+        INSERT INTO analytics_rollup (granularity, bucket, {columns})
+        {granularity_sql}
+        ON CONFLICT (bucket, granularity) DO UPDATE SET {updates}
+    '''
+
+
+def _add_rollup_buckets(cursor, granularity, buckets):
+    """Add {bucket: ROLLUP_COLUMNS values} to the stored buckets"""
+    placeholders = ', '.join('?' for _ in ROLLUP_COLUMNS)
+    cursor.executemany(_rollup_upsert(f'VALUES (?, ?, {placeholders})'), [
+        (granularity, bucket) + tuple(values) for bucket, values in buckets.items()
+    ])
+
+
+def _add_analytics_rollup(cursor, where, params):
+    """Add the screening_responses rows matching where to their day buckets"""
+    cursor.execute(_rollup_upsert(f'''
+        SELECT 'day', {get_storage().day('created_at')}{_ROLLUP_FROM_RESPONSES}
+        FROM screening_responses WHERE {where}
+        GROUP BY 2
+    '''), params)
+
+
+def _increment_analytics_rollup(cursor, response_id):
+    """Add a newly inserted response to its day bucket"""
+    _add_analytics_rollup(cursor, 'id = ?', (response_id,))
+
+
+def compact_analytics_rollup(before):
+    """
+    Fold day buckets of months before the month containing `before` (YYYY-MM-DD)
+    into month buckets. Responses inserted later for a compacted month land in
+    a day bucket again and are folded in by the next compaction.
+    Returns the number of day buckets folded.
+    """
+    try:
+        cutoff = datetime.strptime(before, '%Y-%m-%d').strftime('%Y-%m-01')
+    except ValueError:
+        raise ValueError(f'Invalid date: {before}')
+    sums = ', '.join(f'SUM({c})' for c in ROLLUP_COLUMNS)
+
+    conn = get_db()
+    cursor = conn.cursor()
+
+    cursor.execute(_rollup_upsert(f'''
+        SELECT 'month', {get_storage().month_start('bucket')}, {sums}
+        FROM analytics_rollup WHERE granularity = 'day' AND bucket < ?
+        GROUP BY 2
+    '''), (cutoff,))
+    cursor.execute("DELETE FROM analytics_rollup WHERE granularity = 'day' AND bucket < ?", (cutoff,))
+    folded = cursor.rowcount
+
+    conn.commit()
+    conn.close()
+
+    return folded
+
+
+def rebuild_analytics_rollup(compact_before=None):
+    """Recompute the rollup from the raw screening responses and the archived ones, then compact it"""
+    conn = get_db()
+    cursor = conn.cursor()
+
+    cursor.execute('DELETE FROM analytics_rollup')
+    _add_analytics_rollup(cursor, 'TRUE', ())
+    _add_rollup_buckets(cursor, 'day', _archived_aggregates(cursor).rollup)
+
+    conn.commit()
+    conn.close()
+
+    if compact_before:
+        compact_analytics_rollup(compact_before)
+
+
+def verify_analytics_rollup():
+    """
+    Compare the stored rollup against the raw and archived screening responses
+    Months that have been compacted are compared as a whole.
+    Returns a list of (bucket, column, stored, expected) mismatches
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+
+    cursor.execute(f'''
+        SELECT {get_storage().day('created_at')}{_ROLLUP_FROM_RESPONSES}
+        FROM screening_responses GROUP BY 1
+    ''')
+    expected_rows = cursor.fetchall()
+    cursor.execute(f"SELECT granularity, bucket, {', '.join(ROLLUP_COLUMNS)} FROM analytics_rollup")
+    stored_rows = cursor.fetchall()
+    archived = _archived_aggregates(cursor).rollup
+
+    conn.close()
+
+    compacted = {row['bucket'][:7] for row in stored_rows if row['granularity'] == 'month'}
+
+    def add(totals, day, values):
+        key = day[:7] + '-01' if day[:7] in compacted else day
+        current = totals.setdefault(key, [0] * len(ROLLUP_COLUMNS))
+        for position, value in enumerate(values):
+            current[position] += value or 0
+
+    expected = {}
+    for row in expected_rows:
+        add(expected, row[0], tuple(row)[1:])
+    for day, values in archived.items():
+        add(expected, day, values)
+    stored = {}
+    for row in stored_rows:
+        add(stored, row['bucket'], tuple(row)[2:])
+
+    zeros = [0] * len(ROLLUP_COLUMNS)
+    mismatches = []
+    for bucket in sorted(set(expected) | set(stored)):
+        for column, have, want in zip(ROLLUP_COLUMNS, stored.get(bucket, zeros), expected.get(bucket, zeros)):
+            if have != want:
+                mismatches.append((bucket, column, have, want))
+    return mismatches
+
+
+def query_analytics_trend(granularity='day', start=None, end=None):
+    """
+    Read the rollup buckets between start and end (inclusive YYYY-MM-DD days),
+    grouped into day, week (starting Monday) or month periods. Compacted months
+    have no finer resolution and appear as one period on the first of the month.
+    Returns a list of {'period', column: total, ...} in period order.
+    """
+    if granularity not in TREND_GRANULARITIES:
+        raise ValueError(f'Unknown granularity: {granularity}')
+
+    conditions = []
+    params = []
+    if start:
+        # A compacted month overlapping the range is included whole
+        conditions.append("bucket >= CASE granularity WHEN 'month' THEN ? ELSE ? END")
+        params.extend([start[:7] + '-01', start])
+    if end:
+        conditions.append('bucket <= ?')
+        params.append(end)
+
+    storage = get_storage()
+    period = {
+        'day': 'bucket',
+        'week': storage.week_start('bucket'),
+        'month': storage.month_start('bucket')
+    }[granularity]
+    sums = ', '.join(f'SUM({c}) AS {c}' for c in ROLLUP_COLUMNS)
+    sql = f"SELECT CASE granularity WHEN 'month' THEN bucket ELSE {period} END AS period, {sums} FROM analytics_rollup"
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' GROUP BY 1 ORDER BY 1'
+
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [{'period': row['period'], **{c: row[c] for c in ROLLUP_COLUMNS}} for row in rows]
+
+
+# ============================================================================
+# RESPONSE ARCHIVE FUNCTIONS
+# ============================================================================
+
+# Archive segment states: 'deleting' while its rows are being removed from
+# screening_responses, 'archived' once they are gone, 'restored' after they
+# were copied back. The aggregates of 'restored' segments are in the table again.
+ARCHIVE_STATUSES = ['deleting', 'archived', 'restored']
+
+
+class ResponseAggregates:
+    """
+    The analytics counters, cube cells and rollup day values a set of stored
+    responses contributed, kept with an archive segment so rebuilding the
+    aggregates still counts responses that have left screening_responses
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.cube = {}
+        self.rollup = {}
+
+    def add(self, row):
+        """Count one screening_responses row (RESPONSE_COLUMNS), as the rebuild queries would"""
+        for metric, key in response_counter_keys({
+            'responses': json.loads(row['responses']),
+            'risk_result': json.loads(row['risk_result']),
+            'routing': json.loads(row['routing'])
+        }):
+            bucket = self.counters.setdefault(metric, {})
+            bucket[key] = bucket.get(key, 0) + 1
+
+        day = str(row['created_at'])[:10]
+        cell = (row['classification'] or '', row['rule_triggered'] or '',
+                row['phq2_total'] or 0, row['setting_name'] or '', day)
+        self.cube[cell] = self.cube.get(cell, 0) + 1
+
+        scores = {column: row[column] for column in ('classification', 'phq2_total',
+                                                     'high_risk_flags', 'lifestyle_risk')}
+        totals = self.rollup.setdefault(day, [0] * len(ROLLUP_COLUMNS))
+        for position, value in enumerate(_rollup_values(scores)):
+            totals[position] += value
+
+    def merge(self, other):
+        for metric, values in other.counters.items():
+            bucket = self.counters.setdefault(metric, {})
+            for key, count in values.items():
+                bucket[key] = bucket.get(key, 0) + count
+        for cell, count in other.cube.items():
+            self.cube[cell] = self.cube.get(cell, 0) + count
+        for day, values in other.rollup.items():
+            totals = self.rollup.setdefault(day, [0] * len(ROLLUP_COLUMNS))
+            for position, value in enumerate(values):
+                totals[position] += value
+
+    def to_json(self):
+        return json.dumps({
+            'counters': [[metric, str(key), count]
+                         for metric, values in self.counters.items() for key, count in values.items()],
+            'cube': [list(cell) + [count] for cell, count in self.cube.items()],
+            'rollup': self.rollup
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        aggregates = cls()
+        aggregates.counters = _parse_counter_rows(
+            {'metric': metric, 'key': key, 'count': count} for metric, key, count in data['counters']
+        )
+        aggregates.cube = {tuple(cell[:5]): cell[5] for cell in data['cube']}
+        aggregates.rollup = data['rollup']
+        return aggregates
+
+
+def _archived_aggregates(cursor):
+    """Summed aggregates of the archive segments whose rows are not in screening_responses"""
+    cursor.execute("SELECT aggregates FROM response_archives WHERE status != 'restored'")
+    total = ResponseAggregates()
+    for row in cursor.fetchall():
+        total.merge(ResponseAggregates.from_json(row['aggregates']))
+    return total
+
+
+def _next_month(month):
+    """'2025-01-01' -> '2025-02-01'"""
+    year, number = int(month[:4]), int(month[5:7])
+    return f'{year + number // 12}-{number % 12 + 1:02d}-01'
+
+
+def get_archivable_months(before):
+    """
+    Months (as 'YYYY-MM-01') holding responses created before `before`, a
+    YYYY-MM-DD day, oldest first, with their row counts: [(month, rows)]
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {get_storage().month_start('created_at')} AS month, COUNT(*) AS row_count
+        FROM screening_responses WHERE created_at < ?
+        GROUP BY 1 ORDER BY 1
+    ''', (before,))
+    months = [(row['month'], row['row_count']) for row in cursor.fetchall()]
+    conn.close()
+    return months
+
+
+def iter_month_responses(month, chunk_size=1000):
+    """Yield the stored responses created in month ('YYYY-MM-01') in id order, chunk_size rows at a time"""
+    conn = get_db()
+    try:
+        yield from get_storage().stream(conn, f'''
+            SELECT {', '.join(RESPONSE_COLUMNS)} FROM screening_responses
+            WHERE created_at >= ? AND created_at < ?
+            ORDER BY id
+        ''', (month, _next_month(month)), chunk_size)
+    finally:
+        conn.close()
+
+
+def delete_screening_responses(ids, batch_size=500):
+    """
+    Delete responses by id, batch_size rows per transaction, leaving the
+    analytics aggregates as they are. Returns the number of rows deleted.
+    """
+    deleted = 0
+    for start in range(0, len(ids), batch_size):
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.executemany('DELETE FROM screening_responses WHERE id = ?',
+                           [(response_id,) for response_id in ids[start:start + batch_size]])
+        deleted += cursor.rowcount
+        conn.commit()
+        conn.close()
+    return deleted
+
+
+def restore_screening_responses(rows):
+    """
+    Put archived rows (dicts of RESPONSE_COLUMNS) back into screening_responses
+    with their original ids, in one transaction. The aggregates already count
+    them. Rows whose id is present are left alone, so a restore can be repeated.
+    Segments written before client_id existed restore it as NULL.
+    """
+    placeholders = ', '.join('?' for _ in RESPONSE_COLUMNS)
+    conn = get_db()
+    conn.executemany(f'''
+        INSERT INTO screening_responses ({', '.join(RESPONSE_COLUMNS)})
+        VALUES ({placeholders})
+        ON CONFLICT DO NOTHING
+    ''', [tuple(row.get(column) for column in RESPONSE_COLUMNS) for row in rows])
+    conn.commit()
+    conn.close()
+
+
+def add_response_archive(month, path, row_count, first_id, last_id, sha256, aggregates):
+    """Record a new segment of month in the 'deleting' state; returns its part number"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO response_archives
+            (month, part, path, row_count, first_id, last_id, sha256, aggregates, status)
+        SELECT ?, COALESCE(MAX(part), 0) + 1, ?, ?, ?, ?, ?, ?, 'deleting'
+        FROM response_archives WHERE month = ?
+        RETURNING part
+    ''', (month, path, row_count, first_id, last_id, sha256, aggregates.to_json(), month))
+    part = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return part
+
+
+def get_response_archives(month=None, status=None):
+    """Archive segments, oldest first, optionally only one month's or one status's"""
+    conditions = []
+    params = []
+    if month:
+        conditions.append('month = ?')
+        params.append(month)
+    if status:
+        conditions.append('status = ?')
+        params.append(status)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT month, part, path, row_count, first_id, last_id, sha256, status, archived_at
+        FROM response_archives {where} ORDER BY month, part
+    ''', params)
+    archives = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return archives
+
+
+def set_response_archive_status(month, part, status):
+    if status not in ARCHIVE_STATUSES:
+        raise ValueError(f'Unknown archive status: {status}')
+    conn = get_db()
+    conn.execute('UPDATE response_archives SET status = ? WHERE month = ? AND part = ?', (status, month, part))
+    conn.commit()
+    conn.close()
+
+
+def delete_response_archive(month, part):
+    conn = get_db()
+    conn.execute('DELETE FROM response_archives WHERE month = ? AND part = ?', (month, part))
+    conn.commit()
+    conn.close()
+
+
+def reclaim_response_space():
+    """
+    After deleting many responses: return free pages to the filesystem and
+    refresh the planner statistics. Returns the pages freed (None if the
+    SQLite file has auto_vacuum off; see vacuum_database)
+    """
+    storage = get_storage()
+    conn = get_db()
+    try:
+        freed = storage.reclaim_space(conn, 'screening_responses')
+        storage.analyze(conn, 'screening_responses')
+    finally:
+        conn.close()
+    return freed
+
+
+def vacuum_database():
+    """Rewrite the whole database, enabling incremental vacuum on older SQLite files"""
+    conn = get_db()
+    try:
+        get_storage().vacuum(conn)
+    finally:
+        conn.close()
+
+
 # ============================================================================
 # STATISTICS FUNCTIONS
 # ============================================================================
@@ -0,0 +1,199 @@
+"""
+Streaming export of screening responses
+
+export_chunks() reads screening_responses in fetchmany chunks and encodes each
+chunk as it goes, so memory use does not depend on the number of rows.
+
+Formats:
+    ndjson      one JSON object per line, answers nested under "responses"
+    csv         one flat row per response, one column per question
+    columnar    compact binary, see below; read it back with read_columnar()
+
+Columnar layout (all integers little-endian):
+    b'PMHCOL1\\n'                   magic
+    u32 length + JSON               schema: {"columns": [{"name", "type"}]}, type "int" or "str"
+    batches, each:
+        u32 row count (0 ends the file)
+        per column, in schema order:
+            int:  validity bitmap (1 bit per row), u8 value width (1, 2, 4
+                  or 8), one signed value per row
+            str:  u32 dictionary size, entries as u32 length + UTF-8 bytes,
+                  u8 code width (1, 2 or 4), one code per row (0 = null,
+                  n = dictionary entry n - 1)
+"""
+
+import csv
+import io
+import json
+import struct
+import sys
+from array import array
+
+from database import EXPORT_COLUMNS, iter_screening_response_chunks
+
+COLUMNAR_MAGIC = b'PMHCOL1\n'
+
+INT_COLUMNS = {'id', 'user_id', 'phq2_total', 'high_risk_flags', 'lifestyle_risk', 'existing_provider'}
+
+_CODE_TYPES = {1: 'B', 2: 'H', 4: 'I'}
+_INT_TYPES = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+
+
+def _flat_row(row, question_ids):
+    """EXPORT_COLUMNS values followed by one answer per question id"""
+    responses = json.loads(row['responses'])
+    return [row[column] for column in EXPORT_COLUMNS] + [responses.get(q) for q in question_ids]
+
+
+# ============================================================================
+# ENCODERS
+# ============================================================================
+
+def _ndjson(chunks, question_ids):
+    for rows in chunks:
+        lines = []
+        for row in rows:
+            record = {column: row[column] for column in EXPORT_COLUMNS}
+            if record['existing_provider'] is not None:
+                record['existing_provider'] = bool(record['existing_provider'])
+            record['responses'] = json.loads(row['responses'])
+            lines.append(json.dumps(record))
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _csv(chunks, question_ids):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS + question_ids)
+    for rows in chunks:
+        writer.writerows(_flat_row(row, question_ids) for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_int_column(values):
+    bitmap = 0
+    for position, value in enumerate(values):
+        if value is not None:
+            bitmap |= 1 << position
+    values = [0 if value is None else value for value in values]
+    largest = max(max(values, default=0), -min(values, default=0) - 1)
+    width = next(width for width in (1, 2, 4, 8) if largest < 1 << (8 * width - 1))
+    return (bitmap.to_bytes((len(values) + 7) // 8, 'little') + struct.pack('<B', width) +
+            _little_endian(array(_INT_TYPES[width], values)))
+
+
+def _encode_str_column(values):
+    dictionary = {}
+    codes = []
+    for value in values:
+        if value is None:
+            codes.append(0)
+        else:
+            codes.append(dictionary.setdefault(str(value), len(dictionary) + 1))
+
+    width = 1 if len(dictionary) < 0xFF else 2 if len(dictionary) < 0xFFFF else 4
+    parts = [struct.pack('<I', len(dictionary))]
+    for entry in dictionary:
+        encoded = entry.encode('utf-8')
+        parts.append(struct.pack('<I', len(encoded)))
+        parts.append(encoded)
+    parts.append(struct.pack('<B', width))
+    parts.append(_little_endian(array(_CODE_TYPES[width], codes)))
+    return b''.join(parts)
+
+
+def _columnar(chunks, question_ids):
+    names = EXPORT_COLUMNS + question_ids
+    types = ['int' if name in INT_COLUMNS else 'str' for name in names]
+    schema = json.dumps({'columns': [{'name': n, 'type': t} for n, t in zip(names, types)]}).encode('utf-8')
+    yield COLUMNAR_MAGIC + struct.pack('<I', len(schema)) + schema
+
+    for rows in chunks:
+        flat = [_flat_row(row, question_ids) for row in rows]
+        parts = [struct.pack('<I', len(flat))]
+        for index, column_type in enumerate(types):
+            values = [record[index] for record in flat]
+            parts.append(_encode_int_column(values) if column_type == 'int' else _encode_str_column(values))
+        yield b''.join(parts)
+
+    yield struct.pack('<I', 0)
+
+
+# format: (encoder, mimetype, file extension)
+FORMATS = {
+    'ndjson': (_ndjson, 'application/x-ndjson', 'ndjson'),
+    'csv': (_csv, 'text/csv', 'csv'),
+    'columnar': (_columnar, 'application/octet-stream', 'pmhcol')
+}
+
+
+def export_chunks(fmt, question_ids, start=None, end=None, classification=None, chunk_size=1000):
+    """Return an iterator of encoded byte chunks for the matching responses"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; use one of {', '.join(FORMATS)}")
+    encoder = FORMATS[fmt][0]
+    chunks = iter_screening_response_chunks(start, end, classification, chunk_size)
+    return encoder(chunks, list(question_ids))
+
+
+# ============================================================================
+# COLUMNAR READER
+# ============================================================================
+
+def _read_exact(fileobj, size):
+    data = fileobj.read(size)
+    if len(data) != size:
+        raise ValueError('Truncated columnar export')
+    return data
+
+
+def _read_array(fileobj, typecode, count):
+    values = array(typecode)
+    values.frombytes(_read_exact(fileobj, values.itemsize * count))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def read_columnar(fileobj):
+    """Yield one {column name: list of values} dict per batch of a columnar export"""
+    if _read_exact(fileobj, len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError('Not a columnar export')
+    schema_length, = struct.unpack('<I', _read_exact(fileobj, 4))
+    columns = json.loads(_read_exact(fileobj, schema_length))['columns']
+
+    while True:
+        row_count, = struct.unpack('<I', _read_exact(fileobj, 4))
+        if row_count == 0:
+            return
+
+        batch = {}
+        for column in columns:
+            if column['type'] == 'int':
+                bitmap = int.from_bytes(_read_exact(fileobj, (row_count + 7) // 8), 'little')
+                width, = struct.unpack('<B', _read_exact(fileobj, 1))
+                values = _read_array(fileobj, _INT_TYPES[width], row_count)
+                batch[column['name']] = [
+                    value if bitmap >> position & 1 else None
+                    for position, value in enumerate(values)
+                ]
+            else:
+                size, = struct.unpack('<I', _read_exact(fileobj, 4))
+                dictionary = [None]
+                for _ in range(size):
+                    length, = struct.unpack('<I', _read_exact(fileobj, 4))
+                    dictionary.append(_read_exact(fileobj, length).decode('utf-8'))
+                width, = struct.unpack('<B', _read_exact(fileobj, 1))
+                codes = _read_array(fileobj, _CODE_TYPES[width], row_count)
+                batch[column['name']] = [dictionary[code] for code in codes]
+        yield batch
@@ -0,0 +1,97 @@
+"""
+gunicorn settings for the screening app
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+Environment variables:
+    PORT                    listen port (default 5000)
+    WEB_CONCURRENCY         worker processes (default: 2 per CPU + 1)
+    GUNICORN_THREADS        threads per worker (default 4; 1 uses the sync worker)
+    GUNICORN_WORKER_CLASS   worker class; uvicorn.workers.UvicornWorker for ASGI mode (asgi.py)
+    GUNICORN_TIMEOUT        seconds before a stuck worker is killed (default 30)
+    GUNICORN_MAX_REQUESTS   recycle each worker after this many requests (default 0 = never)
+    GUNICORN_WATCH_CONFIG   seconds between checks of questions_config.json (default 2; 0 = off)
+
+The app is preloaded in the master: init_db runs once, and the questions
+config and PRAMS baseline are built once and shared copy-on-write by the
+workers. Database connections, the write-behind queue and the hashing pool
+are opened lazily in each worker.
+
+kill -HUP <master pid> reloads gracefully: new workers are forked from the
+master and the old ones finish their in-flight requests before exiting. The
+master sends itself HUP when questions_config.json changes. Code and
+environment changes need a restart.
+"""
+
+import gc
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+preload_app = True
+accesslog = '-'
+
+_watch_interval = float(os.environ.get('GUNICORN_WATCH_CONFIG', 2))
+
+
+def _flask_app(server):
+    # asgi:app wraps the Flask app
+    app = server.app.wsgi()
+    return getattr(app, 'flask_app', app)
+
+
+def _watch_questions_config(server):
+    """Send the master HUP when the questions config file changes"""
+    path = _flask_app(server).config['QUESTIONS_CONFIG']
+    last = None
+    while True:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime_ns = last
+        if last is not None and mtime_ns != last:
+            server.log.info('%s changed, reloading workers', path)
+            os.kill(os.getpid(), signal.SIGHUP)
+        last = mtime_ns
+        time.sleep(_watch_interval)
+
+
+def when_ready(server):
+    import metrics
+
+    # Snapshots left by a previous run's workers would be merged into this run's counts
+    metrics_dir = _flask_app(server).config['METRICS_DIR']
+    if metrics_dir:
+        metrics.clear_snapshots(metrics_dir)
+
+    if _watch_interval > 0:
+        threading.Thread(target=_watch_questions_config, args=(server,),
+                         name='config-watch', daemon=True).start()
+
+
+def on_reload(server):
+    # New workers inherit the master's snapshot, so bring it up to date first
+    app = _flask_app(server)
+    app.extensions['questions'].refresh()
+    # Pick up asset URLs from a build-assets run
+    app.extensions['assets'].refresh()
+
+
+def pre_fork(server, worker):
+    import database
+
+    # Connections opened by init_db must not be shared with the workers
+    database.close_pool()
+    # Keep preloaded objects out of the collector so workers don't touch (and copy) their pages
+    gc.freeze()
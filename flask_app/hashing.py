@@ -0,0 +1,126 @@
+"""
+Password hashing off the request thread
+
+scrypt is deliberately slow (~150 ms per hash), so /login and /register hand
+hashing to a process pool sized to the CPU count. At most max_pending hashes
+may be queued or running at once; beyond that HashingOverloaded is raised and
+the route answers 503 instead of piling up blocked workers.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import HASH_DURATION
+
+# Hashes whose "method" prefix differs from this are upgraded on the next login
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+
+
+def needs_rehash(password_hash):
+    """True if a stored hash was made with other parameters than PASSWORD_HASH_METHOD"""
+    return password_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
+
+
+class HashingOverloaded(Exception):
+    """The hashing pool already has max_pending hashes in flight"""
+
+
+class InlineHasher:
+    """Hash on the calling thread"""
+
+    def hash_password(self, password):
+        with HASH_DURATION.time('hash', 'inline'):
+            return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+    def check_password(self, password_hash, password):
+        with HASH_DURATION.time('check', 'inline'):
+            return check_password_hash(password_hash, password)
+
+    # For async handlers: hash on a thread so the event loop keeps running
+    async def hash_password_async(self, password):
+        return await asyncio.to_thread(self.hash_password, password)
+
+    async def check_password_async(self, password_hash, password):
+        return await asyncio.to_thread(self.check_password, password_hash, password)
+
+
+class HashingPool:
+    """Bounded process pool for password hashing"""
+
+    def __init__(self, workers=None, max_pending=None, timeout=30.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._slots = None
+
+    def _pool(self):
+        # Created on first use in each process. By then the process runs other threads
+        # (write-behind, analytics, offload pool), so the hashing workers are not forked
+        # from it: a fork could copy a lock some thread holds and deadlock the child.
+        # They are started fresh and only need werkzeug.security.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(
+                    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'))
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._pid = os.getpid()
+            return self._executor, self._slots
+
+    def submit(self, fn, *args):
+        """Start fn(*args) in the pool and return its Future; raises HashingOverloaded when full"""
+        executor, slots = self._pool()
+        if not slots.acquire(blocking=False):
+            raise HashingOverloaded()
+
+        # The slot is held until the worker finishes, even if we stop waiting
+        future = executor.submit(fn, *args)
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def _run(self, fn, *args):
+        try:
+            return self.submit(fn, *args).result(self.timeout)
+        except TimeoutError:
+            raise HashingOverloaded() from None
+
+    async def _run_async(self, fn, *args):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(self.submit(fn, *args)), self.timeout)
+        except asyncio.TimeoutError:
+            raise HashingOverloaded() from None
+
+    # Timed from the caller's side, so waiting for a free worker is included
+    def hash_password(self, password):
+        with HASH_DURATION.time('hash', 'pool'):
+            return self._run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+    def check_password(self, password_hash, password):
+        with HASH_DURATION.time('check', 'pool'):
+            return self._run(check_password_hash, password_hash, password)
+
+    # For async handlers: the event loop awaits the pool without tying up a thread
+    async def hash_password_async(self, password):
+        with HASH_DURATION.time('hash', 'pool'):
+            return await self._run_async(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+    async def check_password_async(self, password_hash, password):
+        with HASH_DURATION.time('check', 'pool'):
+            return await self._run_async(check_password_hash, password_hash, password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
+            self._pid = None
+
+
+INLINE_HASHER = InlineHasher()
@@ -0,0 +1,366 @@
+"""
+Request, query and function metrics
+
+Histograms and counters live in the process and /metrics renders them in the
+Prometheus text format:
+    http_request_duration_seconds{method, endpoint, status}
+    db_query_duration_seconds{statement}        cursor execute()/executemany()
+    db_rows_returned_total{statement}           rows read by fetchone/fetchmany/fetchall
+    password_hash_duration_seconds{operation, mode}
+    function_duration_seconds{function}         functions decorated with @timed
+statement is the SQL verb and first table, e.g. "select screening_responses".
+On SQLite, execute() returns once the first row is ready; the remaining rows
+are stepped through as they are fetched.
+
+A pre-fork server has one registry per worker. With METRICS_DIR set, each
+worker writes a snapshot there every METRICS_FLUSH_INTERVAL seconds and
+/metrics merges the snapshots of every worker, including ones that have
+exited, so counts never go backwards while the server runs.
+
+Sampling profiler: with PROFILE_TOKEN set, a request carrying the header
+"X-Profile-Token: <token>" has its thread's stack sampled every
+PROFILE_INTERVAL seconds while it is handled. The samples are written to
+PROFILE_DIR in folded format (one "frame;frame;frame count" line per distinct
+stack), which flamegraph.pl and speedscope read directly, and the response
+names the file in X-Profile-File.
+"""
+
+import glob
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+
+from flask import g, request
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# ============================================================================
+# METRIC TYPES
+# ============================================================================
+
+class Counter:
+    """Monotonic count per combination of label values"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._series = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._series.items()]
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+
+class Histogram:
+    """Bucketed observations per combination of label values"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        # One (non-cumulative) count per bucket plus +Inf, then the sum
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), list(values)] for labels, values in self._series.items()]
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+
+REGISTRY = []
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time to produce a response',
+                             ['method', 'endpoint', 'status'])
+QUERY_DURATION = Histogram('db_query_duration_seconds', 'Time in cursor execute', ['statement'])
+ROWS_RETURNED = Counter('db_rows_returned_total', 'Rows fetched from query results', ['statement'])
+HASH_DURATION = Histogram('password_hash_duration_seconds', 'Time to hash or check a password',
+                          ['operation', 'mode'], buckets=(0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0, 30.0))
+FUNCTION_DURATION = Histogram('function_duration_seconds', 'Time in functions decorated with @timed',
+                              ['function'])
+
+
+# ============================================================================
+# INSTRUMENTATION HELPERS
+# ============================================================================
+
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|COPY|TABLE(?:\s+IF\s+NOT\s+EXISTS)?)\s+(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def statement_name(sql):
+    """'SELECT ... FROM users WHERE ...' -> 'select users'"""
+    verb = sql.split(None, 1)[0].lower() if sql.strip() else ''
+    match = _TABLE.search(sql)
+    return f'{verb} {match.group(1).lower()}' if match else verb
+
+
+def observe_query(sql, seconds):
+    QUERY_DURATION.observe(seconds, statement_name(sql))
+
+
+def count_rows(sql, rows):
+    if rows:
+        ROWS_RETURNED.inc(rows, statement_name(sql))
+
+
+def timed(name):
+    """Decorator recording each call's duration in function_duration_seconds"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with FUNCTION_DURATION.time(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ============================================================================
+# SNAPSHOTS AND PROMETHEUS TEXT FORMAT
+# ============================================================================
+
+def snapshot():
+    """Current values of every metric in this process, as JSON-compatible data"""
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def merge(snapshots):
+    """Sum several snapshot() results series by series"""
+    merged = {}
+    for data in snapshots:
+        for name, series in data.items():
+            target = merged.setdefault(name, {})
+            for labels, values in series:
+                key = tuple(labels)
+                if key not in target:
+                    target[key] = values
+                elif isinstance(values, list):
+                    target[key] = [a + b for a, b in zip(target[key], values)]
+                else:
+                    target[key] += values
+    return {name: [[list(labels), values] for labels, values in series.items()]
+            for name, series in merged.items()}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(data):
+    """Prometheus text exposition of a snapshot() or merge() result"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for labels, values in sorted(data.get(metric.name, []), key=lambda series: series[0]):
+            if metric.type == 'counter':
+                lines.append(f'{metric.name}{_label_text(metric.labels, labels)} {_number(values)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), values):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{metric.name}_bucket{_label_text(metric.labels, labels, le)} {cumulative}')
+            lines.append(f'{metric.name}_sum{_label_text(metric.labels, labels)} {_number(values[-1])}')
+            lines.append(f'{metric.name}_count{_label_text(metric.labels, labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def _snapshot_path(directory, pid):
+    return os.path.join(directory, f'metrics-{pid}.json')
+
+
+def write_snapshot(directory):
+    """Write this process's metrics to directory/metrics-<pid>.json"""
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory, os.getpid())
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def collect(directory=None):
+    """Prometheus text for this process, or for every process writing to directory"""
+    if not directory:
+        return render(snapshot())
+
+    write_snapshot(directory)
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            pass  # removed or being replaced
+    return render(merge(snapshots))
+
+
+def clear_snapshots(directory):
+    """Remove every worker's snapshot; call when the server (re)starts"""
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json*')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# ============================================================================
+# SAMPLING PROFILER
+# ============================================================================
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread until stop()"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(frames))] += 1
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+# ============================================================================
+# FLASK INTEGRATION
+# ============================================================================
+
+_process = {'pid': os.getpid(), 'started': False}
+_process_lock = threading.Lock()
+
+
+def _flush_periodically(directory, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot(directory)
+        except OSError:
+            pass
+
+
+def _check_process(config):
+    """On the first request in a process, drop metrics inherited from the parent and start flushing"""
+    if _process['started'] and _process['pid'] == os.getpid():
+        return
+    with _process_lock:
+        if _process['pid'] != os.getpid():
+            # Forked from a preloaded master: what was recorded so far belongs to the master
+            for metric in REGISTRY:
+                metric.reset()
+            _process.update(pid=os.getpid(), started=False)
+        if not _process['started']:
+            if config['METRICS_DIR']:
+                threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True,
+                                 args=(config['METRICS_DIR'], config['METRICS_FLUSH_INTERVAL'])).start()
+            _process['started'] = True
+
+
+def init_app(app):
+    """Time every request and enable per-request profiling"""
+
+    @app.before_request
+    def start_request_timer():
+        _check_process(app.config)
+        g.request_started = time.perf_counter()
+
+        token = app.config['PROFILE_TOKEN']
+        supplied = request.headers.get('X-Profile-Token')
+        if token and supplied and hmac.compare_digest(supplied.encode(), token.encode()):
+            g.profiler = StackSampler(threading.get_ident(), app.config['PROFILE_INTERVAL']).start()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else '<unmatched>'
+            REQUEST_DURATION.observe(time.perf_counter() - started,
+                                     request.method, endpoint, str(response.status_code))
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop()
+            directory = app.config['PROFILE_DIR']
+            os.makedirs(directory, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{request.endpoint or 'unmatched'}.folded"
+            with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+                f.write(profiler.folded())
+            response.headers['X-Profile-File'] = name
+        return response
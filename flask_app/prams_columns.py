@@ -0,0 +1,193 @@
+"""
+Columnar, memory-mapped cache of the PRAMS Phase 8 scoring variables
+
+One-time conversion of the SAS file into one byte per row per variable
+(0 = missing, otherwise the PRAMS code), sorted by survey year and state so
+each (year, state) pair is a contiguous row range. Counting a slice is then
+a handful of bytes.count() calls over the mapped files.
+
+Layout of data/prams_columns/:
+    meta.json       row count, variables, codes and the (year, state) index
+    <VARIABLE>.u8   one unsigned byte per row
+
+Usage:
+    python prams_columns.py [--zip PATH] [--out DIR]
+"""
+
+import argparse
+import json
+import mmap
+import time
+from pathlib import Path
+
+from prams_ingest import (
+    DEFAULT_ZIP_PATH, SCORING_VARIABLES, SAS7BDATReader, open_sas_from_zip
+)
+
+DEFAULT_COLUMNS_PATH = Path(__file__).parent / 'data' / 'prams_columns'
+
+# PRAMS IDs look like 2016AK327002: survey year, state, sequence number
+ID_COLUMN = 'ID'
+
+MISSING_CODE = 0
+
+
+# ============================================================================
+# CONVERSION
+# ============================================================================
+
+def _encode(value, variable):
+    """Convert a decoded SAS value to its one-byte code"""
+    if value is None:
+        return MISSING_CODE
+    code = int(value)
+    if code != value or not 1 <= code <= 255:
+        raise ValueError(f'{variable} value {value!r} does not fit the one-byte column format')
+    return code
+
+
+def convert(zip_path=DEFAULT_ZIP_PATH, out_dir=DEFAULT_COLUMNS_PATH, chunk_rows=10000):
+    """Decode the SAS file once and write the columnar cache"""
+    started = time.perf_counter()
+
+    columns = {name: bytearray() for name in SCORING_VARIABLES}
+    group_keys = []
+
+    archive, member = open_sas_from_zip(zip_path)
+    try:
+        reader = SAS7BDATReader(member)
+        for chunk in reader.iter_chunks([ID_COLUMN] + SCORING_VARIABLES, chunk_rows):
+            for row_id in chunk[ID_COLUMN]:
+                group_keys.append((int(row_id[:4]), row_id[4:6]))
+            for name in SCORING_VARIABLES:
+                columns[name].extend(_encode(value, name) for value in chunk[name])
+    finally:
+        member.close()
+        archive.close()
+
+    # Sort rows by (year, state) so every group is a contiguous range
+    order = sorted(range(len(group_keys)), key=group_keys.__getitem__)
+
+    groups = []
+    for position, row in enumerate(order):
+        key = group_keys[row]
+        if groups and (groups[-1][0], groups[-1][1]) == key:
+            groups[-1][3] = position + 1
+        else:
+            groups.append([key[0], key[1], position, position + 1])
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    codes = {}
+    for name, values in columns.items():
+        with open(out_dir / f'{name}.u8', 'wb') as f:
+            f.write(bytes(values[row] for row in order))
+        codes[name] = sorted(set(values) - {MISSING_CODE})
+
+    meta = {
+        'source': Path(zip_path).name,
+        'row_count': len(order),
+        'missing_code': MISSING_CODE,
+        'variables': SCORING_VARIABLES,
+        'codes': codes,
+        'groups': groups,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+    with open(out_dir / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+        f.write('\n')
+
+    return meta
+
+
+# ============================================================================
+# MEMORY-MAPPED READER
+# ============================================================================
+
+class ColumnarBaseline:
+    """Memory-mapped view of the columnar cache"""
+
+    def __init__(self, directory=DEFAULT_COLUMNS_PATH):
+        directory = Path(directory)
+        with open(directory / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+
+        self.row_count = self.meta['row_count']
+        self.variables = self.meta['variables']
+        self.codes = {name: codes for name, codes in self.meta['codes'].items()}
+        self.groups = [tuple(group) for group in self.meta['groups']]
+        self.years = sorted({group[0] for group in self.groups})
+        self.states = sorted({group[1] for group in self.groups})
+
+        self._maps = {}
+        for name in self.variables:
+            with open(directory / f'{name}.u8', 'rb') as f:
+                if self.row_count:
+                    self._maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps = {}
+
+    def column(self, variable):
+        """Return the mapped codes of one variable (one byte per row)"""
+        return self._maps.get(variable, b'')
+
+    def ranges(self, years=None, states=None):
+        """Return merged (start, end) row ranges matching the year/state filters"""
+        years = set(years) if years else None
+        states = set(states) if states else None
+
+        merged = []
+        for year, state, start, end in self.groups:
+            if years is not None and year not in years:
+                continue
+            if states is not None and state not in states:
+                continue
+            if merged and merged[-1][1] == start:
+                merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        return [tuple(r) for r in merged]
+
+    def value_counts(self, variable, years=None, states=None, ranges=None):
+        """Count non-missing codes of one variable within the filtered rows"""
+        if ranges is None:
+            ranges = self.ranges(years, states)
+
+        mapped = self._maps.get(variable)
+        counts = {code: 0 for code in self.codes[variable]}
+        if mapped is None:
+            return counts
+
+        for start, end in ranges:
+            segment = mapped[start:end]
+            for code in counts:
+                counts[code] += segment.count(code.to_bytes(1, 'little'))
+        return counts
+
+    def slice_counts(self, years=None, states=None):
+        """Return (row count, {variable: {code: count}}) for a year/state slice"""
+        ranges = self.ranges(years, states)
+        total_rows = sum(end - start for start, end in ranges)
+        return total_rows, {
+            name: self.value_counts(name, ranges=ranges)
+            for name in self.variables
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert the PRAMS SAS file into the columnar baseline cache')
+    parser.add_argument('--zip', default=DEFAULT_ZIP_PATH, help='Path to the zipped SAS7BDAT file')
+    parser.add_argument('--out', default=DEFAULT_COLUMNS_PATH, help='Directory for the columnar cache')
+    args = parser.parse_args()
+
+    meta = convert(args.zip, args.out)
+    print(f"Converted {meta['row_count']:,} rows ({len(meta['groups'])} year/state groups) "
+          f"in {meta['seconds']}s to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
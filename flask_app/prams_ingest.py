@@ -0,0 +1,510 @@
+"""
+Streaming ingestion of the PRAMS Phase 8 SAS7BDAT file
+Reads the dataset straight out of the zip archive one page at a time and
+tallies the variables used by the scoring algorithm into a compact
+baseline artifact (data/prams_baseline.json)
+
+Usage:
+    python prams_ingest.py [--zip PATH] [--out PATH] [--chunk-rows N]
+"""
+
+import argparse
+import json
+import math
+import resource
+import struct
+import time
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+DEFAULT_ZIP_PATH = Path(__file__).parent.parent / 'phase8_2016_2021_std_l.sas7bdat.zip'
+DEFAULT_ARTIFACT_PATH = Path(__file__).parent / 'data' / 'prams_baseline.json'
+
+# Variables used by scoring and routing
+SCORING_VARIABLES = [
+    'BPG_MH', 'HTH_GEN', 'PRE_RX', 'PRE_EXER',
+    'PRE_DIET', 'OWGT_OBS', 'BPG_TALK', 'FLU_SRC'
+]
+
+# Same labels as determine_routing in scoring.py
+CARE_SETTING_NAMES = {
+    1: 'OB/Gyn office',
+    2: 'Family doctor / Primary care physician',
+    3: 'Community health clinic',
+    4: 'Hospital',
+    5: 'Pharmacy',
+    6: 'Work or school clinic',
+    7: 'Other'
+}
+
+# (variable, value) pairs counted as risk factors, matching calculate_risk
+RISK_FACTOR_CODES = {
+    'prior_mh': ('BPG_MH', [2]),
+    'poor_health': ('HTH_GEN', [4, 5]),
+    'no_exercise': ('PRE_EXER', [1]),
+    'dieting': ('PRE_DIET', [2]),
+    'overweight': ('OWGT_OBS', [2])
+}
+
+
+class SASFormatError(Exception):
+    """Raised when the file is not a SAS7BDAT dataset this reader understands"""
+
+
+# ============================================================================
+# SAS7BDAT READER
+# ============================================================================
+
+SAS_MAGIC = bytes([
+    0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+    0x00, 0x00, 0x00, 0x00, 0xC2, 0xEA, 0x81, 0x60,
+    0xB3, 0x14, 0x11, 0xCF, 0xBD, 0x92, 0x08, 0x00,
+    0x09, 0xC7, 0x31, 0x8C, 0x18, 0x1F, 0x10, 0x11
+])
+
+# Subheader signatures, normalized to their first four little-endian bytes
+SUBHEADER_ROW_SIZE = b'\xF7\xF7\xF7\xF7'
+SUBHEADER_COLUMN_SIZE = b'\xF6\xF6\xF6\xF6'
+SUBHEADER_COUNTS = b'\x00\xFC\xFF\xFF'
+SUBHEADER_COLUMN_TEXT = b'\xFD\xFF\xFF\xFF'
+SUBHEADER_COLUMN_NAME = b'\xFF\xFF\xFF\xFF'
+SUBHEADER_COLUMN_ATTRIBUTES = b'\xFC\xFF\xFF\xFF'
+SUBHEADER_FORMAT_LABEL = b'\xFE\xFB\xFF\xFF'
+SUBHEADER_COLUMN_LIST = b'\xFE\xFF\xFF\xFF'
+
+PAGE_META = 0x0000
+PAGE_DATA = 0x0100
+PAGE_MIX = 0x0200
+PAGE_AMD = 0x0400
+PAGE_METC = 0x4000
+PAGE_COMP = 0x9000
+
+RLE_COMPRESSION = b'SASYZCRL'
+RDC_COMPRESSION = b'SASYZCR2'
+
+
+def _rle_decompress(data, length):
+    """Decompress a SASYZCRL (run-length encoded) row"""
+    out = bytearray()
+    pos = 0
+    while pos < len(data):
+        control = data[pos] & 0xF0
+        low = data[pos] & 0x0F
+        pos += 1
+        if control == 0x00:
+            count = data[pos] + 64 + low * 256
+            out += data[pos + 1:pos + 1 + count]
+            pos += 1 + count
+        elif control == 0x40:
+            count = data[pos] + 18 + low * 256
+            out += bytes([data[pos + 1]]) * count
+            pos += 2
+        elif control == 0x60:
+            out += b' ' * (low * 256 + data[pos] + 17)
+            pos += 1
+        elif control == 0x70:
+            out += b'\x00' * (low * 256 + data[pos] + 17)
+            pos += 1
+        elif control in (0x80, 0x90, 0xA0, 0xB0):
+            count = low + {0x80: 1, 0x90: 17, 0xA0: 33, 0xB0: 49}[control]
+            out += data[pos:pos + count]
+            pos += count
+        elif control == 0xC0:
+            out += bytes([data[pos]]) * (low + 3)
+            pos += 1
+        elif control == 0xD0:
+            out += b'@' * (low + 2)
+        elif control == 0xE0:
+            out += b' ' * (low + 2)
+        elif control == 0xF0:
+            out += b'\x00' * (low + 2)
+        else:
+            raise SASFormatError(f'Unknown RLE control byte {control:#x}')
+
+    if len(out) != length:
+        raise SASFormatError(f'RLE row decompressed to {len(out)} bytes, expected {length}')
+    return bytes(out)
+
+
+class SAS7BDATReader:
+    """
+    Sequential SAS7BDAT reader
+
+    Only needs a readable file object (no seeking), so it can stream straight
+    out of a zip archive. Memory use is one page plus the requested chunk.
+    """
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self.columns = []
+        self.row_count = 0
+        self.row_length = 0
+        self.compression = b''
+        self._column_text = []
+        self._column_names = []
+        self._column_offsets = []
+        self._column_lengths = []
+        self._column_types = []
+        self._mix_page_row_count = 0
+        self._data_subheaders = []
+
+        self._read_header()
+        self._page = None
+        self._pages_read = 0
+        self._read_metadata()
+
+    # ------------------------------------------------------------------
+    # Header and metadata
+    # ------------------------------------------------------------------
+
+    def _read_header(self):
+        header = self._file.read(288)
+        if len(header) < 288 or header[:32] != SAS_MAGIC:
+            raise SASFormatError('Not a SAS7BDAT file')
+
+        self.u64 = header[32] == 0x33
+        self._int_length = 8 if self.u64 else 4
+        self._page_bit_offset = 32 if self.u64 else 16
+        self._subheader_pointer_length = 24 if self.u64 else 12
+        align = 4 if header[35] == 0x33 else 0
+        self._byte_order = '<' if header[37] == 0x01 else '>'
+
+        self.header_length = self._unpack_int(header, 196 + align, 4)
+        self.page_length = self._unpack_int(header, 200 + align, 4)
+        self.page_count = self._unpack_int(header, 204 + align, self._int_length)
+
+        # Skip the rest of the header
+        self._file.read(self.header_length - 288)
+
+    def _unpack_int(self, buf, offset, width):
+        fmt = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}[width]
+        return struct.unpack_from(self._byte_order + fmt, buf, offset)[0]
+
+    def _read_page(self):
+        page = self._file.read(self.page_length)
+        if len(page) < self.page_length:
+            self._page = None
+            return False
+
+        self._page = page
+        self._pages_read += 1
+        offset = self._page_bit_offset
+        self._page_type = self._unpack_int(page, offset, 2)
+        self._page_block_count = self._unpack_int(page, offset + 2, 2)
+        self._page_subheader_count = self._unpack_int(page, offset + 4, 2)
+        return True
+
+    def _page_subheader_pointers(self):
+        """Yield (offset, length, compression, type) for each subheader on the page"""
+        page = self._page
+        int_length = self._int_length
+        base = self._page_bit_offset + 8
+        for i in range(self._page_subheader_count):
+            pointer = base + i * self._subheader_pointer_length
+            yield (
+                self._unpack_int(page, pointer, int_length),
+                self._unpack_int(page, pointer + int_length, int_length),
+                page[pointer + 2 * int_length],
+                page[pointer + 2 * int_length + 1]
+            )
+
+    def _signature(self, offset):
+        raw = self._page[offset:offset + self._int_length]
+        if self._byte_order == '>':
+            raw = raw[::-1]
+        return raw[:4]
+
+    def _read_metadata(self):
+        """Read pages until the first page holding row data"""
+        while self._read_page():
+            page_type = self._page_type
+            if page_type in (PAGE_META, PAGE_METC, PAGE_MIX, PAGE_AMD) or page_type & 0x0F00 == PAGE_MIX:
+                self._process_subheaders()
+            if page_type == PAGE_DATA or page_type & 0x0F00 == PAGE_MIX:
+                break
+            if self.compression and self._data_subheaders:
+                break
+
+        if not self._column_names:
+            raise SASFormatError('No column metadata found')
+
+        self.columns = [name.decode('latin-1') for name in self._column_names]
+
+    def _process_subheaders(self):
+        self._data_subheaders = []
+        for offset, length, compression, subheader_type in self._page_subheader_pointers():
+            if length == 0 or compression == 1:
+                continue
+
+            signature = self._signature(offset)
+            if signature == SUBHEADER_ROW_SIZE:
+                self._process_row_size(offset)
+            elif signature == SUBHEADER_COLUMN_SIZE:
+                pass
+            elif signature == SUBHEADER_COLUMN_TEXT:
+                self._process_column_text(offset)
+            elif signature == SUBHEADER_COLUMN_NAME:
+                self._process_column_name(offset, length)
+            elif signature == SUBHEADER_COLUMN_ATTRIBUTES:
+                self._process_column_attributes(offset, length)
+            elif signature in (SUBHEADER_COUNTS, SUBHEADER_FORMAT_LABEL, SUBHEADER_COLUMN_LIST):
+                pass
+            elif self.compression and compression in (0, 4) and subheader_type == 1:
+                self._data_subheaders.append((offset, length))
+            else:
+                raise SASFormatError(f'Unknown subheader signature {signature.hex()}')
+
+    def _process_row_size(self, offset):
+        int_length = self._int_length
+        page = self._page
+        self.row_length = self._unpack_int(page, offset + 5 * int_length, int_length)
+        self.row_count = self._unpack_int(page, offset + 6 * int_length, int_length)
+        self._mix_page_row_count = self._unpack_int(page, offset + 15 * int_length, int_length)
+
+    def _process_column_text(self, offset):
+        offset += self._int_length
+        size = self._unpack_int(self._page, offset, 2)
+        text = self._page[offset:offset + size]
+        self._column_text.append(text)
+        if len(self._column_text) == 1:
+            if RLE_COMPRESSION in text:
+                self.compression = RLE_COMPRESSION
+            elif RDC_COMPRESSION in text:
+                self.compression = RDC_COMPRESSION
+
+    def _process_column_name(self, offset, length):
+        offset += self._int_length
+        count = (length - 2 * self._int_length - 12) // 8
+        for i in range(count):
+            pointer = offset + 8 * (i + 1)
+            text_index = self._unpack_int(self._page, pointer, 2)
+            name_offset = self._unpack_int(self._page, pointer + 2, 2)
+            name_length = self._unpack_int(self._page, pointer + 4, 2)
+            text = self._column_text[text_index]
+            self._column_names.append(text[name_offset:name_offset + name_length].rstrip(b'\x00 '))
+
+    def _process_column_attributes(self, offset, length):
+        int_length = self._int_length
+        count = (length - 2 * int_length - 12) // (int_length + 8)
+        for i in range(count):
+            base = offset + i * (int_length + 8)
+            self._column_offsets.append(self._unpack_int(self._page, base + int_length + 8, int_length))
+            self._column_lengths.append(self._unpack_int(self._page, base + 2 * int_length + 8, 4))
+            self._column_types.append('d' if self._page[base + 2 * int_length + 14] == 1 else 's')
+
+    # ------------------------------------------------------------------
+    # Row data
+    # ------------------------------------------------------------------
+
+    def _page_rows(self):
+        """Yield the raw row bytes stored on the current page"""
+        page_type = self._page_type
+        row_length = self.row_length
+
+        if page_type == PAGE_DATA:
+            start = self._page_bit_offset + 8
+            for i in range(self._page_block_count):
+                yield self._page[start + i * row_length:start + (i + 1) * row_length]
+        elif page_type & 0x0F00 == PAGE_MIX:
+            start = (self._page_bit_offset + 8 +
+                     self._page_subheader_count * self._subheader_pointer_length)
+            start += start % 8
+            for i in range(min(self.row_count, self._mix_page_row_count)):
+                yield self._page[start + i * row_length:start + (i + 1) * row_length]
+
+        if page_type in (PAGE_META, PAGE_METC, PAGE_AMD) or page_type & 0x0F00 == PAGE_MIX:
+            for offset, length in self._data_subheaders:
+                row = self._page[offset:offset + length]
+                if length < row_length:
+                    if self.compression == RLE_COMPRESSION:
+                        row = _rle_decompress(row, row_length)
+                    else:
+                        raise SASFormatError('RDC-compressed SAS files are not supported')
+                yield row
+
+    def _numeric_decoder(self, index):
+        """Build a function decoding one numeric column from a raw row"""
+        offset = self._column_offsets[index]
+        length = self._column_lengths[index]
+        unpack = struct.Struct(self._byte_order + 'd').unpack
+        padding = b'\x00' * (8 - length)
+        big_endian = self._byte_order == '>'
+
+        def decode(row):
+            raw = row[offset:offset + length]
+            raw = raw + padding if big_endian else padding + raw
+            value = unpack(raw)[0]
+            return None if math.isnan(value) else value
+
+        return decode
+
+    def _string_decoder(self, index):
+        """Build a function decoding one character column from a raw row"""
+        offset = self._column_offsets[index]
+        length = self._column_lengths[index]
+
+        def decode(row):
+            value = row[offset:offset + length].rstrip(b'\x00 ')
+            return value.decode('latin-1') if value else None
+
+        return decode
+
+    def iter_chunks(self, columns, chunk_rows=10000):
+        """
+        Yield dicts of {column: [values]} holding at most chunk_rows rows
+        Missing values (., .B, .S, ... or blank strings) are returned as None
+        """
+        decoders = []
+        for name in columns:
+            if name not in self.columns:
+                raise SASFormatError(f'Column {name} not in dataset')
+            index = self.columns.index(name)
+            if self._column_types[index] == 'd':
+                decoders.append(self._numeric_decoder(index))
+            else:
+                decoders.append(self._string_decoder(index))
+
+        chunk = {name: [] for name in columns}
+        pending = 0
+        rows_read = 0
+
+        while self._page is not None and rows_read < self.row_count:
+            for row in self._page_rows():
+                for name, decode in zip(columns, decoders):
+                    chunk[name].append(decode(row))
+                pending += 1
+                rows_read += 1
+                if pending == chunk_rows:
+                    yield chunk
+                    chunk = {name: [] for name in columns}
+                    pending = 0
+                if rows_read == self.row_count:
+                    break
+
+            if rows_read < self.row_count and self._read_page():
+                if self._page_type in (PAGE_META, PAGE_METC, PAGE_AMD) or self._page_type & 0x0F00 == PAGE_MIX:
+                    self._process_subheaders()
+                elif self._page_type != PAGE_DATA:
+                    self._data_subheaders = []
+
+        if pending:
+            yield chunk
+
+
+def open_sas_from_zip(zip_path):
+    """Return (zipfile, member file object) for the .sas7bdat member of a zip"""
+    archive = zipfile.ZipFile(zip_path)
+    members = [
+        info for info in archive.infolist()
+        if info.filename.endswith('.sas7bdat') and not info.filename.startswith('__MACOSX')
+    ]
+    if not members:
+        archive.close()
+        raise SASFormatError(f'No .sas7bdat file in {zip_path}')
+    return archive, archive.open(members[0])
+
+
+# ============================================================================
+# BASELINE TALLY
+# ============================================================================
+
+def tally_chunks(chunks, variables=SCORING_VARIABLES):
+    """Count non-missing values per variable across all chunks"""
+    value_counts = {name: {} for name in variables}
+    total_rows = 0
+
+    for chunk in chunks:
+        total_rows += len(chunk[variables[0]])
+        for name in variables:
+            counts = value_counts[name]
+            for value in chunk[name]:
+                if value is not None:
+                    counts[value] = counts.get(value, 0) + 1
+
+    # Codes are whole numbers; store them as ints
+    value_counts = {
+        name: {int(value): count for value, count in sorted(counts.items())}
+        for name, counts in value_counts.items()
+    }
+    return total_rows, value_counts
+
+
+def build_baseline_artifact(total_rows, value_counts):
+    """Build the baseline artifact in the same shape as BASELINE_DATA"""
+    risk_factors = {
+        name: sum(value_counts[variable].get(code, 0) for code in codes)
+        for name, (variable, codes) in RISK_FACTOR_CODES.items()
+    }
+    # Not directly measured in PRAMS, will be from new responses
+    risk_factors['mh_meds'] = 0
+
+    care_settings = {
+        label: value_counts['FLU_SRC'].get(code, 0)
+        for code, label in CARE_SETTING_NAMES.items()
+    }
+
+    return {
+        'dataset_info': f'PRAMS Phase 8 (2016-2021) - Non-missing responses only (N={total_rows:,})',
+        'total_rows': total_rows,
+        'total_non_missing': {
+            name: sum(counts.values()) for name, counts in value_counts.items()
+        },
+        'value_counts': {
+            name: {str(code): count for code, count in counts.items()}
+            for name, counts in value_counts.items()
+        },
+        'risk_factors': risk_factors,
+        'care_settings': care_settings
+    }
+
+
+def ingest(zip_path=DEFAULT_ZIP_PATH, artifact_path=DEFAULT_ARTIFACT_PATH, chunk_rows=10000):
+    """Stream the SAS file, tally scoring variables and write the baseline artifact"""
+    started = time.perf_counter()
+
+    archive, member = open_sas_from_zip(zip_path)
+    try:
+        reader = SAS7BDATReader(member)
+        total_rows, value_counts = tally_chunks(reader.iter_chunks(SCORING_VARIABLES, chunk_rows))
+    finally:
+        member.close()
+        archive.close()
+
+    elapsed = time.perf_counter() - started
+
+    artifact = build_baseline_artifact(total_rows, value_counts)
+    artifact['ingest'] = {
+        'source': Path(zip_path).name,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'chunk_rows': chunk_rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(total_rows / elapsed) if elapsed else None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+    artifact_path = Path(artifact_path)
+    artifact_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(artifact_path, 'w') as f:
+        json.dump(artifact, f, indent=2)
+        f.write('\n')
+
+    return artifact
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest the PRAMS SAS7BDAT file into a baseline artifact')
+    parser.add_argument('--zip', default=DEFAULT_ZIP_PATH, help='Path to the zipped SAS7BDAT file')
+    parser.add_argument('--out', default=DEFAULT_ARTIFACT_PATH, help='Where to write the baseline artifact')
+    parser.add_argument('--chunk-rows', type=int, default=10000, help='Rows decoded per chunk')
+    args = parser.parse_args()
+
+    artifact = ingest(args.zip, args.out, args.chunk_rows)
+    stats = artifact['ingest']
+    print(f"Ingested {artifact['total_rows']:,} rows in {stats['seconds']}s "
+          f"({stats['rows_per_sec']:,} rows/sec, peak RSS {stats['peak_rss_kb']:,} KB)")
+    print(f'Wrote {args.out}')
+
+
+if __name__ == '__main__':
+    main()
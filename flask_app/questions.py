@@ -0,0 +1,101 @@
+"""
+Questions configuration store
+
+Loads questions_config.json once and precomputes everything derived from it:
+the flattened question list, its JSON body in identity, gzip and (if the
+brotli package is installed) br encodings, a strong ETag, and the compiled
+scoring rules. The file's mtime is checked at most once per check_interval
+seconds and the snapshot is rebuilt when it changes.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+from scoring import compile_rules
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class QuestionsSnapshot:
+    """Everything derived from one version of the config file"""
+
+    def __init__(self, config, mtime_ns=None):
+        self.config = config
+        self.mtime_ns = mtime_ns
+
+        # Copy each question rather than adding section_name to the config in place
+        self.questions = [
+            {**question, 'section_name': section['section_name']}
+            for section in config['sections']
+            for question in section['questions']
+        ]
+
+        # Compact with sorted keys, like jsonify outside debug mode
+        body = json.dumps(self.questions, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        self.bodies = {
+            'identity': body,
+            'gzip': gzip.compress(body, compresslevel=9, mtime=0)
+        }
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body)
+
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etags = {
+            encoding: digest if encoding == 'identity' else f'{digest}-{encoding}'
+            for encoding in self.bodies
+        }
+
+        self.score_risk = compile_rules(config)
+
+    def negotiate(self, accept_encodings):
+        """Pick the smallest encoding the client accepts (br, gzip or identity)"""
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
+
+class QuestionsStore:
+    """Holds the current QuestionsSnapshot and rebuilds it when the file changes"""
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = self._load()
+        self._checked_at = time.monotonic()
+
+    def _load(self):
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        with open(self.path, 'r') as f:
+            config = json.load(f)
+        return QuestionsSnapshot(config, mtime_ns)
+
+    def current(self):
+        """Return the snapshot for the config file as it is now"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._snapshot
+
+        with self._lock:
+            if now - self._checked_at >= self.check_interval:
+                try:
+                    if os.stat(self.path).st_mtime_ns != self._snapshot.mtime_ns:
+                        self._snapshot = self._load()
+                except (OSError, ValueError, KeyError):
+                    pass  # missing or half-written file: keep serving the last good config
+                self._checked_at = time.monotonic()
+        return self._snapshot
+
+    def refresh(self):
+        """Check the file now rather than after check_interval; returns the current snapshot"""
+        with self._lock:
+            self._checked_at = time.monotonic() - self.check_interval
+        return self.current()
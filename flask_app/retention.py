@@ -0,0 +1,228 @@
+"""
+Retention: archive old screening responses into monthly segments
+
+Responses older than RETENTION_DAYS leave screening_responses a whole month
+at a time. Each month is written to a gzip NDJSON segment in ARCHIVE_DIR
+(screening_responses-YYYY-MM.<timestamp>.ndjson.gz, one object per row with
+every column, the JSON columns as stored) and recorded in the response_archives
+table together with the analytics counters, cube cells and rollup days its
+rows contributed. The rows are then deleted batch_size at a time, each batch
+in its own short transaction, so writers wait for one batch at most.
+
+The dashboard aggregates are maintained on insert and are not touched by
+archiving, so analytics keep counting archived responses; rebuild-analytics
+adds each segment's stored aggregates to what it recounts from the table.
+Exports, history pages and rescoring only see rows still in the table.
+
+A segment goes 'deleting' -> 'archived'. A run interrupted while deleting
+finishes the deletes from the segment's ids on the next run. restore_month()
+copies a month's rows back with their original ids ('restored'); the
+scheduled run leaves restored months alone until they are archived again
+explicitly with archive_month().
+
+    flask --app app archive-responses            # daily from cron; needs RETENTION_DAYS
+    flask --app app restore-responses 2024-03
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from database import (
+    RESPONSE_COLUMNS, ResponseAggregates, add_response_archive, delete_response_archive,
+    delete_screening_responses, get_archivable_months, get_response_archives, iter_month_responses,
+    reclaim_response_space, restore_screening_responses, set_response_archive_status
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows; overlapping runs are then not prevented
+    fcntl = None
+
+# Rows read from the database per chunk while writing a segment
+READ_CHUNK_SIZE = 1000
+
+
+def retention_cutoff(days, today=None):
+    """First day of the oldest month kept: months wholly older than `days` days are archived"""
+    today = today or datetime.now(timezone.utc)
+    return (today - timedelta(days=days)).strftime('%Y-%m-01')
+
+
+def parse_month(value):
+    """'YYYY-MM' -> 'YYYY-MM-01'"""
+    try:
+        return datetime.strptime(value, '%Y-%m').strftime('%Y-%m-01')
+    except ValueError:
+        raise ValueError(f'Invalid month (use YYYY-MM): {value}')
+
+
+@contextmanager
+def archive_lock(archive_dir):
+    """Hold an exclusive lock on archive_dir so overlapping runs wait for each other"""
+    os.makedirs(archive_dir, exist_ok=True)
+    with open(os.path.join(archive_dir, '.lock'), 'w') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_segment(archive_dir, archive):
+    """Yield the rows of an archive segment after checking its checksum"""
+    path = os.path.join(archive_dir, archive['path'])
+    if _file_sha256(path) != archive['sha256']:
+        raise ValueError(f"{archive['path']} does not match its recorded checksum")
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+# ============================================================================
+# ARCHIVING
+# ============================================================================
+
+def _write_segment(archive_dir, month):
+    """
+    Write every row of month to a new segment file
+    Returns (file name, ids, aggregates), or None if the month has no rows.
+    """
+    name = f'screening_responses-{month[:7]}.{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}.ndjson.gz'
+    path = os.path.join(archive_dir, name)
+    ids = []
+    aggregates = ResponseAggregates()
+
+    with open(path + '.tmp', 'wb') as raw:
+        with gzip.open(raw, 'wt', encoding='utf-8') as f:
+            for rows in iter_month_responses(month, READ_CHUNK_SIZE):
+                for row in rows:
+                    f.write(json.dumps({column: row[column] for column in RESPONSE_COLUMNS}) + '\n')
+                    ids.append(row['id'])
+                    aggregates.add(row)
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    if not ids:
+        os.remove(path + '.tmp')
+        return None
+    os.replace(path + '.tmp', path)
+    return name, ids, aggregates
+
+
+def _finish_deleting(archive_dir, archive, batch_size):
+    """Delete a 'deleting' segment's rows from the table and mark it archived"""
+    ids = [row['id'] for row in read_segment(archive_dir, archive)]
+    deleted = delete_screening_responses(ids, batch_size)
+    set_response_archive_status(archive['month'], archive['part'], 'archived')
+    return deleted
+
+
+def finish_pending(archive_dir, batch_size=500):
+    """Complete segments left in the 'deleting' state by an interrupted run; returns their count"""
+    pending = get_response_archives(status='deleting')
+    for archive in pending:
+        _finish_deleting(archive_dir, archive, batch_size)
+    return len(pending)
+
+
+def archive_month(month, archive_dir, batch_size=500):
+    """
+    Move every stored response of month ('YYYY-MM-01') into a new segment
+    Segments of the month that were restored are superseded and removed.
+    Returns {'month', 'part', 'rows', 'bytes'}, or None if the month has no rows.
+    """
+    written = _write_segment(archive_dir, month)
+    if written is None:
+        return None
+    name, ids, aggregates = written
+
+    # Recorded before the deletes start, so an interrupted run can finish them
+    sha256 = _file_sha256(os.path.join(archive_dir, name))
+    part = add_response_archive(month, name, len(ids), min(ids), max(ids), sha256, aggregates)
+    _finish_deleting(archive_dir, {'month': month, 'part': part, 'path': name, 'sha256': sha256}, batch_size)
+
+    # Restored rows still in the table are part of the new segment
+    for archive in get_response_archives(month=month, status='restored'):
+        delete_response_archive(archive['month'], archive['part'])
+        try:
+            os.remove(os.path.join(archive_dir, archive['path']))
+        except OSError:
+            pass
+
+    return {'month': month, 'part': part, 'rows': len(ids),
+            'bytes': os.path.getsize(os.path.join(archive_dir, name))}
+
+
+def run_retention(days, archive_dir, batch_size=500, months=None, today=None):
+    """
+    Archive every month wholly older than `days` days, then reclaim the freed space
+    Months with restored segments are skipped; pass months (['YYYY-MM-01']) to
+    archive exactly those instead, restored or not. Returns {'cutoff',
+    'segments', 'resumed', 'skipped', 'pages_freed'}.
+    """
+    cutoff = retention_cutoff(days, today) if months is None else None
+    with archive_lock(archive_dir):
+        resumed = finish_pending(archive_dir, batch_size)
+
+        skipped = []
+        if months is None:
+            restored = {archive['month'] for archive in get_response_archives(status='restored')}
+            months = [month for month, _ in get_archivable_months(cutoff)]
+            skipped = [month for month in months if month in restored]
+
+        segments = []
+        for month in months:
+            if month in skipped:
+                continue
+            segment = archive_month(month, archive_dir, batch_size)
+            if segment:
+                segments.append(segment)
+
+        pages_freed = reclaim_response_space() if segments or resumed else 0
+
+    return {'cutoff': cutoff, 'segments': segments, 'resumed': resumed,
+            'skipped': skipped, 'pages_freed': pages_freed}
+
+
+# ============================================================================
+# RESTORING
+# ============================================================================
+
+def restore_month(month, archive_dir, batch_size=500):
+    """
+    Copy the archived rows of month ('YYYY-MM-01') back into screening_responses
+    batch_size rows per transaction; running it again completes an interrupted
+    restore. Returns the number of rows restored; ValueError if the month has
+    no archived segment.
+    """
+    with archive_lock(archive_dir):
+        finish_pending(archive_dir, batch_size)
+        archives = get_response_archives(month=month, status='archived')
+        if not archives:
+            raise ValueError(f'No archived segment for {month[:7]}')
+
+        restored = 0
+        for archive in archives:
+            batch = []
+            for row in read_segment(archive_dir, archive):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    restore_screening_responses(batch)
+                    restored += len(batch)
+                    batch = []
+            if batch:
+                restore_screening_responses(batch)
+                restored += len(batch)
+            set_response_archive_status(archive['month'], archive['part'], 'restored')
+
+    return restored
@@ -23,12 +23,18 @@ pip install -q -r requirements.txt
 echo ""
 echo "✅ Setup complete!"
 echo ""
-echo "🚀 Starting Flask application..."
+echo "🚀 Starting gunicorn (settings in gunicorn.conf.py)..."
 echo "📱 Open your browser to: http://localhost:5000"
 echo ""
 echo "Press Ctrl+C to stop the server"
 echo "================================================"
 echo ""
 
-# Run the Flask app
-python app.py
+# Run the app with the pre-fork production server; ./run.sh --dev for the debug server
+if [ "$1" = "--dev" ]; then
+    python app.py
+else
+    # Hashed, minified and precompressed static files (see Static Assets in README.md)
+    flask --app app build-assets
+    exec gunicorn -c gunicorn.conf.py wsgi:app
+fi
@@ -0,0 +1,557 @@
+"""
+Risk scoring for the perinatal mental health screening
+
+calculate_risk() and determine_routing() score a single submission.
+score_batch() applies the same rules to whole columns of coded answers for
+re-scoring stored responses and scoring the PRAMS baseline. compile_rules()
+builds a table-driven scorer from the scoring metadata in questions_config.json.
+"""
+
+import ast
+import re
+
+
+# ============================================================================
+# SINGLE RESPONSE SCORING
+# ============================================================================
+
+# Highest score of a single PHQ-2 item ("Nearly every day")
+PHQ2_MAX_ITEM_SCORE = 3
+
+
+def phq2_item_score(question_id, value):
+    """Score of one PHQ-2 answer (0 if unanswered); ValueError if it is not 0-3"""
+    if value in ['NA', None, '']:
+        return 0
+    try:
+        score = int(value)
+    except (TypeError, ValueError):
+        score = None
+    if score is None or not 0 <= score <= PHQ2_MAX_ITEM_SCORE:
+        raise ValueError(f'{question_id} answer {value!r} is not a score from 0 to {PHQ2_MAX_ITEM_SCORE}')
+    return score
+
+
+def check_phq2_answers(responses):
+    """Error message for PHQ-2 answers the scorers reject, or None"""
+    for question_id in ['PHQ2_Q1', 'PHQ2_Q2']:
+        try:
+            phq2_item_score(question_id, responses.get(question_id))
+        except ValueError as e:
+            return str(e)
+    return None
+
+
+def calculate_risk(responses):
+    """Calculate risk classification based on responses"""
+
+    # Component 1: PHQ-2 Score
+    phq2_q1 = phq2_item_score('PHQ2_Q1', responses.get('PHQ2_Q1'))
+    phq2_q2 = phq2_item_score('PHQ2_Q2', responses.get('PHQ2_Q2'))
+    phq2_total = phq2_q1 + phq2_q2
+
+    # Component 2: High-Risk Flags
+    flag_prior_mh = responses.get('BPG_MH') == '2'
+    flag_mh_meds = (responses.get('PRE_RX') == '2' and
+                    responses.get('PRE_RX_MH') in ['Yes', 'Not sure'])
+    flag_poor_health = responses.get('HTH_GEN') in ['4', '5']
+
+    # Component 3: Lifestyle Risk Score
+    lifestyle_risk = 0
+    if responses.get('PRE_EXER') == '1':  # No exercise
+        lifestyle_risk += 1
+    if responses.get('PRE_DIET') == '2':  # Dieting
+        lifestyle_risk += 1
+    if responses.get('OWGT_OBS') == '2':  # Overweight/obese
+        lifestyle_risk += 1
+
+    return classify(phq2_total, flag_prior_mh, flag_mh_meds, flag_poor_health, lifestyle_risk)
+
+
+def classify(phq2_total, flag_prior_mh, flag_mh_meds, flag_poor_health, lifestyle_risk):
+    """Apply the classification rules to already computed component scores"""
+
+    high_risk_flags = sum([flag_prior_mh, flag_mh_meds, flag_poor_health])
+
+    # Apply Classification Rules
+    classification = 'LOW_RISK'
+    reason = 'No high-risk criteria met'
+    rule_triggered = None
+
+    # Rule 1: Positive PHQ-2 (≥3)
+    if phq2_total >= 3:
+        classification = 'HIGH_RISK'
+        reason = f'Your depression screening score ({phq2_total}/6) suggests you may be experiencing symptoms of depression'
+        rule_triggered = 'RULE_1_POSITIVE_PHQ2'
+
+    # Rule 2: Any High-Risk Flag
+    elif high_risk_flags >= 1:
+        classification = 'HIGH_RISK'
+        flag_reasons = []
+        if flag_prior_mh:
+            flag_reasons.append('prior mental health treatment')
+        if flag_mh_meds:
+            flag_reasons.append('medications for mood/anxiety')
+        if flag_poor_health:
+            flag_reasons.append('fair or poor general health')
+
+        reason = f"You reported {', '.join(flag_reasons)} which are important risk factors for perinatal depression"
+        rule_triggered = 'RULE_2_HIGH_RISK_FLAG'
+
+    # Rule 3: Borderline symptoms + Multiple lifestyle risks
+    elif phq2_total == 2 and lifestyle_risk >= 2:
+        classification = 'HIGH_RISK'
+        reason = f'Combination of borderline depression symptoms (PHQ-2 score: 2) and {lifestyle_risk} lifestyle risk factors'
+        rule_triggered = 'RULE_3_BORDERLINE_LIFESTYLE'
+
+    return {
+        'classification': classification,
+        'reason': reason,
+        'rule_triggered': rule_triggered,
+        'phq2_total': phq2_total,
+        'high_risk_flags': high_risk_flags,
+        'lifestyle_risk': lifestyle_risk,
+        'flags': {
+            'prior_mh': flag_prior_mh,
+            'mh_meds': flag_mh_meds,
+            'poor_health': flag_poor_health
+        }
+    }
+
+
+def determine_routing(bpg_talk, flu_src):
+    """Determine care routing based on responses"""
+
+    existing_provider = bpg_talk == '2'
+
+    care_settings = {
+        '1': {
+            'name': 'OB/Gyn office',
+            'referral': 'Contact an OB/Gyn office that has integrated behavioral health services. Many OB/Gyn practices now offer mental health screening and support as part of routine prenatal care.'
+        },
+        '2': {
+            'name': 'Family doctor / Primary care physician',
+            'referral': 'Your family doctor can treat perinatal depression or refer you to specialists. Primary care physicians often have behavioral health consultants in their practice.'
+        },
+        '3': {
+            'name': 'Community health clinic',
+            'referral': 'Community health clinics often provide integrated mental health and prenatal care services, often on a sliding scale based on income. Federally Qualified Health Centers (FQHCs) serve all patients regardless of insurance.'
+        },
+        '4': {
+            'name': 'Hospital',
+            'referral': 'Hospital systems often have specialized perinatal psychiatry programs. Contact the hospital\'s maternal mental health program or OB/Gyn behavioral health services.'
+        },
+        '5': {
+            'name': 'Pharmacy',
+            'referral': 'For mental health support during pregnancy, we recommend telehealth services with perinatal specialists. Platforms like Talkspace, BetterHelp, and Maven Clinic offer same-day appointments.'
+        },
+        '6': {
+            'name': 'Work or school clinic',
+            'referral': 'Check your Employee Assistance Program (EAP) for free therapy sessions (typically 3-8 sessions). If you\'re a student, your campus health services likely offer free or low-cost counseling.'
+        },
+        '7': {
+            'name': 'Other',
+            'referral': 'We recommend telehealth mental health services for quick access to perinatal specialists. Many platforms offer same-day video appointments.'
+        }
+    }
+
+    setting = care_settings.get(flu_src, {
+        'name': 'No regular provider',
+        'referral': 'We recommend connecting with telehealth mental health services or visiting a community health clinic. Many resources are available regardless of insurance status.'
+    })
+
+    return {
+        'existing_provider': existing_provider,
+        'setting_name': setting['name'],
+        'referral_text': setting['referral']
+    }
+
+
+# ============================================================================
+# COMPILED RULES
+# ============================================================================
+#
+# compile_rules() turns the scoring metadata in questions_config.json (each
+# question's risk_scoring trigger, conditional display rules and the
+# classification_rules) into lookup tables once at startup.
+#
+# Every scoring answer maps to an offset into a flat decision table indexed by
+# (PHQ-2 total, flag bits, lifestyle points). The components are additive, so
+# scoring a submission is one dict lookup per question and one list index;
+# the full result for every index is computed up front.
+
+COMPONENT_NAMES = ['PHQ2_Total', 'High_Risk_Flags', 'Lifestyle_Risk']
+
+# Answers calculate_risk treats as an unanswered PHQ-2 item
+UNANSWERED = [None, 'NA', '']
+
+# Output names and reasons of the configured HIGH_RISK rules
+RULE_OUTPUTS = {
+    'RULE_1': (
+        'RULE_1_POSITIVE_PHQ2',
+        lambda phq2_total, flag_labels, lifestyle_risk:
+            f'Your depression screening score ({phq2_total}/6) suggests you may be experiencing symptoms of depression'
+    ),
+    'RULE_2': (
+        'RULE_2_HIGH_RISK_FLAG',
+        lambda phq2_total, flag_labels, lifestyle_risk:
+            f"You reported {', '.join(flag_labels)} which are important risk factors for perinatal depression"
+    ),
+    'RULE_3': (
+        'RULE_3_BORDERLINE_LIFESTYLE',
+        lambda phq2_total, flag_labels, lifestyle_risk:
+            f'Combination of borderline depression symptoms (PHQ-2 score: 2) and {lifestyle_risk} lifestyle risk factors'
+    )
+}
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '>=': lambda a, b: a >= b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '<': lambda a, b: a < b,
+    'in': lambda a, b: a in b
+}
+
+_CONDITION = re.compile(r'^\s*(\w+)\s*(==|!=|>=|<=|>|<|in)\s*(.+?)\s*$')
+
+
+def _parse_condition(condition, names):
+    """Parse 'A >= 1 AND B == 2' into a predicate over a dict of names"""
+    clauses = []
+    for clause in re.split(r'\s+AND\s+', condition.strip()):
+        match = _CONDITION.match(clause)
+        if match is None or match.group(1) not in names:
+            raise ValueError(f'Unsupported scoring condition: {condition!r}')
+        name, operator, literal = match.groups()
+        try:
+            operand = ast.literal_eval(literal)
+        except (ValueError, SyntaxError):
+            raise ValueError(f'Unsupported scoring condition: {condition!r}') from None
+        clauses.append((name, _OPERATORS[operator], operand))
+
+    return lambda values: all(test(values[name], operand) for name, test, operand in clauses)
+
+
+def _answer_key(value):
+    """Submitted answers arrive as strings; option values in the config are ints or strings"""
+    return value if isinstance(value, str) else str(value)
+
+
+def _options(question):
+    return [option['value'] for option in question['response_options'] if option['value'] is not None]
+
+
+class CompiledRules:
+    """Risk scorer compiled from questions_config.json; call it like calculate_risk"""
+
+    def __init__(self, config):
+        questions = [question for section in config['sections'] for question in section['questions']]
+        by_id = {question['question_id']: question for question in questions}
+
+        flag_specs = config['scoring_components']['High_Risk_Flags']['flags']
+        self.flag_names = [spec['flag_name'] for spec in flag_specs]
+        self.flag_keys = [name[len('FLAG_'):].lower() for name in self.flag_names]
+        self.flag_labels = [spec['description'].lower() for spec in flag_specs]
+
+        phq2_questions = [q for q in questions if (q.get('risk_scoring') or {}).get('component') == 'PHQ2_Total']
+        lifestyle_questions = [q for q in questions if (q.get('risk_scoring') or {}).get('component') == 'Lifestyle_Risk']
+        self.max_phq2 = sum(q['risk_scoring']['max_score'] for q in phq2_questions)
+        self.max_lifestyle = sum(q['risk_scoring']['points_if_true'] for q in lifestyle_questions)
+
+        # Mixed-radix index: lifestyle + (max_lifestyle + 1) * (flag_bits + 2^flags * phq2)
+        lifestyle_stride = 1
+        flag_stride = self.max_lifestyle + 1
+        phq2_stride = flag_stride << len(self.flag_names)
+
+        # PHQ-2 items: an answer outside the table falls back to calculate_risk,
+        # which raises ValueError for anything but a 0-3 score
+        self.phq2_tables = []
+        for question in phq2_questions:
+            table = {_answer_key(option['value']): option['score'] * phq2_stride
+                     for option in question['response_options'] if option['value'] is not None}
+            table.update({answer: 0 for answer in UNANSWERED})
+            self.phq2_tables.append((question['question_id'], table))
+
+        # Flag and lifestyle triggers: an answer outside the table contributes nothing.
+        # Conditional questions only count while their display condition holds.
+        self.answer_tables = []
+        self.conditional_tables = []
+        for question in questions:
+            scoring = question.get('risk_scoring') or {}
+            if scoring.get('component') == 'High_Risk_Flags':
+                offset = (1 << self.flag_names.index(scoring['flag_name'])) * flag_stride
+            elif scoring.get('component') == 'Lifestyle_Risk':
+                offset = scoring['points_if_true'] * lifestyle_stride
+            else:
+                continue
+
+            trigger = _parse_condition(scoring['trigger_condition'], ['value'])
+            table = {_answer_key(value): offset for value in _options(question) if trigger({'value': value})}
+
+            display = question.get('display_condition')
+            if display:
+                depends_on = display['depends_on']
+                if depends_on not in by_id:
+                    raise ValueError(f"{question['question_id']} depends on unknown question {depends_on}")
+                self.conditional_tables.append(
+                    (depends_on, _answer_key(display['show_if_value']), question['question_id'], table))
+            else:
+                self.answer_tables.append((question['question_id'], table))
+
+        # Classification rules in priority order; the first match wins
+        high_risk = config['classification_rules']['HIGH_RISK']['rules']
+        self.rules = [
+            (rule['rule_id'], _parse_condition(rule['condition'], COMPONENT_NAMES))
+            for rule in sorted(high_risk, key=lambda rule: rule['priority'])
+        ]
+        unknown = [rule_id for rule_id, _ in self.rules if rule_id not in RULE_OUTPUTS]
+        if unknown:
+            raise ValueError(f'No output defined for classification rules {unknown}')
+
+        self.decisions = [None] * (phq2_stride * (self.max_phq2 + 1))
+        for phq2_total in range(self.max_phq2 + 1):
+            for flag_bits in range(1 << len(self.flag_names)):
+                for lifestyle_risk in range(self.max_lifestyle + 1):
+                    index = phq2_total * phq2_stride + flag_bits * flag_stride + lifestyle_risk
+                    self.decisions[index] = self._decide(phq2_total, flag_bits, lifestyle_risk)
+
+        self._score = self._generate_scorer()
+
+    def _decide(self, phq2_total, flag_bits, lifestyle_risk):
+        flags = [bool(flag_bits >> bit & 1) for bit in range(len(self.flag_names))]
+        components = {
+            'PHQ2_Total': phq2_total,
+            'High_Risk_Flags': sum(flags),
+            'Lifestyle_Risk': lifestyle_risk
+        }
+
+        classification = 'LOW_RISK'
+        reason = 'No high-risk criteria met'
+        rule_triggered = None
+        for rule_id, matches in self.rules:
+            if matches(components):
+                rule_triggered, build_reason = RULE_OUTPUTS[rule_id]
+                labels = [label for label, flag in zip(self.flag_labels, flags) if flag]
+                classification = 'HIGH_RISK'
+                reason = build_reason(phq2_total, labels, lifestyle_risk)
+                break
+
+        return {
+            'classification': classification,
+            'reason': reason,
+            'rule_triggered': rule_triggered,
+            'phq2_total': phq2_total,
+            'high_risk_flags': components['High_Risk_Flags'],
+            'lifestyle_risk': lifestyle_risk,
+            'flags': dict(zip(self.flag_keys, flags))
+        }
+
+    def _generate_scorer(self):
+        """Unroll the lookups into one generated function"""
+        namespace = {'decisions': self.decisions, 'fallback': calculate_risk}
+        lines = ['def score(responses):', '    get = responses.get']
+
+        phq2_terms = []
+        for n, (question_id, table) in enumerate(self.phq2_tables):
+            namespace[f'phq2_table_{n}'] = table
+            lines.append(f'    phq2_{n} = phq2_table_{n}.get(get({question_id!r}))')
+            phq2_terms.append(f'phq2_{n}')
+        if phq2_terms:
+            lines.append(f"    if {' or '.join(f'{term} is None' for term in phq2_terms)}:")
+            lines.append('        return fallback(responses)')
+
+        terms = list(phq2_terms)
+        for n, (question_id, table) in enumerate(self.answer_tables):
+            namespace[f'answer_{n}'] = table
+            terms.append(f'answer_{n}.get(get({question_id!r}), 0)')
+        lines.append(f"    index = {' + '.join(terms) or '0'}")
+
+        for n, (depends_on, show_if, question_id, table) in enumerate(self.conditional_tables):
+            namespace[f'conditional_{n}'] = table
+            lines.append(f'    if get({depends_on!r}) == {show_if!r}:')
+            lines.append(f'        index += conditional_{n}.get(get({question_id!r}), 0)')
+
+        lines.append('    result = decisions[index]')
+        lines.append("    return {**result, 'flags': {**result['flags']}}")
+
+        self.source = '\n'.join(lines) + '\n'
+        exec(compile(self.source, '<compiled scoring rules>', 'exec'), namespace)
+        return namespace['score']
+
+    def __call__(self, responses):
+        return self._score(responses)
+
+
+def compile_rules(config):
+    """Compile the scoring metadata of a questions config into a CompiledRules scorer"""
+    return CompiledRules(config)
+
+
+# ============================================================================
+# BATCH SCORING
+# ============================================================================
+#
+# Each input column holds one unsigned byte per row. Questions coded '1', '2',
+# ... use the number itself (0 = missing or anything calculate_risk would not
+# match), PRE_RX_MH uses PRE_RX_MH_CODES, and PHQ-2 items hold the item score.
+#
+# Masks are built with bytes.translate() and combined as whole-column integers:
+# a column of n bytes read with int.from_bytes() is n 8-bit lanes, so adding or
+# AND-ing two columns works lane by lane as long as no lane exceeds 255 (the
+# largest sum here is 6). Every step runs in C over the whole column.
+
+SCORING_COLUMNS = [
+    'PHQ2_Q1', 'PHQ2_Q2', 'BPG_MH', 'PRE_RX', 'PRE_RX_MH',
+    'HTH_GEN', 'PRE_EXER', 'PRE_DIET', 'OWGT_OBS'
+]
+
+PHQ2_COLUMNS = ['PHQ2_Q1', 'PHQ2_Q2']
+
+PRE_RX_MH_CODES = {'Yes': 1, 'No': 2, 'Not sure': 3}
+
+CLASSIFICATION_CODES = ['LOW_RISK', 'HIGH_RISK']
+
+RULE_IDS = [
+    None,
+    'RULE_1_POSITIVE_PHQ2',
+    'RULE_2_HIGH_RISK_FLAG',
+    'RULE_3_BORDERLINE_LIFESTYLE'
+]
+
+_ANSWER_CODES = {str(code): code for code in range(1, 256)}
+
+
+def _mask_table(test):
+    return bytes(1 if test(code) else 0 for code in range(256))
+
+
+_IS_1 = _mask_table(lambda code: code == 1)
+_IS_2 = _mask_table(lambda code: code == 2)
+_IS_YES_OR_NOT_SURE = _mask_table(lambda code: code in (1, 3))
+_IS_POOR_HEALTH = _mask_table(lambda code: code in (4, 5))
+_IS_GE_1 = _mask_table(lambda code: code >= 1)
+_IS_GE_2 = _mask_table(lambda code: code >= 2)
+_IS_GE_3 = _mask_table(lambda code: code >= 3)
+
+# Rule lane: bit 0 = rule 1 matched, bit 1 = any flag, bit 2 = borderline + lifestyle
+_RULE_TABLE = bytes(
+    1 if bits & 1 else 2 if bits & 2 else 3 if bits & 4 else 0
+    for bits in range(256)
+)
+_CLASSIFICATION_TABLE = _mask_table(lambda rule: rule != 0)
+
+
+def encode_answer(question_id, value):
+    """Return the one-byte batch code of a stored (string) answer"""
+    if question_id in PHQ2_COLUMNS:
+        return phq2_item_score(question_id, value)
+    if question_id == 'PRE_RX_MH':
+        return PRE_RX_MH_CODES.get(value, 0)
+    return _ANSWER_CODES.get(value, 0)
+
+
+def encode_responses(responses_list):
+    """Convert a list of response dicts into batch scoring columns"""
+    return {
+        question_id: bytes(encode_answer(question_id, responses.get(question_id))
+                           for responses in responses_list)
+        for question_id in SCORING_COLUMNS
+    }
+
+
+def _as_bytes(column, row_count):
+    if column is None:
+        return bytes(row_count)
+    if hasattr(column, 'astype'):  # NumPy array of any integer dtype
+        column = column.astype('uint8')
+    data = bytes(column)
+    if len(data) != row_count:
+        raise ValueError(f'Column has {len(data)} rows, expected {row_count}')
+    return data
+
+
+class BatchScores:
+    """Per-row scoring results as byte columns (one byte per row)"""
+
+    def __init__(self, classification, rule, phq2_total, high_risk_flags,
+                 lifestyle_risk, prior_mh, mh_meds, poor_health):
+        self.classification = classification
+        self.rule = rule
+        self.phq2_total = phq2_total
+        self.high_risk_flags = high_risk_flags
+        self.lifestyle_risk = lifestyle_risk
+        self.prior_mh = prior_mh
+        self.mh_meds = mh_meds
+        self.poor_health = poor_health
+
+    def __len__(self):
+        return len(self.classification)
+
+    def risk_result(self, row):
+        """Expand one row into the dict calculate_risk returns"""
+        return classify(self.phq2_total[row], bool(self.prior_mh[row]), bool(self.mh_meds[row]),
+                        bool(self.poor_health[row]), self.lifestyle_risk[row])
+
+    def risk_results(self):
+        return [self.risk_result(row) for row in range(len(self))]
+
+
+def score_batch(columns):
+    """Score whole columns at once
+
+    columns maps question ids to byte columns: bytes, bytearray, array('B'),
+    memoryview, a list of ints or a NumPy integer array. Missing columns count
+    as unanswered. Returns BatchScores.
+    """
+    lengths = {len(column) for column in columns.values() if column is not None}
+    if len(lengths) > 1:
+        raise ValueError('All columns must have the same number of rows')
+    row_count = lengths.pop() if lengths else 0
+
+    cols = {name: _as_bytes(columns.get(name), row_count) for name in SCORING_COLUMNS}
+
+    def lanes(data):
+        return int.from_bytes(data, 'little')
+
+    def column(value):
+        return value.to_bytes(row_count, 'little')
+
+    # Component 1: PHQ-2 Score
+    phq2_total = column(lanes(cols['PHQ2_Q1']) + lanes(cols['PHQ2_Q2']))
+
+    # Component 2: High-Risk Flags
+    prior_mh = cols['BPG_MH'].translate(_IS_2)
+    mh_meds = column(lanes(cols['PRE_RX'].translate(_IS_2)) &
+                     lanes(cols['PRE_RX_MH'].translate(_IS_YES_OR_NOT_SURE)))
+    poor_health = cols['HTH_GEN'].translate(_IS_POOR_HEALTH)
+    high_risk_flags = column(lanes(prior_mh) + lanes(mh_meds) + lanes(poor_health))
+
+    # Component 3: Lifestyle Risk Score
+    lifestyle_risk = column(lanes(cols['PRE_EXER'].translate(_IS_1)) +
+                            lanes(cols['PRE_DIET'].translate(_IS_2)) +
+                            lanes(cols['OWGT_OBS'].translate(_IS_2)))
+
+    # Classification rules, first match wins
+    rule_1 = lanes(phq2_total.translate(_IS_GE_3))
+    any_flag = lanes(high_risk_flags.translate(_IS_GE_1))
+    borderline = (lanes(phq2_total.translate(_IS_2)) &
+                  lanes(lifestyle_risk.translate(_IS_GE_2)))
+    rule = column(rule_1 | (any_flag << 1) | (borderline << 2)).translate(_RULE_TABLE)
+
+    return BatchScores(
+        classification=rule.translate(_CLASSIFICATION_TABLE),
+        rule=rule,
+        phq2_total=phq2_total,
+        high_risk_flags=high_risk_flags,
+        lifestyle_risk=lifestyle_risk,
+        prior_mh=prior_mh,
+        mh_meds=mh_meds,
+        poor_health=poor_health
+    )
+
+
+def score_responses(responses_list):
+    """Score a list of response dicts; same results as calculate_risk on each"""
+    return score_batch(encode_responses(responses_list)).risk_results()
@@ -0,0 +1,213 @@
+"""
+Server-side sessions
+
+The session cookie carries only a random id; the session dict lives in a
+backend (the SQLite database or an in-process LRU with TTL). Large values
+that only one page needs, like the last screening result, are stored under
+their own key with session.store_value() and read with session.load_value(),
+so ordinary requests never load them.
+"""
+
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from database import (
+    delete_session_records, get_session_record, purge_expired_sessions, save_session_record
+)
+
+SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+#
+# A backend stores serialized strings under keys with an absolute expiry time.
+# delete(sid) removes a session and every value stored for it ("<sid>:<name>").
+
+class MemorySessionBackend:
+    """LRU of at most max_entries keys, per process"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            record = self._entries.get(key)
+            if record is None:
+                return None
+            if record[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return record
+
+    def set(self, key, data, expires_at):
+        with self._lock:
+            self._entries[key] = (data, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        prefix = f'{sid}:'
+        with self._lock:
+            for key in [key for key in self._entries if key == sid or key.startswith(prefix)]:
+                del self._entries[key]
+
+
+class SQLiteSessionBackend:
+    """Sessions table in the application database, shared by all worker processes"""
+
+    def __init__(self, purge_every=500):
+        self.purge_every = purge_every
+        self._writes = 0
+
+    def get(self, key):
+        record = get_session_record(key)
+        if record is None or record[1] <= time.time():
+            return None
+        return record
+
+    def set(self, key, data, expires_at):
+        save_session_record(key, data, expires_at)
+        # Expired rows are otherwise only ever skipped, so drop them now and then
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            purge_expired_sessions(time.time())
+
+    def delete(self, sid):
+        delete_session_records(sid)
+
+
+# ============================================================================
+# SESSION INTERFACE
+# ============================================================================
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict backed by a server-side store"""
+
+    def __init__(self, interface, sid, initial=None, expires_at=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.interface = interface
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = new
+        self.cleared = False
+        self.regenerated = False
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def clear(self):
+        # Values stored for the old id go too, and the session gets a fresh id on save
+        self.cleared = True
+        super().clear()
+
+    def regenerate(self):
+        """
+        Move the session to a fresh id on save, e.g. at login, so an id planted
+        before it never becomes an authenticated session. Values stored for the
+        old id are dropped with it.
+        """
+        self.regenerated = True
+        self.modified = True
+
+    def store_value(self, name, value):
+        """Store a value outside the session dict; it is only loaded on request"""
+        self.interface.backend.set(f'{self.sid}:{name}', self.interface.serializer.dumps(value),
+                                   time.time() + self.interface.ttl)
+
+    def load_value(self, name, default=None):
+        record = self.interface.backend.get(f'{self.sid}:{name}')
+        if record is None:
+            return default
+        return self.interface.serializer.loads(record[0])
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface that keeps only the session id in the cookie"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, backend, ttl=86400):
+        self.backend = backend
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SESSION_ID.match(sid):
+            record = self.backend.get(sid)
+            if record is not None:
+                data, expires_at = record
+                return ServerSideSession(self, sid, self.serializer.loads(data), expires_at)
+        return ServerSideSession(self, secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.cleared or session.regenerated:
+            if not session.new:
+                self.backend.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.new = True
+
+        if not session:
+            if session.modified:
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        # Write when changed, or when an idle session is past half its lifetime
+        now = time.time()
+        if not (session.modified or session.new or session.expires_at - now < self.ttl / 2):
+            return
+
+        self.backend.set(session.sid, self.serializer.dumps(dict(session)), now + self.ttl)
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            domain=domain, path=path, secure=secure, samesite=samesite,
+                            httponly=httponly)
+
+
+def make_session_interface(config):
+    """Build the session interface selected by SESSION_BACKEND ('sqlite' or 'memory')"""
+    backend_name = config['SESSION_BACKEND']
+    if backend_name == 'sqlite':
+        backend = SQLiteSessionBackend()
+    elif backend_name == 'memory':
+        backend = MemorySessionBackend(config['SESSION_MEMORY_MAX_ENTRIES'])
+    else:
+        raise ValueError(f'Unknown SESSION_BACKEND {backend_name!r}')
+    return ServerSideSessionInterface(backend, ttl=config['SESSION_TTL_SECONDS'])
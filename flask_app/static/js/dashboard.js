@@ -5,10 +5,19 @@ document.addEventListener('DOMContentLoaded', function() {
     loadAnalytics();
 });
 
+// The page inlines the current analytics; fetch them only if it did not
+async function readAnalytics() {
+    const inline = document.getElementById('analyticsData');
+    if (inline && inline.textContent.trim()) {
+        return JSON.parse(inline.textContent);
+    }
+    const response = await fetch('/api/analytics');
+    return response.json();
+}
+
 async function loadAnalytics() {
     try {
-        const response = await fetch('/api/analytics');
-        const data = await response.json();
+        const data = await readAnalytics();
 
         if (data.total_responses === 0) {
             document.getElementById('noDataMessage').style.display = 'block';
@@ -26,6 +35,10 @@ async function loadAnalytics() {
         createRiskFactorsChart(data.risk_factors, data.total_responses);
         createCareSettingsChart(data.care_settings);
 
+        const granularity = document.getElementById('trendGranularity');
+        granularity.addEventListener('change', () => loadTrend(granularity.value));
+        loadTrend(granularity.value);
+
     } catch (error) {
         console.error('Error loading analytics:', error);
         alert('Failed to load analytics data.');
@@ -89,6 +102,97 @@ function createRiskDistributionChart(riskDist, total) {
     });
 }
 
+let trendChart = null;
+
+async function loadTrend(granularity) {
+    try {
+        const response = await fetch(`/api/analytics/trend?granularity=${granularity}`);
+        const data = await response.json();
+        createTrendChart(data.points);
+    } catch (error) {
+        console.error('Error loading trend:', error);
+    }
+}
+
+function createTrendChart(points) {
+    const ctx = document.getElementById('trendChart').getContext('2d');
+
+    // Replace the previous chart when the granularity changes
+    if (trendChart) {
+        trendChart.destroy();
+    }
+
+    trendChart = new Chart(ctx, {
+        type: 'line',
+        data: {
+            labels: points.map(p => p.period),
+            datasets: [
+                {
+                    label: 'High Risk Rate (%)',
+                    data: points.map(p => p.high_risk_rate === null ? null : p.high_risk_rate * 100),
+                    borderColor: '#EF4444',
+                    backgroundColor: '#EF4444',
+                    yAxisID: 'rate',
+                    tension: 0.2
+                },
+                {
+                    label: 'PHQ-2 Mean',
+                    data: points.map(p => p.phq2_mean),
+                    borderColor: '#4F46E5',
+                    backgroundColor: '#4F46E5',
+                    yAxisID: 'phq2',
+                    tension: 0.2
+                }
+            ]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: true,
+            interaction: {
+                mode: 'index',
+                intersect: false
+            },
+            plugins: {
+                legend: {
+                    position: 'bottom'
+                },
+                tooltip: {
+                    callbacks: {
+                        footer: function(context) {
+                            return `Responses: ${points[context[0].dataIndex].total}`;
+                        }
+                    }
+                }
+            },
+            scales: {
+                rate: {
+                    type: 'linear',
+                    position: 'left',
+                    beginAtZero: true,
+                    max: 100,
+                    title: {
+                        display: true,
+                        text: 'High Risk Rate (%)'
+                    }
+                },
+                phq2: {
+                    type: 'linear',
+                    position: 'right',
+                    beginAtZero: true,
+                    max: 6,
+                    grid: {
+                        drawOnChartArea: false
+                    },
+                    title: {
+                        display: true,
+                        text: 'PHQ-2 Mean'
+                    }
+                }
+            }
+        }
+    });
+}
+
 function createPHQ2DistributionChart(phq2Dist) {
     const ctx = document.getElementById('phq2DistributionChart').getContext('2d');
 
@@ -0,0 +1,170 @@
+// Offline support for the screening
+// Registers the service worker, keeps the in-progress answers on this device
+// and queues completed screenings until they can be sent to /api/submit/batch.
+
+const SYNC_BATCH_SIZE = 20;
+
+// Queued screenings are retried this often while any are left
+const SYNC_RETRY_MS = 60 * 1000;
+
+// Drafts and queued screenings belong to the logged-in user ('' when logged out)
+const offlineUserId = document.body.dataset.userId || '';
+
+// Syncs run one after another, so a screening queued during one is sent by the next
+let syncChain = Promise.resolve();
+
+// The screening completed on this page, which the results page should show
+let resultClientId = null;
+
+function offlineKey(name) {
+    return `screening-${name}:${offlineUserId}`;
+}
+
+function readStored(name, fallback) {
+    try {
+        const value = JSON.parse(localStorage.getItem(offlineKey(name)));
+        return value === null ? fallback : value;
+    } catch (error) {
+        return fallback;
+    }
+}
+
+function writeStored(name, value) {
+    try {
+        localStorage.setItem(offlineKey(name), JSON.stringify(value));
+    } catch (error) {
+        // Storage full or disabled; the screening still works online
+        console.error('Could not save to this device:', error);
+    }
+}
+
+// Draft of the screening in progress
+function loadDraft() {
+    return readStored('draft', null);
+}
+
+function saveDraft(responses, questionIndex) {
+    writeStored('draft', { responses: responses, questionIndex: questionIndex, savedAt: new Date().toISOString() });
+}
+
+function clearDraft() {
+    localStorage.removeItem(offlineKey('draft'));
+}
+
+// Drafts hold mental health answers, so logging out removes this user's draft
+// for the next person on a shared device. The unsent queue stays and is sent
+// after the user's next login.
+document.addEventListener('click', event => {
+    const link = event.target.closest && event.target.closest('a[href]');
+    const logoutUrl = document.body.dataset.logoutUrl;
+    if (link && logoutUrl && new URL(link.href, window.location.href).pathname === logoutUrl) {
+        clearDraft();
+    }
+});
+
+// Unique per screening, so the server stores a resent one only once
+function newClientId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    const bytes = crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, byte => byte.toString(16).padStart(2, '0')).join('');
+}
+
+// Queue of completed screenings not yet confirmed by the server
+function queuedSubmissions() {
+    return readStored('queue', []);
+}
+
+function queueSubmission(responses) {
+    const submission = {
+        client_id: newClientId(),
+        responses: responses,
+        completed_at: new Date().toISOString()
+    };
+    writeStored('queue', queuedSubmissions().concat([submission]));
+    resultClientId = submission.client_id;
+    return submission.client_id;
+}
+
+// Send queued screenings in batches, oldest first. Resolves to {status, results}:
+// results maps client_id to the server's result for each screening it answered;
+// status is 'sent' (queue empty), 'offline' (no connection), 'logged-out'
+// (session expired; sent after the next login) or 'error' (the server
+// rejected the request; retried later). Every sync ends with a
+// 'screenings-synced' event on window carrying the same object.
+function syncSubmissions() {
+    const sync = syncChain.then(sendQueued).then(outcome => {
+        window.dispatchEvent(new CustomEvent('screenings-synced', { detail: outcome }));
+        return outcome;
+    });
+    syncChain = sync.catch(() => {});
+    return sync;
+}
+
+async function sendQueued() {
+    const results = {};
+    if (!offlineUserId) {
+        return { status: 'logged-out', results: results };
+    }
+
+    let queue = queuedSubmissions();
+    while (queue.length > 0) {
+        const batch = queue.slice(0, SYNC_BATCH_SIZE);
+        let response;
+        try {
+            response = await fetch('/api/submit/batch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ submissions: batch, result_client_id: resultClientId })
+            });
+        } catch (error) {
+            return { status: 'offline', results: results };
+        }
+
+        // Redirected to the login page when the session has expired
+        if (response.redirected) {
+            return { status: 'logged-out', results: results };
+        }
+        let reply;
+        try {
+            reply = response.ok ? await response.json() : null;
+        } catch (error) {
+            reply = null;
+        }
+        if (!reply || !Array.isArray(reply.results) || reply.results.length === 0) {
+            return { status: 'error', results: results };
+        }
+
+        // Stored, already stored before, or never storable: done with all of them
+        const answered = new Set();
+        reply.results.forEach(result => {
+            results[result.client_id] = result;
+            answered.add(result.client_id);
+        });
+        // Re-read: the screening page may have queued another one meanwhile
+        queue = queuedSubmissions().filter(submission => !answered.has(submission.client_id));
+        writeStored('queue', queue);
+    }
+    return { status: 'sent', results: results };
+}
+
+if ('serviceWorker' in navigator && document.body.dataset.serviceWorker) {
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register(document.body.dataset.serviceWorker).catch(error => {
+            console.error('Service worker registration failed:', error);
+        });
+    });
+}
+
+// Send anything left over from earlier: on every page load, whenever the
+// connection returns, and on a timer for server errors that the 'online' event never follows
+function syncIfQueued() {
+    if (queuedSubmissions().length > 0) {
+        syncSubmissions();
+    }
+}
+
+document.addEventListener('DOMContentLoaded', syncIfQueued);
+window.addEventListener('online', syncIfQueued);
+setInterval(syncIfQueued, SYNC_RETRY_MS);
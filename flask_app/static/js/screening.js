@@ -1,13 +1,18 @@
 // Screening Questionnaire JavaScript
 // Handles multi-step form, conditional logic, and submission
+// Drafts and the submission queue live in offline.js
 
 let questions = [];
 let currentQuestionIndex = 0;
 let responses = {};
 
+// Completed screening waiting in the offline queue
+let pendingClientId = null;
+
 // Initialize when page loads
 document.addEventListener('DOMContentLoaded', async function() {
     await loadQuestions();
+    restoreDraft();
     renderQuestion();
     updateProgress();
     setupNavigation();
@@ -25,6 +30,21 @@ async function loadQuestions() {
     }
 }
 
+// Pick up where an earlier visit left off
+function restoreDraft() {
+    const draft = loadDraft();
+    if (!draft || questions.length === 0) return;
+
+    // Only answers to questions that still exist
+    const questionIds = new Set(questions.map(question => question.question_id));
+    Object.entries(draft.responses).forEach(([questionId, value]) => {
+        if (questionIds.has(questionId)) {
+            responses[questionId] = value;
+        }
+    });
+    currentQuestionIndex = Math.min(draft.questionIndex || 0, questions.length - 1);
+}
+
 // Render current question
 function renderQuestion() {
     const question = questions[currentQuestionIndex];
@@ -80,7 +100,7 @@ function renderQuestion() {
 // Save response
 function saveResponse(questionId, value) {
     responses[questionId] = value;
-    console.log('Response saved:', questionId, value);
+    saveDraft(responses, currentQuestionIndex);
 }
 
 // Update progress bar
@@ -116,6 +136,7 @@ function setupNavigation() {
 function goToPrevious() {
     if (currentQuestionIndex > 0) {
         currentQuestionIndex--;
+        saveDraft(responses, currentQuestionIndex);
         renderQuestion();
         updateProgress();
         window.scrollTo({ top: 0, behavior: 'smooth' });
@@ -134,6 +155,7 @@ function goToNext() {
 
     if (currentQuestionIndex < questions.length - 1) {
         currentQuestionIndex++;
+        saveDraft(responses, currentQuestionIndex);
         renderQuestion();
         updateProgress();
         window.scrollTo({ top: 0, behavior: 'smooth' });
@@ -156,27 +178,76 @@ async function handleSubmit(event) {
     const modal = document.getElementById('loadingModal');
     modal.classList.add('active');
 
-    try {
-        // Submit responses to backend
-        const response = await fetch('/api/submit', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ responses: responses })
-        });
+    // Queued before sending, so the answers survive a dropped connection
+    const clientId = queueSubmission(responses);
+    clearDraft();
 
-        const result = await response.json();
+    const outcome = await syncSubmissions();
+    const result = outcome.results[clientId];
+    modal.classList.remove('active');
 
-        if (result.success) {
-            // Redirect to results page
-            window.location.href = '/results';
-        } else {
-            throw new Error('Submission failed');
-        }
-    } catch (error) {
-        console.error('Error submitting responses:', error);
-        modal.classList.remove('active');
-        alert('Failed to submit your responses. Please try again.');
+    if (result && result.status !== 'invalid') {
+        // Redirect to results page
+        window.location.href = '/results';
+    } else if (result) {
+        alert('Failed to submit your responses: ' + result.error);
+    } else {
+        pendingClientId = clientId;
+        showQueuedMessage(outcome.status);
     }
 }
+
+// Not sent yet: the answers stay queued on this device and offline.js retries
+// them; leave for the results page once a retry gets through
+const QUEUED_MESSAGES = {
+    'offline': {
+        title: 'Your answers will be submitted when you are back online.',
+        detail: 'You can keep this page open or close it; the screening is sent the next time you open the app with a connection.'
+    },
+    'logged-out': {
+        title: 'Your session has expired.',
+        detail: 'Your answers are saved on this device. <a href="/login">Log in again</a> and they will be submitted.'
+    },
+    'error': {
+        title: 'Your answers could not be submitted just now.',
+        detail: 'They are saved on this device and will be retried automatically. <a href="#" id="retrySubmit">Try again now</a>'
+    }
+};
+
+function showQueuedMessage(status) {
+    const message = QUEUED_MESSAGES[status] || QUEUED_MESSAGES['error'];
+    document.querySelector('.form-navigation').style.display = 'none';
+    document.getElementById('questionsContainer').innerHTML = `
+        <div class="question-card active">
+            <div class="question-section">Saved on this device</div>
+            <div class="question-text">${message.title}</div>
+            <p>${message.detail}</p>
+        </div>
+    `;
+
+    const retry = document.getElementById('retrySubmit');
+    if (retry) {
+        retry.addEventListener('click', event => {
+            event.preventDefault();
+            syncSubmissions();
+        });
+    }
+}
+
+// Syncs from retries, the 'online' event or the retry button
+window.addEventListener('screenings-synced', event => {
+    if (!pendingClientId) return;
+
+    const result = event.detail.results[pendingClientId];
+    if (result && result.status !== 'invalid') {
+        window.location.href = '/results';
+    } else if (result) {
+        pendingClientId = null;
+        alert('Failed to submit your responses: ' + result.error);
+    } else if (!queuedSubmissions().some(submission => submission.client_id === pendingClientId)) {
+        // Sent from another tab
+        window.location.href = '/results';
+    } else {
+        showQueuedMessage(event.detail.status);
+    }
+});
@@ -0,0 +1,71 @@
+// Service worker for the offline screening client (rendered by /service-worker.js)
+// Caches the screening page, the questions and the assets they need, versioned
+// by the questions config and asset URLs, so the screening works without a connection.
+
+const CACHE_PREFIX = 'screening-';
+const CACHE = CACHE_PREFIX + {{ version|tojson }};
+const PRECACHE = {{ precache|tojson }};
+const PAGES = {{ pages|tojson }};
+const LOGOUT_URL = {{ logout_url|tojson }};
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(CACHE)
+            .then(cache => cache.addAll(PRECACHE))
+            .then(() => self.skipWaiting())
+    );
+});
+
+// Drop the caches of older versions
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys
+                .filter(key => key.startsWith(CACHE_PREFIX) && key !== CACHE)
+                .map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || url.origin !== self.location.origin) {
+        return;
+    }
+
+    if (url.pathname === LOGOUT_URL) {
+        // The cached pages show who was logged in
+        event.waitUntil(caches.open(CACHE).then(cache =>
+            Promise.all(PAGES.map(page => cache.delete(page)))));
+    } else if (url.pathname.startsWith('/assets/')) {
+        // Built assets have the content hash in their name and never change
+        event.respondWith(cacheFirst(request));
+    } else if (PRECACHE.includes(url.pathname) || PAGES.includes(url.pathname)) {
+        event.respondWith(networkFirst(request));
+    }
+});
+
+async function cacheFirst(request) {
+    const cached = await caches.match(request);
+    return cached || fetch(request);
+}
+
+// Fresh copy when online (and keep it), the cached one when not
+async function networkFirst(request) {
+    const cache = await caches.open(CACHE);
+    try {
+        const response = await fetch(request);
+        // A redirect means the session expired; don't replace the page with the login form
+        if (response.ok && !response.redirected) {
+            await cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request, { ignoreVary: true, ignoreSearch: true });
+        if (cached) {
+            return cached;
+        }
+        throw error;
+    }
+}
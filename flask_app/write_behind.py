@@ -0,0 +1,193 @@
+"""
+Write-behind persistence for screening submissions
+
+Submissions are appended to a spool file and put on a bounded in-process
+queue; a background thread writes them to the database in multi-row
+transactions once batch_size entries are waiting or flush_interval seconds
+have passed. Response ids are reserved up front, so callers get the final id
+immediately. If the process dies before a batch is committed, the spool is
+replayed on the next start; inserts skip ids that already exist, so replaying
+is safe.
+"""
+
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from database import reserve_response_ids, save_screening_responses
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindQueue:
+    """Bounded queue of submissions flushed to the database by a background thread"""
+
+    def __init__(self, spool_dir, max_queue=10000, batch_size=100,
+                 flush_interval=0.5, id_block=100, fsync=False):
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.id_block = id_block
+        self.fsync = fsync
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spool_lock = threading.Lock()
+        self._id_lock = threading.Lock()
+        self._ids = iter(())
+        self._spool = None
+        self._spool_path = None
+        # Synchronous saves (queue full) whose entries are spooled but not yet committed
+        self._sync_saves = 0
+        self._thread = None
+        self._stopping = threading.Event()
+        self.flushed = 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Replay spools left by dead processes and start the writer thread"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.replay_orphaned_spools()
+
+        self._spool_path = os.path.join(self.spool_dir, f'writebehind-{os.getpid()}.jsonl')
+        self._spool = open(self._spool_path, 'a', encoding='utf-8')
+
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Flush everything still queued and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self._spool.close()
+        if os.path.exists(self._spool_path) and os.path.getsize(self._spool_path) == 0:
+            os.remove(self._spool_path)
+
+    def replay_orphaned_spools(self):
+        """Insert entries from spool files whose process is gone; returns rows inserted"""
+        inserted = 0
+        for path in glob.glob(os.path.join(self.spool_dir, 'writebehind-*.jsonl')):
+            pid = int(os.path.basename(path)[len('writebehind-'):-len('.jsonl')])
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+
+            entries = []
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break  # torn final write
+
+            for start in range(0, len(entries), self.batch_size):
+                inserted += save_screening_responses(entries[start:start + self.batch_size])
+            os.remove(path)
+        return inserted
+
+    # ------------------------------------------------------------------
+    # Producers
+    # ------------------------------------------------------------------
+
+    def _next_id(self):
+        with self._id_lock:
+            response_id = next(self._ids, None)
+            if response_id is None:
+                self._ids = iter(reserve_response_ids(self.id_block))
+                response_id = next(self._ids)
+            return response_id
+
+    def submit(self, user_id, responses, risk_result, routing):
+        """Queue a response for writing and return its (already final) id"""
+        entry = {
+            'id': self._next_id(),
+            'user_id': user_id,
+            'responses': responses,
+            'risk_result': risk_result,
+            'routing': routing,
+            'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+        with self._spool_lock:
+            self._spool.write(json.dumps(entry) + '\n')
+            self._spool.flush()
+            if self.fsync:
+                os.fsync(self._spool.fileno())
+            try:
+                self._queue.put_nowait(entry)
+                return entry['id']
+            except queue.Full:
+                self._sync_saves += 1
+
+        # Queue is full: apply back-pressure by writing this one synchronously.
+        # The spool is not truncated while this is in flight.
+        try:
+            save_screening_responses([entry])
+        finally:
+            with self._spool_lock:
+                self._sync_saves -= 1
+        return entry['id']
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+
+    def _take_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._flush(batch)
+            elif self._stopping.is_set() and self._queue.empty():
+                break
+
+    def _flush(self, batch):
+        while True:
+            try:
+                save_screening_responses(batch)
+                break
+            except Exception:
+                # Keep the batch (it is still in the spool) and retry
+                if self._stopping.is_set():
+                    raise
+                time.sleep(self.flush_interval)
+
+        self.flushed += len(batch)
+        with self._spool_lock:
+            # Single writer, and entries are spooled and then queued or counted as
+            # a synchronous save under this lock, so an empty queue with no
+            # synchronous save in flight means every spooled entry is committed
+            if self._queue.empty() and self._sync_saves == 0:
+                self._spool.seek(0)
+                self._spool.truncate()
@@ -0,0 +1,14 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing this module builds the app, creates or migrates the schema and
+loads the read-only data every request uses. gunicorn.conf.py preloads it in
+the master, so all of this happens once, before the workers are forked.
+"""
+
+from app import create_app, preload_shared_state
+
+app = create_app()
+preload_shared_state(app)